@@ -0,0 +1,159 @@
+import time
+
+COUNTERMEASURES = ['no', 'cd', 'ffp', 'ras', 'brave', 'uas', 'cfpb', 'fpr']
+
+# only for these countermeasures since other don't alter nor the OS or the browser
+GUESS_COUNTERMEASURES = ['ffp', 'ras', 'uas']
+
+DETECTORS = ['FPScanner', 'FPJS2', 'Augur']
+
+
+def is_same_os(real_os, predicted_os):
+    """
+        Dont test for pure equality since predicting Linux for ubuntu or fedora
+        is not wrong, same for windows when the exact version is predicted
+    """
+    if real_os == predicted_os:
+        return True
+    elif 'Win' in real_os and 'Win' in predicted_os:
+        return True
+    return (real_os in ['Ubuntu', 'Fedora'] and predicted_os == 'Linux') or \
+           (predicted_os in ['Ubuntu', 'Fedora'] and real_os == 'Linux')
+
+
+class ConfusionMatrix:
+    """
+        Confusion matrix of a detector, an inconsistent fingerprint
+        is a positive
+    """
+
+    def __init__(self):
+        self.true_positives = 0
+        self.false_positives = 0
+        self.true_negatives = 0
+        self.false_negatives = 0
+
+    def add(self, ground_truth, predicted):
+        """
+            ground_truth and predicted are True when the fingerprint is consistent
+        """
+        if predicted:
+            if ground_truth:
+                self.true_negatives += 1
+            else:
+                self.false_negatives += 1
+        else:
+            if ground_truth:
+                self.false_positives += 1
+            else:
+                self.true_positives += 1
+
+    def total(self):
+        return self.true_positives + self.false_positives + self.true_negatives + self.false_negatives
+
+    def accuracy(self):
+        total = self.total()
+        if total == 0:
+            return float('nan')
+        return (self.true_positives + self.true_negatives) / total
+
+    def __str__(self):
+        return "TP={:d} FP={:d} TN={:d} FN={:d}".format(self.true_positives, self.false_positives,
+                                                        self.true_negatives, self.false_negatives)
+
+
+class GuessCounts:
+    def __init__(self):
+        self.nb_fingerprints = 0
+        self.nb_rights_os = 0
+        self.nb_rights_browser = 0
+
+    def add(self, real_os, real_browser, predicted_os, predicted_browser):
+        self.nb_fingerprints += 1
+        if is_same_os(real_os, predicted_os):
+            self.nb_rights_os += 1
+        if real_browser == predicted_browser:
+            self.nb_rights_browser += 1
+
+    def accuracy_os(self):
+        return self.nb_rights_os / self.nb_fingerprints if self.nb_fingerprints else float('nan')
+
+    def accuracy_browser(self):
+        return self.nb_rights_browser / self.nb_fingerprints if self.nb_fingerprints else float('nan')
+
+
+class OnlineAccuracy:
+    """
+        Accuracy of FP-Scanner, FingerprintJS2 and Augur per countermeasure,
+        and accuracy of the OS and browser guessed by FP-Scanner, updated
+        fingerprint by fingerprint while scanning instead of being computed
+        from the result files once the scan is over
+    """
+
+    def __init__(self, snapshot_interval=None):
+        self.confusion_matrices = dict()
+        self.guesses = dict()
+        # seconds between two snapshots printed by maybe_print_snapshot,
+        # None to never print them
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = time.time()
+
+    def add_detection(self, countermeasure, ground_truth, fpscanner_prediction, fpjs2_prediction, augur_prediction):
+        if countermeasure not in self.confusion_matrices:
+            self.confusion_matrices[countermeasure] = {detector: ConfusionMatrix() for detector in DETECTORS}
+        confusion_matrices = self.confusion_matrices[countermeasure]
+        confusion_matrices['FPScanner'].add(ground_truth, fpscanner_prediction)
+        confusion_matrices['FPJS2'].add(ground_truth, fpjs2_prediction)
+        confusion_matrices['Augur'].add(ground_truth, augur_prediction)
+
+    def add_guess(self, countermeasure, real_os, real_browser, predicted_os, predicted_browser):
+        if countermeasure not in GUESS_COUNTERMEASURES:
+            return
+        if countermeasure not in self.guesses:
+            self.guesses[countermeasure] = GuessCounts()
+        self.guesses[countermeasure].add(real_os, real_browser, predicted_os, predicted_browser)
+
+    def add_scan_result(self, fingerprint, scan_outcome, real_info, ground_truth):
+        real_os_guessed, real_browser_guessed, _ = real_info
+        self.add_detection(fingerprint.countermeasure, ground_truth, scan_outcome.is_consistent,
+                           fingerprint.fpjs2_consistent, fingerprint.augur_consistent)
+        self.add_guess(fingerprint.countermeasure, fingerprint.real_os, fingerprint.real_browser,
+                       real_os_guessed, real_browser_guessed)
+
+    def maybe_print_snapshot(self):
+        if self.snapshot_interval is None:
+            return
+        now = time.time()
+        if now - self.last_snapshot >= self.snapshot_interval:
+            self.last_snapshot = now
+            print(self.report(show_matrices=False, title='Accuracy so far'))
+
+    def report(self, show_matrices=True, title=None):
+        lines = []
+        if title is not None:
+            lines.append('===== {} ====='.format(title))
+
+        for countermeasure in COUNTERMEASURES:
+            if countermeasure not in self.confusion_matrices:
+                continue
+            confusion_matrices = self.confusion_matrices[countermeasure]
+            lines.append('{}, {:d} fingerprints'.format(countermeasure, confusion_matrices['FPScanner'].total()))
+            for detector in DETECTORS:
+                confusion_matrix = confusion_matrices[detector]
+                if show_matrices:
+                    lines.append("Accuracy {}: {:f} ({})".format(detector, confusion_matrix.accuracy(),
+                                                                  confusion_matrix))
+                else:
+                    lines.append("Accuracy {}: {:f}".format(detector, confusion_matrix.accuracy()))
+            lines.append('')
+
+        for countermeasure in GUESS_COUNTERMEASURES:
+            if countermeasure not in self.guesses:
+                continue
+            guess_counts = self.guesses[countermeasure]
+            lines.append('{}, {:d} fingerprints'.format(countermeasure, guess_counts.nb_fingerprints))
+            lines.append("Accuracy OS: {:f}".format(guess_counts.accuracy_os()))
+            lines.append("Accuracy browser: {:f}".format(guess_counts.accuracy_browser()))
+            lines.append('')
+
+        return '\n'.join(lines)
@@ -0,0 +1,52 @@
+import base64
+import io
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+RGBA = "RGBA"
+
+
+def open_canvas_uri(data_uri):
+    """
+        PIL image of a base64 PNG data URI, its pixels are decoded when read
+    """
+    png_data = base64.b64decode(data_uri.split("base64,")[1].encode())
+    return PngImagePlugin.PngImageFile(io.BytesIO(png_data))
+
+
+def decode_canvas_uri(data_uri, channels=RGBA, out=None):
+    """
+        Decodes a canvas data URI to an uint8 array (height, width, len(channels))
+        with only the channels asked for, e.g. "A" for the alpha channel.
+        The pixels are written into out when it is given, an uint8 array
+        of the same shape, so a batch of canvases can be decoded in a
+        single preallocated array.
+        Only bench-decode uses the other channels and out: the scan reads
+        the uint8 RGBA canvas of Fingerprint.canvas_img
+    """
+    image = open_canvas_uri(data_uri)
+    if image.mode != RGBA:
+        image = image.convert(RGBA)
+
+    if channels == RGBA:
+        pixels = np.asarray(image)
+        if out is None:
+            return pixels
+        out[...] = pixels
+        return out
+
+    if out is None:
+        out = np.empty((image.height, image.width, len(channels)), dtype=np.uint8)
+    for index, channel in enumerate(channels):
+        # only this channel is copied out of the decoded image
+        channel_data = np.frombuffer(image.tobytes("raw", channel), dtype=np.uint8)
+        out[:, :, index] = channel_data.reshape(image.height, image.width)
+    return out
+
+
+def to_float(pixels):
+    """
+        uint8 pixels to float32 in [0, 1], the values matplotlib's imread returns for a PNG,
+        only compared by bench-decode
+    """
+    return np.divide(pixels, 255, dtype=np.float32)
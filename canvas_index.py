@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+
+# header of an index file: magic, version, number of platforms, length of
+# the JSON of the platforms and of the scanner parameters, and number of entries
+HEADER = struct.Struct("<8sIIIQ")
+MAGIC = b"FPCANVAS"
+VERSION = 2
+
+# fingerprints whose canvases are indexed
+GENUINE_COUNTERMEASURE = "no"
+
+
+def canvas_uri_hash(data_uri):
+    """
+        64 bits hash of a canvas data URI, None if it isn't a string
+    """
+    if not isinstance(data_uri, str):
+        return None
+    return int.from_bytes(hashlib.blake2b(data_uri.encode(), digest_size=8).digest(), "little")
+
+
+class CanvasIndex:
+    """
+        Hashes of the canvases rendered by genuine browsers, with the
+        platforms (claimed OS, claimed browser) each one was seen on.
+        Only the canvases the pixels analysis finds consistent are added,
+        so the index gives the verdict of the analysis for the parameters
+        of the scanner it was built with.
+        On disk, the sorted hashes and the platform of each one are stored
+        as two arrays read without parsing, see save()
+    """
+
+    def __init__(self):
+        # Scanner.pixels_parameters of the scanner the canvases were
+        # analysed with, None until add_fingerprints is called
+        self.parameters = None
+        self.platforms = []
+        self.__platform_ids = dict()
+        # entries sorted by hash, then by platform
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.platform_ids = np.empty(0, dtype=np.uint16)
+        # entries added since the index was loaded, canvas hash -> platform ids
+        self.__added = dict()
+
+    @classmethod
+    def load(cls, index_file):
+        index = cls()
+        with open(index_file, 'rb') as f_index:
+            content = f_index.read()
+        magic, version, nb_platforms, metadata_length, nb_entries = HEADER.unpack_from(content)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a canvas index of version {:d}".format(index_file, VERSION))
+
+        offset = HEADER.size
+        metadata = json.loads(content[offset:offset + metadata_length].decode())
+        index.parameters = metadata["parameters"]
+        index.platforms = [tuple(platform) for platform in metadata["platforms"]]
+        index.__platform_ids = {platform: platform_id for platform_id, platform in enumerate(index.platforms)}
+        offset += metadata_length
+        # the hashes are 8 bytes aligned, padding follows the platforms
+        offset += -offset % 8
+        index.hashes = np.frombuffer(content, dtype="<u8", count=nb_entries, offset=offset)
+        index.platform_ids = np.frombuffer(content, dtype="<u2", count=nb_entries, offset=offset + 8 * nb_entries)
+        return index
+
+    def save(self, index_file):
+        """
+            Writes the index with the entries added, to a temporary file
+            first so a scanner loading it never reads a partial index
+        """
+        self.__merge_added()
+        metadata = json.dumps(dict(parameters=self.parameters, platforms=self.platforms), sort_keys=True).encode()
+        padding = -(HEADER.size + len(metadata)) % 8
+        tmp_file = "{}.tmp".format(index_file)
+        with open(tmp_file, 'wb') as f_index:
+            f_index.write(HEADER.pack(MAGIC, VERSION, len(self.platforms), len(metadata), len(self.hashes)))
+            f_index.write(metadata)
+            f_index.write(b"\0" * padding)
+            f_index.write(self.hashes.astype("<u8").tobytes())
+            f_index.write(self.platform_ids.astype("<u2").tobytes())
+        os.replace(tmp_file, index_file)
+
+    def __merge_added(self):
+        if not self.__added:
+            return
+        added = [(canvas_hash, platform_id) for canvas_hash, platform_ids in self.__added.items()
+                 for platform_id in platform_ids]
+        hashes = np.concatenate([self.hashes, np.array([entry[0] for entry in added], dtype=np.uint64)])
+        platform_ids = np.concatenate([self.platform_ids, np.array([entry[1] for entry in added], dtype=np.uint16)])
+        order = np.lexsort((platform_ids, hashes))
+        hashes, platform_ids = hashes[order], platform_ids[order]
+        # entries already in the index
+        unique = np.ones(len(hashes), dtype=bool)
+        unique[1:] = (hashes[1:] != hashes[:-1]) | (platform_ids[1:] != platform_ids[:-1])
+        self.hashes, self.platform_ids = hashes[unique], platform_ids[unique]
+        self.__added = dict()
+
+    def add(self, canvas_hash, os_name, browser):
+        platform = (os_name, browser)
+        platform_id = self.__platform_ids.get(platform)
+        if platform_id is None:
+            platform_id = len(self.platforms)
+            self.platforms.append(platform)
+            self.__platform_ids[platform] = platform_id
+        self.__added.setdefault(canvas_hash, set()).add(platform_id)
+
+    def check_parameters(self, parameters):
+        """
+            Raises a ValueError if the canvases were analysed with other
+            parameters of the pixels analysis than parameters
+        """
+        if self.parameters is not None and self.parameters != parameters:
+            raise ValueError("the canvas index was built with the pixels analysis parameters {}, not {}".format(
+                self.parameters, parameters))
+
+    def add_fingerprints(self, fingerprints, scanner):
+        """
+            Adds the canvases of the genuine fingerprints that the pixels
+            analysis of scanner finds consistent and returns the number of
+            fingerprints added
+        """
+        self.check_parameters(scanner.pixels_parameters)
+        self.parameters = scanner.pixels_parameters
+        nb_added = 0
+        for fingerprint in fingerprints:
+            if fingerprint.countermeasure != GENUINE_COUNTERMEASURE or fingerprint.canvas_hash is None:
+                continue
+            # e.g. a blank canvas, or a genuine fingerprint whose canvas an
+            # extension modified: the analysis must decode it
+            if not scanner.are_canvas_pixels_consistent(fingerprint):
+                continue
+            self.add(fingerprint.canvas_hash, fingerprint.os_ref_js, fingerprint.browser_ref_js)
+            nb_added += 1
+        return nb_added
+
+    def platforms_of(self, canvas_hash):
+        """
+            Set of the platforms (OS, browser) the canvas was seen on,
+            empty if it is unknown
+        """
+        canvas_hash = np.uint64(canvas_hash)
+        start = np.searchsorted(self.hashes, canvas_hash, side="left")
+        stop = np.searchsorted(self.hashes, canvas_hash, side="right")
+        platform_ids = set(self.platform_ids[start:stop].tolist())
+        platform_ids.update(self.__added.get(int(canvas_hash), ()))
+        return {self.platforms[platform_id] for platform_id in platform_ids}
+
+    def __len__(self):
+        # number of (canvas, platform) entries
+        self.__merge_added()
+        return len(self.hashes)
+
+
+def update_canvas_index(fp_manager, scanner, index_file):
+    """
+        Adds the canvases of the genuine fingerprints of the database that
+        the pixels analysis of scanner finds consistent to the index of
+        index_file, created if it doesn't exist
+    """
+    index = CanvasIndex.load(index_file) if os.path.exists(index_file) else CanvasIndex()
+    nb_entries = len(index)
+    nb_added = index.add_fingerprints(fp_manager.get_fingerprints_countermeasure(GENUINE_COUNTERMEASURE), scanner)
+    index.save(index_file)
+    print("{:d} consistent genuine canvases read, {:d} new entries, {:d} entries in {}".format(
+        nb_added, len(index) - nb_entries, len(index), index_file))
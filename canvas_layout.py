@@ -0,0 +1,54 @@
+CANVAS_WIDTH = 400
+CANVAS_HEIGHT = 60
+
+
+class CanvasLayout:
+    """
+        Regions of interest of the canvas drawn by the fingerprinting script,
+        a 400x60 canvas with an orange (#f60) rectangle at (125, 1) of size
+        62x20 and two lines of text at y=15 and y=45.
+        The color check only looks at the rectangle, and the isolated pixels
+        are only looked for in the bands left empty by the drawing, where
+        the noise added by a countermeasure shows up as isolated pixels.
+        The transparent pixels are still counted on the whole canvas,
+        counting them is cheap and the number only makes sense globally.
+        A region is (first row, last row excluded, first column, last column excluded)
+    """
+
+    def __init__(self, color_regions=None, isolated_regions=None, max_isolated_pixels=None):
+        # one pixel of margin around the rectangle for its antialiased border
+        self.color_regions = color_regions if color_regions is not None else [(0, 22, 124, 188)]
+        # between the two lines of text and below the second one, the rows
+        # left empty on the genuine canvases of fixtures/fingerprints_sample.json
+        self.isolated_regions = isolated_regions if isolated_regions is not None else \
+            [(21, 25, 0, CANVAS_WIDTH), (45, CANVAS_HEIGHT, 0, CANVAS_WIDTH)]
+        if max_isolated_pixels is None:
+            # same density of isolated pixels as the threshold on the whole canvas, 8 pixels
+            max_isolated_pixels = 8 * area(self.isolated_regions) / (CANVAS_WIDTH * CANVAS_HEIGHT)
+        self.max_isolated_pixels = max_isolated_pixels
+
+    def fits(self, img):
+        """
+            False if img hasn't the size of the canvas, it is then analysed as a whole
+        """
+        return img.shape[0] == CANVAS_HEIGHT and img.shape[1] == CANVAS_WIDTH
+
+    def color_views(self, img):
+        for row_start, row_end, col_start, col_end in self.color_regions:
+            yield img[row_start:row_end, col_start:col_end]
+
+    def isolated_views(self, mask):
+        """
+            Yields (view of mask, region in the view) for each isolated region,
+            the view has one more pixel on each side when the canvas does, so a
+            pixel on the border of the region sees all its neighbours
+        """
+        for row_start, row_end, col_start, col_end in self.isolated_regions:
+            top = max(row_start - 1, 0)
+            left = max(col_start - 1, 0)
+            view = mask[top:row_end + 1, left:col_end + 1]
+            yield view, (slice(row_start - top, row_end - top), slice(col_start - left, col_end - left))
+
+
+def area(regions):
+    return sum((row_end - row_start) * (col_end - col_start) for row_start, row_end, col_start, col_end in regions)
@@ -0,0 +1,57 @@
+import threading
+
+
+class CostEstimator:
+    """
+        Exponentially weighted moving average of the execution time of
+        each analysis, used to decide if an analysis fits in the time
+        left before a deadline. A skipped analysis isn't observed, so each
+        skip moves its estimate toward its prior cost: after a transient
+        slowdown, it fits in the time left again and runs
+    """
+
+    def __init__(self, alpha=0.05, max_ratio=4.0, initial_costs=None, decay=0.01):
+        """
+            alpha is the weight of a new observation,
+            an observation is clipped to max_ratio times the current estimate
+            so a single pause (GC, swap...) doesn't disable an analysis,
+            initial_costs a dict analysis -> seconds used until it is observed,
+            and the prior cost the estimate moves to when it is skipped, 0 by default,
+            decay is the weight of the prior cost on each skip
+        """
+        self.alpha = alpha
+        self.max_ratio = max_ratio
+        self.decay = decay
+        self.initial_costs = dict(initial_costs) if initial_costs is not None else dict()
+        self.costs = dict(self.initial_costs)
+        self.nb_observations = dict()
+        self.__lock = threading.Lock()
+
+    def estimate(self, analysis):
+        """
+            Expected execution time of analysis in seconds,
+            0 if it has never been observed so it gets a chance to run
+        """
+        return self.costs.get(analysis, 0.0)
+
+    def observe(self, analysis, elapsed_time):
+        with self.__lock:
+            nb_observations = self.nb_observations.get(analysis, 0)
+            self.nb_observations[analysis] = nb_observations + 1
+            if nb_observations < 2:
+                # the first run also pays lazy imports and parsing,
+                # the estimate starts from the second one
+                self.costs[analysis] = elapsed_time
+            else:
+                elapsed_time = min(elapsed_time, self.max_ratio * self.costs[analysis])
+                self.costs[analysis] += self.alpha * (elapsed_time - self.costs[analysis])
+
+    def skip(self, analysis):
+        """
+            Called when analysis is skipped because its estimate
+            doesn't fit in the time left
+        """
+        with self.__lock:
+            if analysis in self.costs:
+                prior_cost = self.initial_costs.get(analysis, 0.0)
+                self.costs[analysis] += self.decay * (prior_cost - self.costs[analysis])
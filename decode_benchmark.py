@@ -0,0 +1,54 @@
+import base64
+import io
+import time
+import numpy as np
+from canvas_decoder import decode_canvas_uri, to_float
+
+
+def run_decode_benchmark(fingerprints, nb_canvases, bench_file):
+    """
+        Measures the time needed to decode the canvases with matplotlib's
+        imread and with the Pillow decoder of canvas_decoder.py
+    """
+    start = time.perf_counter()
+    import matplotlib.image as mpimg
+    import_time = time.perf_counter() - start
+
+    def imread(data_uri):
+        return mpimg.imread(io.BytesIO(base64.b64decode(data_uri.split("base64,")[1].encode())), format='PNG')
+
+    alpha_buffer = None
+
+    def decode_alpha(data_uri):
+        return decode_canvas_uri(data_uri, "A", alpha_buffer)
+
+    methods = [
+        ("matplotlib float32 RGBA", imread),
+        ("pillow float32 RGBA", lambda data_uri: to_float(decode_canvas_uri(data_uri))),
+        ("pillow uint8 RGBA", decode_canvas_uri),
+        ("pillow uint8 alpha into buffer", decode_alpha),
+    ]
+    elapsed_times = {name: [] for name, _ in methods}
+    for fingerprint in fingerprints:
+        if len(elapsed_times["pillow uint8 RGBA"]) == nb_canvases:
+            break
+        # None when the canvas is blocked or can't be decoded
+        data_uri = fingerprint.canvas
+        if data_uri is None:
+            continue
+        if alpha_buffer is None or alpha_buffer.shape[:2] != fingerprint.canvas_img.shape[:2]:
+            alpha_buffer = np.empty(fingerprint.canvas_img.shape[:2] + (1,), dtype=np.uint8)
+        for name, method in methods:
+            start = time.perf_counter()
+            method(data_uri)
+            elapsed_times[name].append(time.perf_counter() - start)
+
+    with open(bench_file, 'w+') as f_bench:
+        f_bench.write('method,elapsed_time\n')
+        f_bench.write('import matplotlib.image,{:f}\n'.format(import_time))
+        print('import matplotlib.image: {:f} ms'.format(1000 * import_time))
+        for name, _ in methods:
+            for elapsed_time in elapsed_times[name]:
+                f_bench.write('{},{:f}\n'.format(name, elapsed_time))
+            if elapsed_times[name]:
+                print('{}: {:f} ms per canvas'.format(name, 1000 * np.mean(elapsed_times[name])))
@@ -0,0 +1,409 @@
+import copy
+import csv
+import json
+import math
+import random
+from contextlib import nullcontext
+import numpy as np
+from bson import json_util
+from bson.objectid import ObjectId
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+
+DIFFERENTIAL_HEADER = ["_id", "mode", "analysis", "field", "expected", "actual"]
+
+# attributes swapped between documents to build a synthetic corpus, each
+# swap gives a combination the original corpus may not have
+MIXED_ATTRIBUTES = [
+    ("browser", "userAgent"), ("browser", "userAgentHttp"), ("browser", "fonts"), ("browser", "plugins"),
+    ("browser", "canvas"), ("browser", "mimeTypes"), ("os", "platform"), ("os", "videoCard"),
+    ("os", "touchScreen"), ("os", "resolution"), ("scanner", "mediaQueries"), ("scanner", "modernizr"),
+    ("scanner", "canvasDesc"), ("scanner", "productSub"), ("scanner", "etsl"), ("scanner", "errorsGenerated"),
+    ("scanner", "navigatorPrototype"),
+]
+
+
+class ExecutionMode:
+    """
+        A way to run the scanner that must give the same verdicts as
+        check_fingerprint and guess_real_info.
+        run(scanner, fingerprint) returns (list of AnalysisResult, real info),
+        or for the modes scanning many fingerprints at once, run_batch(scanner,
+        fingerprints) returns a list of them, or of exceptions, in the same order.
+        compact is True when the consistent analyses have no data, as with a
+        ScanOutcome, and scanner_parameters are given to the Scanner of this mode.
+        processes is True when the mode starts processes, it can't run in the
+        processes of run_differential
+    """
+
+    def __init__(self, name, run=None, compact=False, scanner_parameters=None, run_batch=None, processes=False):
+        self.name = name
+        self.run = run
+        self.run_batch = run_batch
+        self.compact = compact
+        self.scanner_parameters = scanner_parameters if scanner_parameters is not None else dict()
+        self.processes = processes
+
+
+def run_reference(scanner, fingerprint):
+    # the scanner of an earlier commit, see write_reference_outcomes, has no rule data to pin
+    with scanner.pin_rule_data() if hasattr(scanner, "pin_rule_data") else nullcontext():
+        analyses_results = scanner.check_fingerprint(fingerprint, run_all=True)
+        return analyses_results, scanner.guess_real_info(fingerprint, analyses_results)
+
+
+def run_scan_outcome(scanner, fingerprint):
+    with scanner.pin_rule_data():
+        scan_outcome = scanner.scan_fingerprint(fingerprint, run_all=True)
+        return scan_outcome.to_analysis_results(), scanner.guess_real_info(fingerprint, scan_outcome)
+
+
+def run_without_deadline(scanner, fingerprint):
+    # the analyses run cheapest first and none is skipped
+    with scanner.pin_rule_data():
+        scan_outcome = scanner.scan_fingerprint(fingerprint, run_all=True, deadline=math.inf)
+        return scan_outcome.to_analysis_results(), scanner.guess_real_info(fingerprint, scan_outcome)
+
+
+def run_two_tier(scanner, fingerprint):
+    with scanner.pin_rule_data():
+        provisional_outcome = scanner.scan_fingerprint(fingerprint, run_all=True, without_pixels=True)
+        scan_outcome = provisional_outcome.merge(scanner.scan_fingerprint(fingerprint, run_all=True,
+                                                                          only_pixels=True))
+        return scan_outcome.to_analysis_results(), scanner.guess_real_info(fingerprint, scan_outcome)
+
+
+def _scans_outcomes(fingerprints, scans):
+    # scans yields (fingerprint, ScanOutcome, real info) tuples, in any order
+    outcomes = {id(fingerprint): (scan_outcome.to_analysis_results(), real_info)
+                for fingerprint, scan_outcome, real_info in scans}
+    return [outcomes[id(fingerprint)] for fingerprint in fingerprints]
+
+
+def run_parallel(scanner, fingerprints):
+    from parallel_scanner import ParallelScanner
+    # batches smaller than the fingerprints, so both arenas are used
+    with ParallelScanner(scanner.parameters, workers=2, batch_size=16) as parallel_scanner:
+        return _scans_outcomes(fingerprints, parallel_scanner.scan(fingerprints))
+
+
+def run_two_tier_scanner(scanner, fingerprints):
+    from scan_command import scan_two_tier
+    return _scans_outcomes(fingerprints, scan_two_tier(scanner, fingerprints, threads=2, max_pending=16))
+
+
+def run_pipeline(scanner, fingerprints):
+    from pipeline import ScanPipeline
+    scan_pipeline = ScanPipeline(scanner, parse_threads=2, scan_threads=2, queue_size=16)
+    # the pipeline creates the fingerprints of the documents, in the same order
+    scans = list(scan_pipeline.scan(fingerprint._raw_values for fingerprint in fingerprints))
+    return [(scan_outcome.to_analysis_results(), real_info) for _, scan_outcome, real_info in scans]
+
+
+def run_prefilter(scanner, fingerprints):
+    # the documents go through the aggregation pipeline in an in-memory MongoDB
+    import mongomock
+    from fingerprint_data_manager import FingerprintDataManager
+    fp_manager = FingerprintDataManager(client=mongomock.MongoClient())
+    fp_manager.collection.insert_many([fingerprint._raw_values for fingerprint in fingerprints])
+    prefiltered = {prefiltered._id: prefiltered for prefiltered in fp_manager.get_prefiltered_fingerprints()}
+    outcomes = []
+    for fingerprint in fingerprints:
+        try:
+            outcomes.append(run_reference(scanner, prefiltered[fingerprint._id]))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def run_canvas_index(scanner, fingerprints):
+    # the consistent canvases of the genuine fingerprints of the batch are indexed
+    from canvas_index import CanvasIndex
+    scanner.canvas_index = CanvasIndex()
+    scanner.canvas_index.add_fingerprints(fingerprints, scanner)
+    return [run_reference(scanner, fingerprint) for fingerprint in fingerprints]
+
+
+MODES = [
+    ExecutionMode("reference", run_reference),
+    ExecutionMode("scan_outcome", run_scan_outcome, compact=True),
+    ExecutionMode("cost_ordered", run_without_deadline, compact=True),
+    ExecutionMode("two_tier", run_two_tier, compact=True),
+    ExecutionMode("two_tier_scanner", run_batch=run_two_tier_scanner, compact=True),
+    ExecutionMode("parallel", run_batch=run_parallel, compact=True, processes=True),
+    ExecutionMode("pipeline", run_batch=run_pipeline, compact=True),
+    # needs mongomock
+    ExecutionMode("prefilter", run_batch=run_prefilter),
+    # expected to differ on some canvases, see canvas_layout.py
+    ExecutionMode("canvas_roi", run_reference, scanner_parameters=dict(canvas_roi=True)),
+    ExecutionMode("canvas_index", run_batch=run_canvas_index),
+]
+
+# modes that must give exactly the verdicts of the reference
+DEFAULT_MODES = ["scan_outcome", "cost_ordered", "two_tier", "two_tier_scanner", "parallel", "pipeline",
+                 "canvas_index"]
+
+
+def get_modes(names):
+    modes_by_name = {mode.name: mode for mode in MODES}
+    unknown = [name for name in names if name not in modes_by_name]
+    if unknown:
+        raise ValueError("unknown modes {}, choose among {}".format(", ".join(unknown), ", ".join(modes_by_name)))
+    return [modes_by_name[name] for name in names]
+
+
+def load_fixtures(fixtures_file):
+    """
+        Reads fingerprint documents exported with mongoexport, one document
+        per line or a JSON array (--jsonArray), ObjectIds included
+    """
+    with open(fixtures_file) as f_fixtures:
+        content = f_fixtures.read()
+    if content.lstrip().startswith("["):
+        return json_util.loads(content)
+    return [json_util.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def write_fixtures(documents, fixtures_file):
+    with open(fixtures_file, 'w+') as f_fixtures:
+        for document in documents:
+            f_fixtures.write('{}\n'.format(json_util.dumps(document, sort_keys=True)))
+
+
+def synthetic_corpus(documents, size, seed=0, swap_probability=0.1):
+    """
+        size documents, each a copy of one of documents where every attribute
+        of MIXED_ATTRIBUTES is replaced, with swap_probability, by the one of
+        another document
+    """
+    return list(iter_synthetic_corpus(documents, size, seed, swap_probability))
+
+
+def iter_synthetic_corpus(documents, size, seed=0, swap_probability=0.1):
+    """
+        Same documents as synthetic_corpus, generated one at a time
+    """
+    rng = random.Random(seed)
+    for _ in range(size):
+        base = rng.choice(documents)
+        # sections are copied, the values are shared with the original documents
+        document = {key: copy.copy(value) if isinstance(value, dict) else value for key, value in base.items()}
+        # ids drawn from rng, so a corpus can be compared to reference outcomes
+        document["_id"] = ObjectId(rng.getrandbits(96).to_bytes(12, "big"))
+        for section, key in MIXED_ATTRIBUTES:
+            if rng.random() < swap_probability:
+                other = rng.choice(documents)
+                if key in other.get(section, {}) and section in document:
+                    document[section][key] = other[section][key]
+        yield document
+
+
+def _normalize(value):
+    # numpy values and sets, compared as plain python values
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(_normalize(item) for item in value)
+    return value
+
+
+def _json_outcome(analyses_results, real_info):
+    """
+        [dict analysis name -> [is_consistent, data], [OS, browser, versions]],
+        with the values read back from JSON, as stored in a reference outcomes file
+    """
+    results = {result.name: (bool(result.is_consistent), _normalize(result.data)) for result in analyses_results}
+    real_os, real_browser, real_versions = real_info
+    return json.loads(json.dumps([results, [real_os, real_browser, sorted(_normalize(real_versions))]]))
+
+
+def _outcome(mode_run, scanner, document):
+    """
+        Outcome of mode_run, see _json_outcome, or the name of the exception raised
+    """
+    try:
+        analyses_results, real_info = mode_run(scanner, Fingerprint(document))
+    except Exception as e:
+        return type(e).__name__
+    return _json_outcome(analyses_results, real_info)
+
+
+def _batch_outcomes(mode, scanner, documents):
+    outcomes = [None] * len(documents)
+    fingerprints = []
+    for index, document in enumerate(documents):
+        try:
+            fingerprints.append((index, Fingerprint(document)))
+        except Exception as e:
+            outcomes[index] = type(e).__name__
+    try:
+        results = mode.run_batch(scanner, [fingerprint for _, fingerprint in fingerprints])
+    except Exception as e:
+        results = [e] * len(fingerprints)
+    for (index, _), result in zip(fingerprints, results):
+        outcomes[index] = type(result).__name__ if isinstance(result, Exception) else _json_outcome(*result)
+    return outcomes
+
+
+def write_reference_outcomes(documents, scanner, reference_file):
+    """
+        Writes the outcome of run_reference on each document, a JSON line
+        with its _id. scanner may be the one of an earlier commit, to
+        compare the current code to it, see README.md
+    """
+    with open(reference_file, 'w+') as f_reference:
+        for document in documents:
+            outcome = _outcome(run_reference, scanner, document)
+            f_reference.write('{}\n'.format(json.dumps(dict(_id=str(document["_id"]), outcome=outcome),
+                                                        sort_keys=True)))
+
+
+def load_reference_outcomes(reference_file):
+    """
+        dict _id -> outcome of a file written by write_reference_outcomes
+    """
+    with open(reference_file) as f_reference:
+        lines = [json.loads(line) for line in f_reference if line.strip()]
+    return {line["_id"]: line["outcome"] for line in lines}
+
+
+def compare(document_id, mode, expected, actual):
+    """
+        Rows following DIFFERENTIAL_HEADER, one per difference
+        between the reference outcome and the one of mode
+    """
+    document_id = str(document_id)
+    if isinstance(expected, str) or isinstance(actual, str):
+        if expected != actual:
+            return [[document_id, mode.name, "", "exception", expected, actual]]
+        return []
+
+    mismatches = []
+    expected_results, expected_info = expected
+    actual_results, actual_info = actual
+    for name in sorted(set(expected_results) | set(actual_results)):
+        if name not in actual_results or name not in expected_results:
+            mismatches.append([document_id, mode.name, name, "run", name in expected_results, name in actual_results])
+            continue
+        expected_consistent, expected_data = expected_results[name]
+        actual_consistent, actual_data = actual_results[name]
+        if expected_consistent != actual_consistent:
+            mismatches.append([document_id, mode.name, name, "is_consistent", expected_consistent, actual_consistent])
+        # the compact modes only keep the data of the failed analyses
+        if mode.compact and expected_consistent:
+            expected_data = {}
+        if expected_data != actual_data:
+            mismatches.append([document_id, mode.name, name, "data", expected_data, actual_data])
+
+    for field, expected_value, actual_value in zip(["os", "browser", "versions"], expected_info, actual_info):
+        if expected_value != actual_value:
+            mismatches.append([document_id, mode.name, "", field, expected_value, actual_value])
+    return mismatches
+
+
+_worker_scanners = None
+
+
+def _init_worker(scanner_parameters, modes):
+    global _worker_scanners
+    _worker_scanners = _create_scanners(scanner_parameters, modes)
+
+
+def _create_scanners(scanner_parameters, modes):
+    # the reference scanner, then one per mode, so caches aren't shared between modes
+    scanners = [Scanner(**scanner_parameters)]
+    for mode in modes:
+        scanners.append(Scanner(**dict(scanner_parameters, **mode.scanner_parameters)))
+    return scanners
+
+
+def _diff_documents(documents, scanners, modes, reference_outcomes=None):
+    if reference_outcomes is None:
+        expected = [_outcome(run_reference, scanners[0], document) for document in documents]
+    else:
+        missing = [str(document["_id"]) for document in documents if str(document["_id"]) not in reference_outcomes]
+        if missing:
+            raise ValueError("no reference outcome for {}".format(", ".join(missing[:10])))
+        expected = [reference_outcomes[str(document["_id"])] for document in documents]
+
+    mismatches = []
+    for mode, scanner in zip(modes, scanners[1:]):
+        if mode.run_batch is not None:
+            actual = _batch_outcomes(mode, scanner, documents)
+        else:
+            actual = [_outcome(mode.run, scanner, document) for document in documents]
+        for document, expected_outcome, actual_outcome in zip(documents, expected, actual):
+            mismatches += compare(document.get("_id"), mode, expected_outcome, actual_outcome)
+    return mismatches
+
+
+def _diff_chunk(chunk):
+    documents, modes, reference_outcomes = chunk
+    return _diff_documents(documents, _worker_scanners, modes, reference_outcomes)
+
+
+def run_differential(documents, scanner_parameters, modes, workers=1, chunk_size=200, reference_outcomes=None):
+    """
+        Runs the reference and every mode on each document and returns
+        the mismatches, rows following DIFFERENTIAL_HEADER.
+        Each document is scanned from a new Fingerprint in each mode, so a
+        lazy attribute computed by one mode is never reused by another.
+        With reference_outcomes (see load_reference_outcomes), e.g. outcomes of
+        an earlier commit, the modes and the current reference are compared to them
+    """
+    if reference_outcomes is not None and "reference" not in [mode.name for mode in modes]:
+        modes = get_modes(["reference"]) + list(modes)
+    if workers <= 1:
+        return _diff_documents(documents, _create_scanners(scanner_parameters, modes), modes, reference_outcomes)
+
+    processes_modes = [mode.name for mode in modes if mode.processes]
+    if processes_modes:
+        raise ValueError("{} can't run with several workers".format(", ".join(processes_modes)))
+    import multiprocessing
+    chunks = [(documents[start:start + chunk_size], modes, reference_outcomes)
+              for start in range(0, len(documents), chunk_size)]
+    mismatches = []
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(scanner_parameters, modes)) as pool:
+        for chunk_mismatches in pool.imap(_diff_chunk, chunks):
+            mismatches += chunk_mismatches
+    return mismatches
+
+
+def write_differential(mismatches, differential_file):
+    with open(differential_file, 'w+') as f_differential:
+        writer = csv.writer(f_differential)
+        writer.writerow(DIFFERENTIAL_HEADER)
+        writer.writerows(mismatches)
+
+
+def run_differential_command(documents, scanner_parameters, modes, synthetic_size, seed, workers, differential_file,
+                             reference_outcomes_file=None):
+    modes = get_modes(modes.split(","))
+    reference_outcomes = None
+    if reference_outcomes_file is not None:
+        reference_outcomes = load_reference_outcomes(reference_outcomes_file)
+        if "reference" not in [mode.name for mode in modes]:
+            modes = get_modes(["reference"]) + modes
+    if synthetic_size is not None:
+        documents = synthetic_corpus(documents, synthetic_size, seed)
+    print("Comparing {} to the reference on {:d} fingerprints".format(
+        ", ".join(mode.name for mode in modes), len(documents)))
+    mismatches = run_differential(documents, scanner_parameters, modes, workers,
+                                  reference_outcomes=reference_outcomes)
+    write_differential(mismatches, differential_file)
+
+    # rows: _id, mode, analysis, field, expected, actual
+    for mode in modes:
+        mode_mismatches = [row for row in mismatches if row[1] == mode.name]
+        print("{}: {:d} mismatches on {:d} fingerprints".format(
+            mode.name, len(mode_mismatches), len(set(row[0] for row in mode_mismatches))))
+    for row in mismatches[:10]:
+        print("{} {} {} {}: expected {}, got {}".format(*row))
+    print("Mismatches written to {}".format(differential_file))
+    return mismatches
@@ -0,0 +1,156 @@
+from fingerprint import lazy_attribute
+
+OS_TO_PLATFORMS = {
+    "Linux": ["Linux i686", "Linux x86_64"],
+    "Ubuntu": ["Linux x86_64", "Linux i686"],
+    "Fedora": ["Linux i686", "Linux x86_64"],
+    "FreeBSD": ["FreeBSD amd64", "FreeBSD i386", "OpenBSD amd64"],
+    "OpenBSD": ["OpenBSD amd64", "OpenBSD i386"],
+    "NetBSD": ["NetBSD amd64"],
+    "Windows 7": ["Win32", "Win64"],
+    "Windows 8": ["Win32", "Win64"],
+    "Windows 8.1": ["Win32", "Win64"],
+    "Windows 10": ["Win32", "Win64"],
+    "Windows Vista": ["Win32", "Win64"],
+    "Mac OS": ["MacIntel"],
+    "Other": ["Other", "PlayStation 4", "PlayStation 3", "Nintendo Wii"],
+    "Windows Phone OS": ["ARM", "Win32"],
+    "Windows Phone": ["ARM", "Win32"],
+    "Windows RT": ["ARM"],
+    "iOS": ["iPhone", "iPad"],
+    "Android": ["Linux armv7l", "Linux i686", "Linux armv8l"],
+    "Firefox OS": ['unknown'],
+    'PLAYSTATION': ['PlayStation 3']
+}
+
+BROWSER_TO_ETSL = {
+    "Safari": 37,
+    "Firefox": 37,
+    "Internet Explorer": 39,
+    "Edge": 39,
+    "Chrome": 33,
+    "Opera": 33
+}
+
+# browsers whose navigator.productSub is "20030107"
+PRODUCT_SUB_20030107_BROWSERS = {"Chrome", "Chrome Mobile", "Safari", "Opera"}
+
+ALL_PLUGIN_EXTENSIONS = [".so", ".dll", ".plugin"]
+
+MOBILE_OSES = {"Android", "iOS", "Windows Phone"}
+
+
+class ExpectedProfile:
+    """
+        What the analyses expect from a fingerprint claiming a browser,
+        a browser version and an OS in its user agent. Few different
+        claims exist, so the scanner builds one profile per claim and
+        reuses it.
+        Each expectation is computed the first time an analysis reads it,
+        an analysis that fails for a claim (e.g. unknown OS) fails at the
+        same place as when it computed its expectations itself
+    """
+
+    def __init__(self, browser, browser_version, os):
+        self.browser = browser
+        self.browser_version = browser_version
+        self.os = os
+
+    @lazy_attribute
+    def allowed_platforms(self):
+        # KeyError if the OS is unknown
+        return frozenset(OS_TO_PLATFORMS[self.os])
+
+    @lazy_attribute
+    def mq_rules(self):
+        """
+            (any_mq_forbidden, is_mac, firefox_rules)
+            any_mq_forbidden is True if no OS media query should match,
+            firefox_rules is a list of (index of the media query, OS name,
+            True if the claimed OS is this OS), only for Firefox < 58
+        """
+        # starting at version 58, these media queries don't exist anymore either in normal mode or when
+        # fingerprinting protection is activated
+        any_mq_forbidden = self.browser != "Firefox" or self.browser_version > 57
+        firefox_rules = []
+        if self.browser == 'Firefox' and self.browser_version < 58:
+            firefox_rules = [
+                (1, "Windows XP", self.os == "Windows XP"),
+                (2, "Windows Vista", self.os == "Windows Vista"),
+                (3, "Windows 7", self.os == "Windows 7"),
+                # Warning, may fail if Windows 8.1?
+                (4, "Windows 8", "Windows 8" in self.os),
+                (4, "Windows 8.1", self.os == "Windows 8.1"),
+                (5, "Windows 10", self.os == "Windows 10"),
+            ]
+        return any_mq_forbidden, self.os == "Mac OS X", firefox_rules
+
+    @lazy_attribute
+    def forbidden_plugin_extensions(self):
+        # on an ARM platform everything is forbidden whatever the OS,
+        # the analysis checks the platform itself
+        if self.os != "Windows Phone" and "Windows" in self.os:
+            return [".so", ".plugin"]
+        elif "Mac OS X" in self.os:
+            return [".so", ".dll"]
+        elif "Linux" in self.os or "Ubuntu" in self.os:
+            return [".dll", ".plugin"]
+        # Default case, everything is forbidden
+        return ALL_PLUGIN_EXTENSIONS
+
+    @lazy_attribute
+    def forbidden_webgl_substrings(self):
+        if self.os != "Windows Phone" and "Windows" in self.os:
+            # False negative with Windows Phone, change this later
+            return ["OpenGL", "Mesa", "Gallium", "Qualcomm"]
+        elif self.os == "Mac OS X":
+            return ["ANGLE", "Mesa", "Gallium", "Qualcomm"]
+        elif self.os == "Linux" or self.os == "Ubuntu":
+            return ["ANGLE", "OpenGL", "Qualcomm"]
+        return []
+
+    @lazy_attribute
+    def fonts_os_family(self):
+        # Default case is "other"
+        # For the moment we do it only for desktop devices
+        if self.os != "Windows Phone" and "Windows" in self.os:
+            return "Windows"
+        elif "Ubuntu" in self.os or "Linux" in self.os or "Fedora" in self.os:
+            return "Linux"
+        elif "Mac OS X" in self.os:
+            return "Mac OS X"
+        return "Other"
+
+    @lazy_attribute
+    def etsl(self):
+        # None when the length is unknown for the browser
+        return BROWSER_TO_ETSL.get(self.browser)
+
+    @lazy_attribute
+    def product_sub_20030107(self):
+        """
+            True if productSub must be "20030107", False if it must not,
+            None if it is not checked
+        """
+        if self.browser in PRODUCT_SUB_20030107_BROWSERS:
+            return True
+        elif self.browser != "Other":
+            return False
+        return None
+
+    @lazy_attribute
+    def error_signatures(self):
+        """
+            (IE or Edge, Firefox based, Chrome or Opera, Chrome, Opera or Safari)
+            the families of browsers that generate specific errors
+        """
+        is_firefox = "Firefox" in self.browser
+        is_chrome_or_opera = "Chrome" in self.browser or self.browser == "Opera"
+        return (self.browser == "IE" or self.browser == "Edge",
+                is_firefox,
+                is_chrome_or_opera,
+                is_chrome_or_opera or "Safari" in self.browser)
+
+    @lazy_attribute
+    def is_mobile(self):
+        return self.os in MOBILE_OSES
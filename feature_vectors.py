@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class FeatureVectors:
+    """
+        Modernizr features and caniuse.com support as boolean vectors over
+        a fixed order of the caniuse features, so FEATURES_BROWSER compares
+        two vectors instead of looking up each feature.
+        Rows of several fingerprints can be stacked to check a batch
+        with the same operations
+    """
+
+    def __init__(self, caniuse_features):
+        """
+            caniuse_features is the dict feature -> browser -> set of
+            versions supporting it built by the scanner
+        """
+        self.caniuse_features = caniuse_features
+        self.features = list(caniuse_features)
+        self.feature_index = {feature: index for index, feature in enumerate(self.features)}
+        # (browser, version) -> (checked, supported)
+        self.__expected = dict()
+
+    def expected(self, browser, browser_version):
+        """
+            Returns (checked, supported) for a browser and version claimed:
+            checked[i] is True if caniuse has data on feature i for the browser,
+            supported[i] is True if this version supports it.
+            Computed once per (browser, version)
+        """
+        claim = (browser, browser_version)
+        expected = self.__expected.get(claim)
+        if expected is None:
+            checked = np.zeros(len(self.features), dtype=bool)
+            supported = np.zeros(len(self.features), dtype=bool)
+            version = str(browser_version)
+            for index, feature in enumerate(self.features):
+                if browser in self.caniuse_features[feature]:
+                    checked[index] = True
+                    supported[index] = version in self.caniuse_features[feature][browser]
+            checked.setflags(write=False)
+            supported.setflags(write=False)
+            expected = (checked, supported)
+            self.__expected[claim] = expected
+        return expected
+
+    def observed(self, modernizr):
+        """
+            Returns (indices, available) for the modernizr results of a
+            fingerprint: the index of each feature tested, in the order of
+            the results, and its result. Features unknown to caniuse are ignored
+        """
+        feature_index = self.feature_index
+        indices = []
+        available = []
+        for feature, is_available in modernizr.items():
+            index = feature_index.get(feature)
+            if index is not None:
+                indices.append(index)
+                available.append(is_available)
+        return np.array(indices, dtype=np.intp), np.array(available, dtype=bool)
+
+    @staticmethod
+    def wrong_features(checked, supported, indices, available):
+        """
+            Boolean vector, aligned with indices, of the features tested
+            whose availability differs from what caniuse expects
+        """
+        return checked[indices] & (available != supported[indices])
+
+    def count_wrong_features(self, claims, modernizrs):
+        """
+            Number of wrong features of a batch of fingerprints,
+            claims is a list of (browser, version) and modernizrs the list
+            of their modernizr dicts. Returns an array of counts
+        """
+        shape = (len(claims), len(self.features))
+        checked = np.empty(shape, dtype=bool)
+        supported = np.empty(shape, dtype=bool)
+        present = np.zeros(shape, dtype=bool)
+        available = np.zeros(shape, dtype=bool)
+        for row, (claim, modernizr) in enumerate(zip(claims, modernizrs)):
+            checked[row], supported[row] = self.expected(*claim)
+            indices, row_available = self.observed(modernizr)
+            present[row, indices] = True
+            available[row, indices] = row_available
+        return np.count_nonzero(present & checked & (available != supported), axis=1)
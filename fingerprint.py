@@ -1,14 +1,55 @@
-import io
-import base64
-import matplotlib.image as mpimg
-from ua_parser import user_agent_parser
 import numpy as np
 
 UNKNOWN = "unknown"
 
+
+class lazy_attribute:
+    """
+        Turns a method of Fingerprint into an attribute parsed from the raw
+        document on first access. The parsed value is then stored on the
+        instance, so later accesses are plain attribute lookups.
+        fields are the fields of the document it is parsed from, see reading()
+    """
+    def __init__(self, parse, fields=()):
+        self.parse = parse
+        self.name = parse.__name__
+        self.fields = fields
+        self.__doc__ = parse.__doc__
+
+    @classmethod
+    def reading(cls, *fields):
+        """
+            Same as lazy_attribute, for an attribute parsed from fields.
+            A fingerprint whose document left them out, e.g. a fingerprint of a
+            prefilter pipeline, raises a KeyError instead of parsing a missing field
+        """
+        return lambda parse: cls(parse, fields)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.fields and instance._lazy_fields is not None:
+            for field in self.fields:
+                if field not in instance._lazy_fields:
+                    raise KeyError("{} needs {}, left out of the document of the fingerprint".format(
+                        self.name, field))
+        value = self.parse(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
 class Fingerprint():
     def __init__(self, dict_values):
+        # attributes that need parsing are lazy_attribute, computed from
+        # the raw document only if an analysis uses them
+        self._raw_values = dict_values
         self._id = dict_values['_id']
+        # verdicts computed by MongoDB for the documents of a prefilter
+        # pipeline, see mongo_prefilter.py, None otherwise
+        self.prefilter = dict_values.get("_prefilter")
+        # fields of the document the lazy attributes can be parsed from,
+        # None if the document is complete, see lazy_attribute.reading
+        self._lazy_fields = self.prefilter.get("fields") if self.prefilter is not None else None
         self.user_agent_js = dict_values["browser"]["userAgent"]
         self.os_ref_js = dict_values["os"]["name"]
         self.browser_ref_js = dict_values["browser"]["name"]
@@ -19,6 +60,7 @@ class Fingerprint():
         try:
             self.browser_version_ref_js = dict_values["browser"]["version"]
         except:
+            from ua_parser import user_agent_parser
             parsed_ua = user_agent_parser.Parse(dict_values["browser"]["userAgent"])
             self.browser_version_ref_js = int(parsed_ua["user_agent"]["major"])
 
@@ -27,24 +69,12 @@ class Fingerprint():
 
         self.platform = dict_values["os"]["platform"]
 
-        self.languages = dict_values["os"]["languages"]
-        try:
-            tmp_languages = self.languages.split("~~")
-            self.languages = []
-            for language in tmp_languages:
-                self.languages.append(language)
-        except Exception:
-            self.languages = []
-
         # TODO add it to fpscanner script (or not)
         if "unknownImageError" in dict_values:
             self.unknown_image = [int(x) for x in dict_values["unknownImageError"].split(";")]
 
         self.mq_os = dict_values["scanner"]["mediaQueries"]
 
-        self_tmp_resolution = dict_values["os"]["resolution"].split(",")
-        self.screen_resolution = self_tmp_resolution[0]+","+self_tmp_resolution[1]
-        self.available_screen_resolution = self_tmp_resolution[2]+","+self_tmp_resolution[3]
         self.color_depth = dict_values["os"]["colorDepth"]
         self.hardware_concurrency = dict_values["os"]["hardwareConcurrency"]
         self.timezone = dict_values["geolocation"]["timezone"]
@@ -52,69 +82,20 @@ class Fingerprint():
         self.cpu_class = dict_values["os"]["processors"]
         self.do_not_track = dict_values["browser"]["dnt"]
         self.oscpu = dict_values["os"]["oscpu"]
-        self.mime_types = dict_values["browser"]["mimeTypes"].split(";;")
 
         if "devicesBlockedByBrave" in dict_values["os"]:
             self.devices_blocked = True
         else:
             self.devices_blocked = False
 
-
-        fonts_js_split = dict_values["browser"]["fonts"].split(";;")
-        self.fonts_js = dict()
-        for font in fonts_js_split:
-            font_split = font.split("--")
-            self.fonts_js[font_split[0]] = True if font_split[1] == "true" else False
-
-        self.plugins = dict_values["browser"]["plugins"]
-        try:
-            plugins_tmp = self.plugins.split(";;;")
-            self.plugins = []
-            for plugin in plugins_tmp:
-                self.plugins.append(plugin)
-        except Exception:
-            self.plugins = []
-
-        # Warning : base64 image, maybe use only the hash later
-        try:
-            self.canvas = dict_values["browser"]["canvas"]
-            img_data = self.canvas.split("base64,")[1].encode()
-            img = base64.b64decode(img_data)
-            img = io.BytesIO(img)
-            self.canvas_img = mpimg.imread(img, format='PNG')
-
-        except:
-            self.canvas = None
-            self.canvas_img = None
-
-
         self.web_gl_info = dict_values["os"]["videoCard"].split(";;;")
 
-        # TODO add modernizr
-        tmp_modernizr = dict_values["scanner"]["modernizr"]
-        self.modernizr = dict()
-        for elt in tmp_modernizr:
-            v = elt.split("-")
-            self.modernizr[v[0]] = True if v[1] == "true" else False
-
-
         self.canvas_desc = dict_values["scanner"]["canvasDesc"]
         self.history_desc = dict_values["scanner"]["historyDesc"]
         self.screen_desc = dict_values["scanner"]["screenDesc"]
         self.bind_desc = dict_values["scanner"]["bindDesc"]
         self.timezone_desc = dict_values["scanner"]["timezoneOffsetDesc"]
 
-        # TODO map with new attributes
-        if "overwrittenObjects" in dict_values:
-            self.overwritten_objects = dict_values["overwrittenObjects"]
-            try:
-                tmp_overwritten_objects = self.overwritten_objects.split("~~~")
-                self.overwritten_objects = []
-                for prop in tmp_overwritten_objects:
-                    self.overwritten_objects.append(prop)
-            except Exception:
-                self.overwritten_objects = []
-
         self.accelerometer = dict_values["scanner"]["accelerometerUsed"]
         try:
             self.product_sub = dict_values["scanner"]["productSub"]
@@ -125,16 +106,6 @@ class Fingerprint():
         self.etsl = dict_values["scanner"]["etsl"]
         self.touch_support = dict_values["os"]["touchScreen"]
 
-        self.navigator_prototype = dict_values["scanner"]["navigatorPrototype"]
-        try:
-            navigator_prototype_tmp = self.navigator_prototype.split(";;;")
-            self.navigator_prototype = dict()
-            for prop in navigator_prototype_tmp:
-                elt_tmp = prop.split("~~~")
-                self.navigator_prototype[elt_tmp[0]] = elt_tmp[1]
-        except Exception:
-            self.navigator_prototype = dict()
-
         self.errors_generated = dict_values["scanner"]["errorsGenerated"]
 
 
@@ -142,16 +113,10 @@ class Fingerprint():
 
         self.languages_http = dict_values["browser"]["languageHttp"]
         self.user_agent_http = dict_values["browser"]["userAgentHttp"]
-        parsed_ua_http = user_agent_parser.Parse(self.user_agent_http)
-        # TODO check if both OS are identical (one is extracted in JS and the other in python)
-        self.os_ref_http = parsed_ua_http["os"]["family"]
-        self.browser_ref_http = parsed_ua_http["user_agent"]["family"]
-
-        if self.browser_ref_http == 'Chromium':
-            self.browser_ref_http = 'Chrome'
-        
-        if self.os_ref_http == "Fedora":
-            self.os_ref_http = "Linux"
+        # os_ref_http and browser_ref_http are parsed on first access, the user
+        # agent parser is slow to import and most analyses do not need them.
+        # ua_parser only finds Fedora in user agents containing it
+        if "Fedora" in self.user_agent_http and self._parsed_ua_http["os"]["family"] == "Fedora":
             self.os_ref_js = "Linux"
 
         if 'fpjs2' in dict_values:
@@ -187,7 +152,7 @@ class Fingerprint():
 
             self.real_browser = BROWSER_MAPPING[dict_values["realBrowser"]]
 
-            if self.browser_ref_http == 'Chrome Mobile' and self.real_browser == 'Chrome':
+            if self.real_browser == 'Chrome' and self.browser_ref_http == 'Chrome Mobile':
                 self.real_browser = 'Chrome Mobile'
                 self.browser_ref_js = self.browser_ref_http
 
@@ -195,6 +160,133 @@ class Fingerprint():
             self.real_version = dict_values["realVersion"]
             self.countermeasure = dict_values["countermeasure"]
 
+    @lazy_attribute
+    def _parsed_ua_http(self):
+        from ua_parser import user_agent_parser
+        return user_agent_parser.Parse(self.user_agent_http)
+
+    @lazy_attribute
+    def os_ref_http(self):
+        # TODO check if both OS are identical (one is extracted in JS and the other in python)
+        os_ref_http = self._parsed_ua_http["os"]["family"]
+        if os_ref_http == "Fedora":
+            os_ref_http = "Linux"
+        return os_ref_http
+
+    @lazy_attribute
+    def browser_ref_http(self):
+        browser_ref_http = self._parsed_ua_http["user_agent"]["family"]
+        if browser_ref_http == 'Chromium':
+            browser_ref_http = 'Chrome'
+        return browser_ref_http
+
+    @lazy_attribute.reading("os.languages")
+    def languages(self):
+        try:
+            tmp_languages = self._raw_values["os"]["languages"].split("~~")
+            languages = []
+            for language in tmp_languages:
+                languages.append(language)
+        except Exception:
+            languages = []
+        return languages
+
+    @lazy_attribute.reading("os.resolution")
+    def screen_resolution(self):
+        tmp_resolution = self._raw_values["os"]["resolution"].split(",")
+        return tmp_resolution[0] + "," + tmp_resolution[1]
+
+    @lazy_attribute.reading("os.resolution")
+    def available_screen_resolution(self):
+        tmp_resolution = self._raw_values["os"]["resolution"].split(",")
+        return tmp_resolution[2] + "," + tmp_resolution[3]
+
+    @lazy_attribute.reading("browser.mimeTypes")
+    def mime_types(self):
+        return self._raw_values["browser"]["mimeTypes"].split(";;")
+
+    @lazy_attribute.reading("browser.fonts")
+    def fonts_js(self):
+        fonts_js_split = self._raw_values["browser"]["fonts"].split(";;")
+        fonts_js = dict()
+        for font in fonts_js_split:
+            font_split = font.split("--")
+            fonts_js[font_split[0]] = True if font_split[1] == "true" else False
+        return fonts_js
+
+    @lazy_attribute.reading("browser.plugins")
+    def plugins(self):
+        try:
+            plugins_tmp = self._raw_values["browser"]["plugins"].split(";;;")
+            plugins = []
+            for plugin in plugins_tmp:
+                plugins.append(plugin)
+        except Exception:
+            plugins = []
+        return plugins
+
+    @lazy_attribute.reading("browser.canvas")
+    def canvas_img(self):
+        # Warning : base64 image, maybe use only the hash later
+        from canvas_decoder import decode_canvas_uri
+        try:
+            # uint8 RGBA values: the pixels analysis compares the RGB values on
+            # the 0-255 scale and counts the pixels with a zero alpha
+            canvas_img = decode_canvas_uri(self._raw_values["browser"]["canvas"])
+        except:
+            return None
+        # analyses must not modify the canvas, so it can be shared between scans
+        canvas_img.setflags(write=False)
+        return canvas_img
+
+    @lazy_attribute.reading("browser.canvas")
+    def canvas_hash(self):
+        # hash of the data URI, to look the canvas up without decoding it
+        from canvas_index import canvas_uri_hash
+        return canvas_uri_hash(self._raw_values["browser"].get("canvas"))
+
+    @lazy_attribute.reading("browser.canvas")
+    def canvas(self):
+        # None when the canvas could not be decoded
+        if self.canvas_img is None:
+            return None
+        return self._raw_values["browser"]["canvas"]
+
+    @lazy_attribute.reading("scanner.modernizr")
+    def modernizr(self):
+        # TODO add modernizr
+        modernizr = dict()
+        for elt in self._raw_values["scanner"]["modernizr"]:
+            v = elt.split("-")
+            modernizr[v[0]] = True if v[1] == "true" else False
+        return modernizr
+
+    @lazy_attribute.reading("overwrittenObjects")
+    def overwritten_objects(self):
+        # TODO map with new attributes
+        if "overwrittenObjects" not in self._raw_values:
+            raise AttributeError("overwritten_objects")
+        try:
+            tmp_overwritten_objects = self._raw_values["overwrittenObjects"].split("~~~")
+            overwritten_objects = []
+            for prop in tmp_overwritten_objects:
+                overwritten_objects.append(prop)
+        except Exception:
+            overwritten_objects = []
+        return overwritten_objects
+
+    @lazy_attribute.reading("scanner.navigatorPrototype")
+    def navigator_prototype(self):
+        try:
+            navigator_prototype_tmp = self._raw_values["scanner"]["navigatorPrototype"].split(";;;")
+            navigator_prototype = dict()
+            for prop in navigator_prototype_tmp:
+                elt_tmp = prop.split("~~~")
+                navigator_prototype[elt_tmp[0]] = elt_tmp[1]
+        except Exception:
+            navigator_prototype = dict()
+        return navigator_prototype
+
     def __str__(self):
         return 'ID: {}' \
                'Real browser: {}, browser claimed: {}\n' \
@@ -1,31 +1,163 @@
-from pymongo import MongoClient
+import threading
+from collections import OrderedDict, defaultdict
+from itertools import islice
+from pymongo import ASCENDING, MongoClient
 from fingerprint import Fingerprint
 from bson.objectid import ObjectId
+from profiler import profile_stage
+from metrics import LOADED
+
+# indexes of the fields the fingerprints are filtered on: the countermeasure
+# and the ground truth. The scan timestamp is the one of the ObjectId, the
+# _id index already sorts the fingerprints by it
+INDEXES = [
+    [("countermeasure", ASCENDING)],
+    [("realOS", ASCENDING), ("realBrowser", ASCENDING), ("realVersion", ASCENDING)],
+]
+
 
 class FingerprintDataManager:
-    def __init__(self):
-        self.client = MongoClient()
+    def __init__(self, client=None, max_pool_size=100, cache_size=1024, create_indexes=False):
+        """
+            client is a MongoClient (or a mongomock one), created with
+            max_pool_size connections at most if it is None.
+            cache_size is the number of fingerprints kept by get_fingerprint.
+            The indexes are only created with create_indexes, it needs a user
+            allowed to, see the create-indexes command of main.py
+        """
+        self.client = client if client is not None else MongoClient(maxPoolSize=max_pool_size)
         self.db = self.client.usenix18
         self.collection = self.db.fingerprint
+        # StageProfiler used to profile Mongo fetches and fingerprints construction
+        self.profiler = None
+        # MetricsRegistry counting the fingerprints loaded
+        self.metrics = None
+        # least recently used fingerprint first
+        self.cache_size = cache_size
+        self.__cache = OrderedDict()
+        # get_fingerprint is called by the threads of the scanners
+        self.__cache_lock = threading.Lock()
+        if create_indexes:
+            self.create_indexes()
+
+    def create_indexes(self):
+        # does nothing when the indexes already exist
+        for keys in INDEXES:
+            self.collection.create_index(keys)
 
     def get_all_fingerprints(self):
         fps = self.collection.find()
-        fp_objects = []
-        for fingerprint in fps:
-            fp_objects.append(Fingerprint(fingerprint))
-
-        return fp_objects
+        return self.__build_fingerprints(fps)
 
     def get_fingerprints_countermeasure(self, countermeasure):
         fps = self.collection.find({'countermeasure': countermeasure})
+        return self.__build_fingerprints(fps)
+
+    def get_prefiltered_fingerprints(self, query=None, analyses=None, guess_real_info=True, run_all=True):
+        """
+            Fingerprints matching query, with the verdicts of the analyses that
+            only compare fields of the document computed by MongoDB. The large
+            fields are only fetched for the fingerprints whose scan reads them,
+            see mongo_prefilter.py
+        """
+        return self.__build_fingerprints(self.iter_documents(query, True, analyses, guess_real_info, run_all))
+
+    def iter_fingerprints(self, query=None, prefilter=False, analyses=None, guess_real_info=True, run_all=True):
+        """
+            Fingerprints of iter_documents, created while the cursor is read
+            instead of all at once
+        """
+        for document in self.iter_documents(query, prefilter, analyses, guess_real_info, run_all):
+            if self.metrics is not None:
+                self.metrics.increment(LOADED)
+            yield Fingerprint(document)
+
+    def iter_documents(self, query=None, prefilter=False, analyses=None, guess_real_info=True, run_all=True,
+                       batch_size=256):
+        """
+            Documents matching query, read while the cursor is read, e.g. to
+            create the fingerprints in other threads. With prefilter, they come
+            from the pipeline of get_prefiltered_fingerprints: the large fields
+            the scans read are fetched with one query per batch_size documents
+        """
+        if not prefilter:
+            yield from self.collection.find(query or {})
+            return
+
+        from mongo_prefilter import add_fields, large_fields, prefilter_pipeline
+        cursor = self.collection.aggregate(prefilter_pipeline(query))
+        while True:
+            documents = list(islice(cursor, batch_size))
+            if not documents:
+                break
+            # one query per set of large fields, usually all of them, or
+            # none for the documents MongoDB already found inconsistent
+            documents_by_fields = defaultdict(list)
+            for document in documents:
+                fields = large_fields(document, analyses, run_all, guess_real_info)
+                if fields:
+                    documents_by_fields[tuple(fields)].append(document)
+            for fields, batch in documents_by_fields.items():
+                cursor_fields = self.collection.find({"_id": {"$in": [document["_id"] for document in batch]}},
+                                                     {field: 1 for field in fields})
+                fetched_documents = {fetched_document["_id"]: fetched_document for fetched_document in cursor_fields}
+                for document in batch:
+                    add_fields(document, fields, fetched_documents.get(document["_id"], dict()))
+            yield from documents
+
+    def get_fingerprints(self, fingerprint_ids, batch_size=1000):
+        """
+            Fingerprints of a list of ids (str or ObjectId), in the same order,
+            fetched with one query per batch_size ids. Unknown ids are skipped
+        """
+        object_ids = [ObjectId(fingerprint_id) for fingerprint_id in fingerprint_ids]
+        fingerprints_by_id = dict()
+        for start in range(0, len(object_ids), batch_size):
+            batch = object_ids[start:start + batch_size]
+            cursor = self.collection.find({"_id": {"$in": batch}})
+            for fingerprint in self.__build_fingerprints(cursor):
+                fingerprints_by_id[fingerprint._id] = fingerprint
+        return [fingerprints_by_id[object_id] for object_id in object_ids if object_id in fingerprints_by_id]
+
+    def __build_fingerprints(self, cursor):
         fp_objects = []
-        for fingerprint in fps:
-            fp_objects.append(Fingerprint(fingerprint))
+        while True:
+            with profile_stage(self.profiler, "mongo_fetch"):
+                fingerprint = next(cursor, None)
+            if fingerprint is None:
+                break
+            with profile_stage(self.profiler, "fingerprint_construction"):
+                fp_objects.append(Fingerprint(fingerprint))
+            if self.metrics is not None:
+                self.metrics.increment(LOADED)
 
         return fp_objects
 
     """
-        Takes as input a mongodb id and returns the associated fingerprint
+        Takes as input a mongodb id and returns the associated fingerprint,
+        the last cache_size fingerprints asked are kept
     """
     def get_fingerprint(self, fingerprint_id):
-        return Fingerprint(self.collection.find({"_id": ObjectId(fingerprint_id)})[0])
+        object_id = ObjectId(fingerprint_id)
+        with self.__cache_lock:
+            fingerprint = self.__cache.get(object_id)
+            if fingerprint is not None:
+                self.__cache.move_to_end(object_id)
+        if self.metrics is not None:
+            self.metrics.record_cache("fingerprint", fingerprint is not None)
+        if fingerprint is not None:
+            return fingerprint
+
+        document = self.collection.find_one({"_id": object_id})
+        if document is None:
+            # same error as the former find(...)[0]
+            raise IndexError("no fingerprint with id {}".format(fingerprint_id))
+        fingerprint = Fingerprint(document)
+        if self.metrics is not None:
+            self.metrics.increment(LOADED)
+        if self.cache_size > 0:
+            with self.__cache_lock:
+                self.__cache[object_id] = fingerprint
+                if len(self.__cache) > self.cache_size:
+                    self.__cache.popitem(last=False)
+        return fingerprint
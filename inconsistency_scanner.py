@@ -1,7 +1,17 @@
 import numpy as np
-import json
-from scipy import ndimage
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from functools import partial
+from canvas_index import CanvasIndex
+from canvas_layout import CanvasLayout
+from cost_estimator import CostEstimator
+from expected_profile import ExpectedProfile, ALL_PLUGIN_EXTENSIONS
+from feature_vectors import FeatureVectors
 from fingerprint import Fingerprint
+from metrics import SCANNED, ANALYSIS_SKIPPED
+from rule_data import RuleData
 
 
 def filter_isolated_cells(array, struct):
@@ -10,6 +20,7 @@ def filter_isolated_cells(array, struct):
     :param struct: Structure array for generating unique regions
     :return: Array with minimum region size > 1
     """
+    from scipy import ndimage
 
     filtered_array = np.copy(array)
     id_regions, num_ids = ndimage.label(filtered_array, structure=struct)
@@ -19,6 +30,110 @@ def filter_isolated_cells(array, struct):
     return filtered_array
 
 
+def count_color_pixels(img, color, max_norm):
+    """ Count the pixels of an RGB(A) image equal and close to a color
+    :param img: uint8 image array, like canvas_img, it is not modified
+    :param color: Color to look for on the 0-255 scale, only its RGB components are used
+    :param max_norm: Pixels at a distance in ]0, max_norm[ of color are close
+    :return: Tuple (number of equal pixels, number of close pixels)
+    """
+
+    # integer squared distances, compared to the squared max_norm
+    diff = img[:, :, :3].astype(np.int32) - np.asarray(color[:3], dtype=np.int32)
+    distances = np.sum(diff * diff, axis=2)
+    nb_equals = np.count_nonzero(distances == 0)
+    nb_close = np.count_nonzero((distances < max_norm * max_norm) & (distances > 0))
+    return nb_equals, nb_close
+
+
+def isolated_pixels(mask):
+    """ Find the completely isolated single cells of a binary image
+    :param mask: Binary array, it is not modified
+    :return: Boolean array, True on the isolated cells
+    """
+
+    filtered_array = filter_isolated_cells(mask, struct=np.ones((3, 3)))
+    return mask != filtered_array
+
+
+def count_isolated_pixels(mask):
+    """ Count the completely isolated single cells of a binary image
+    :param mask: Binary array, it is not modified
+    :return: Number of isolated cells
+    """
+
+    return np.count_nonzero(isolated_pixels(mask))
+
+
+# size of the canvas drawn by the fingerprinting script
+CANVAS_NB_PIXELS = 24000
+# the canvas is inconsistent above this number of isolated pixels
+MAX_ISOLATED_PIXELS = 8
+
+
+def are_canvas_pixels_consistent(canvas_blocked, nb_color_equals, nb_color_close, nb_transparent_pixels,
+                                 nb_isolated_pixels, number_transparent_pixels):
+    """ Decision of CANVAS_PIXELS from the raw pixel counts
+    Works on scalars and on numpy arrays of counts (and of thresholds
+    broadcast against them), to evaluate other thresholds without rescanning
+    :return: True (or array of True) if the canvas is consistent
+    """
+
+    color_failed = (nb_color_equals == 0) | (7 * nb_color_equals < nb_color_close)
+    transparency_failed = (nb_transparent_pixels < number_transparent_pixels) | \
+                          (nb_transparent_pixels == CANVAS_NB_PIXELS)
+    return ~(canvas_blocked | color_failed | transparency_failed | (nb_isolated_pixels > MAX_ISOLATED_PIXELS))
+
+
+class Analysis(IntEnum):
+    """
+        Fixed index of the analyses run by check_fingerprint, in the order
+        they are run. The value is the bit used for the analysis in the
+        ScanOutcome masks, the member name is the AnalysisResult name
+    """
+    SAME_UAS = 0
+    PLATFORM_OS_REF = 1
+    MQ_OS = 2
+    PLUGINS_OS = 3
+    WEBGL_OS = 4
+    FONTS_OS = 5
+    MULTIMEDIA_DEVICES_OS = 6
+    ETSL = 7
+    PRODUCT_SUB = 8
+    ERRORS_BROWSER = 9
+    FEATURES_BROWSER = 10
+    NAVIGATOR_OVERWRITTEN = 11
+    CANVAS_OVERWRITTEN = 12
+    TIMEZONE_OVERWRITTEN = 13
+    SCREEN_OVERWRITTEN = 14
+    ACCELEROMETER = 15
+    TOUCH_SUPPORT = 16
+    CANVAS_PIXELS = 17
+
+
+# counts recorded by scan_fingerprint(record_raw_metrics=True),
+# everything the decision of the analyses depending on a threshold needs
+RAW_METRICS = [
+    "nb_wrong_fonts", "nb_wrong_features", "canvas_blocked", "nb_color_equals",
+    "nb_color_close", "nb_transparent_pixels", "nb_isolated_pixels"
+]
+
+# bitmask of the analyses whose decision depends on a threshold of the scanner
+THRESHOLD_ANALYSES = (1 << Analysis.FONTS_OS) | (1 << Analysis.FEATURES_BROWSER) | (1 << Analysis.CANVAS_PIXELS)
+
+
+# analyses whose verdict can be computed by MongoDB (see mongo_prefilter.py),
+# with the data of their AnalysisResult when the fingerprint is inconsistent
+PREFILTERED_ANALYSES = {
+    Analysis.SAME_UAS: lambda fingerprint: {},
+    Analysis.CANVAS_OVERWRITTEN: lambda fingerprint: {},
+    Analysis.SCREEN_OVERWRITTEN: lambda fingerprint: {},
+    Analysis.TIMEZONE_OVERWRITTEN: lambda fingerprint: {},
+    Analysis.ETSL: lambda fingerprint: {"etsl": fingerprint.etsl},
+    Analysis.PRODUCT_SUB: lambda fingerprint: {"product_sub": fingerprint.product_sub},
+}
+
+
 class Scanner:
     SAME_UAS = "SAME_UAS"
     PLATFORM_OS_REF = "PLATFORM_OS_REF"
@@ -58,18 +173,122 @@ class Scanner:
         ERRORS_BROWSER, FEATURES_BROWSER, ETSL, PRODUCT_SUB
     }
 
-    def __init__(self, number_wrong_fonts, number_wrong_features, number_transparent_pixels):
-        self.font_to_os = dict()
-        with open("./experiments/fonts_linked.csv", "r") as f:
-            for line in f:
-                l_split = line.split(",")
-                self.font_to_os[l_split[0]] = l_split[1]
+    def __init__(self, number_wrong_fonts, number_wrong_features, number_transparent_pixels, canvas_roi=False,
+                 canvas_index=None, flag_foreign_canvases=False):
+        # to create the same scanner in other processes
+        self.parameters = dict(number_wrong_fonts=number_wrong_fonts, number_wrong_features=number_wrong_features,
+                               number_transparent_pixels=number_transparent_pixels, canvas_roi=canvas_roi,
+                               canvas_index=canvas_index, flag_foreign_canvases=flag_foreign_canvases)
+        # fonts and caniuse data, replaced as a whole when the files change (see
+        # rule_data.py). A scan uses the RuleData it started with, pinned per thread
+        self.rule_data = RuleData.load()
+        self.__pinned = threading.local()
 
         self.number_wrong_fonts = number_wrong_fonts
         self.number_wrong_features = number_wrong_features
         self.number_transparent_pixels = number_transparent_pixels
+        # with canvas_roi, the pixels analysis only looks at the regions
+        # of the canvas where a modification is expected, see canvas_layout.py
+        self.canvas_layout = CanvasLayout() if canvas_roi else None
+        # canvas_index is None or the file of a CanvasIndex: the canvases of genuine
+        # browsers of the same platform are consistent without analysing their pixels.
+        # With flag_foreign_canvases, a canvas only seen on other platforms is inconsistent
+        self.canvas_index = None
+        if canvas_index is not None:
+            self.canvas_index = CanvasIndex.load(canvas_index)
+            self.canvas_index.check_parameters(self.pixels_parameters)
+        self.flag_foreign_canvases = flag_foreign_canvases
+
+        # ExpectedProfile by (browser, browser version, OS) claimed in the UA
+        self.__expected_profiles = dict()
+
+        # analyses run before the pixels one, in Analysis order
+        self.__analyses = [
+            (Analysis.SAME_UAS, self.__are_uas_identical),
+            (Analysis.PLATFORM_OS_REF, self.__is_platform_os_ref_consistent),
+            (Analysis.MQ_OS, self.__are_mq_os_consistent),
+            (Analysis.PLUGINS_OS, self.__are_plugins_consistent_os),
+            (Analysis.WEBGL_OS, self.__is_webgl_consistent_os),
+            (Analysis.FONTS_OS, self.__are_font_consistent_os),
+            (Analysis.MULTIMEDIA_DEVICES_OS, self.__are_devices_blocked),
+            (Analysis.ETSL, self.__is_etsl_consistent_browser),
+            (Analysis.PRODUCT_SUB, self.__is_product_sub_consistent_browser),
+            (Analysis.ERRORS_BROWSER, self.__are_errors_consistent_browser),
+            (Analysis.FEATURES_BROWSER, self.__are_features_consistent_browser),
+            (Analysis.NAVIGATOR_OVERWRITTEN, self.__is_navigator_overwritten),
+            (Analysis.CANVAS_OVERWRITTEN, self.__is_canvas_overwritten),
+            (Analysis.TIMEZONE_OVERWRITTEN, self.__is_timezone_overwritten),
+            (Analysis.SCREEN_OVERWRITTEN, self.__is_screen_overwritten),
+            (Analysis.ACCELEROMETER, self.__is_accelerometer_consistent),
+            (Analysis.TOUCH_SUPPORT, self.__is_touch_support_consistent),
+        ]
+        # the verdicts of these analyses may have been computed by MongoDB
+        self.__analyses = [(analysis, partial(self.__use_prefilter, analysis, analysis_method))
+                           if analysis in PREFILTERED_ANALYSES else (analysis, analysis_method)
+                           for analysis, analysis_method in self.__analyses]
+        self.__pixels_analysis = (Analysis.CANVAS_PIXELS,
+                                  partial(self.__are_canvas_pixels_consistent, all_tests=False))
+
+        # StageProfiler used to profile each analysis, see profiler.py
+        self.profiler = None
+        # MetricsRegistry updated by each scan, see metrics.py
+        self.metrics = None
+        # execution time of the analyses, learnt from the timed scans
+        # and used by the scans with a deadline
+        self.cost_estimator = CostEstimator()
+
+    @property
+    def font_to_os(self):
+        return self.__rule_data().font_to_os
+
+    @property
+    def caniuse_features(self):
+        return self.__rule_data().caniuse_features
+
+    @property
+    def feature_vectors(self):
+        return self.__rule_data().feature_vectors
+
+    @property
+    def data_version(self):
+        return self.rule_data.version
+
+    def __rule_data(self):
+        rule_data = getattr(self.__pinned, "rule_data", None)
+        return rule_data if rule_data is not None else self.rule_data
+
+    @contextmanager
+    def pin_rule_data(self):
+        """
+            The analyses run in the block read the current RuleData,
+            even if the scanner gets a new one meanwhile. The scan of a
+            fingerprint and the guess of its real information run in the
+            same block, so the guess uses the RuleData of the scan
+        """
+        if getattr(self.__pinned, "rule_data", None) is not None:
+            # nested scan, already pinned
+            yield self.__pinned.rule_data
+            return
+        self.__pinned.rule_data = self.rule_data
+        try:
+            yield self.__pinned.rule_data
+        finally:
+            self.__pinned.rule_data = None
+
+    @property
+    def pixels_parameters(self):
+        """
+            Parameters of the scanner the verdict of the pixels analysis depends on
+        """
+        return dict(number_transparent_pixels=self.number_transparent_pixels,
+                    canvas_roi=self.canvas_layout is not None)
 
-        self.caniuse_features = self.__read_caniusefeatures()
+    def are_canvas_pixels_consistent(self, fingerprint: Fingerprint):
+        """
+            Verdict of the pixels analysis computed from the pixels of the
+            canvas, without the canvas index. Used to build the index
+        """
+        return self.__are_canvas_pixels_consistent(fingerprint, False, all_tests=False, use_index=False)[0]
 
     def should_be_consistent(self, fingerprint: Fingerprint):
         """
@@ -88,52 +307,163 @@ class Scanner:
             Returns a list of AnalysisResult objects containing
             the details of each analysis
         """
-        analyses_results = []
+        with self.pin_rule_data():
+            return [AnalysisResult(analysis.name, consistent, data if data is not None else {}, raw_metrics)
+                    for analysis, (consistent, data, raw_metrics)
+                    in self.__run_analyses(fingerprint, run_all, only_pixels, details=True)]
+
+    def scan_fingerprint(self, fingerprint: Fingerprint, run_all=True, only_pixels=False, record_raw_metrics=False,
+                         deadline=None, without_pixels=False):
+        """
+            Same analyses as check_fingerprint but returns a compact
+            ScanOutcome: bitmasks of the analyses run and failed,
+            and the data of the failed analyses only.
+            If record_raw_metrics is True, the ScanOutcome also holds the
+            counts compared to the thresholds of the scanner (see RAW_METRICS),
+            the pixels analysis then computes all its counts.
+            deadline is None or a time.perf_counter() value: the cheapest
+            analyses run first, and an analysis whose estimated cost doesn't
+            fit in the time left is skipped and marked in the ScanOutcome.
+            without_pixels runs all the analyses but the pixels one, which
+            can be run later with only_pixels and merged (see ScanOutcome.merge)
+        """
+        with self.pin_rule_data() as rule_data:
+            return self.__scan_outcome(fingerprint, run_all, only_pixels, record_raw_metrics, deadline,
+                                       without_pixels, rule_data.version)
+
+    def __scan_outcome(self, fingerprint: Fingerprint, run_all, only_pixels, record_raw_metrics, deadline,
+                       without_pixels, data_version):
+        ran = 0
+        failed = 0
+        skipped = 0
+        details = None
+        raw_metrics = dict() if record_raw_metrics else None
+        # the consistent analyses only build their data to record the raw metrics
+        if deadline is None:
+            analyses_results = self.__run_analyses(fingerprint, run_all, only_pixels, record_raw_metrics,
+                                                   without_pixels, record_raw_metrics)
+        else:
+            analyses_results = self.__run_analyses_before(fingerprint, deadline, run_all, only_pixels,
+                                                          record_raw_metrics, without_pixels, record_raw_metrics)
+
+        for analysis, result in analyses_results:
+            if result is None:
+                skipped |= 1 << analysis
+                continue
+            ran |= 1 << analysis
+            consistent, data, result_raw_metrics = result
+            if not consistent:
+                failed |= 1 << analysis
+                if details is None:
+                    details = dict()
+                details[analysis] = data if data is not None else {}
+            if record_raw_metrics and result_raw_metrics is not None:
+                raw_metrics.update(result_raw_metrics)
+
+        return ScanOutcome(ran, failed, details, raw_metrics, skipped, data_version)
+
+    def __expected_profile(self, fingerprint: Fingerprint):
+        claim = (fingerprint.browser_ref_js, fingerprint.browser_version_ref_js, fingerprint.os_ref_js)
+        expected_profile = self.__expected_profiles.get(claim)
+        if self.metrics is not None:
+            self.metrics.record_cache("expected_profile", expected_profile is not None)
+        if expected_profile is None:
+            expected_profile = ExpectedProfile(*claim)
+            self.__expected_profiles[claim] = expected_profile
+        return expected_profile
+
+    def __run_analyses(self, fingerprint: Fingerprint, run_all, only_pixels, all_pixels_tests=False,
+                       without_pixels=False, details=False):
+        """
+            Runs the analyses in Analysis order and yields (Analysis,
+            (is_consistent, data, raw_metrics)) tuples. Unless run_all is
+            True, stops at the first inconsistency. Unless details is True,
+            data and raw_metrics may be None for a consistent analysis
+        """
+        if self.metrics is not None and not only_pixels:
+            # a pixels analysis run apart belongs to a fingerprint already counted
+            self.metrics.increment(SCANNED)
+
+        is_consistent = True
         if not only_pixels:
-            analyses_results.append(self.__are_uas_identical(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_platform_os_ref_consistent(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__are_mq_os_consistent(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__are_plugins_consistent_os(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_webgl_consistent_os(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__are_font_consistent_os(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__are_devices_blocked(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_etsl_consistent_browser(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_product_sub_consistent_browser(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__are_errors_consistent_browser(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__are_features_consistent_browser(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_navigator_overwritten(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_canvas_overwritten(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_timezone_overwritten(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_screen_overwritten(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_accelerometer_consistent(fingerprint))
-            if analyses_results[-1].is_consistent or run_all:
-                analyses_results.append(self.__is_touch_support_consistent(fingerprint))
-
-        if run_all or only_pixels or analyses_results[-1].is_consistent:
-            analyses_results.append(self.__are_canvas_pixels_consistent(fingerprint, all_tests=False))
+            for analysis, analysis_method in self.__analyses:
+                result = self.__run_analysis(analysis, analysis_method, fingerprint, details)
+                yield analysis, result
+                is_consistent = result[0]
+                if not is_consistent and not run_all:
+                    break
 
-        return analyses_results
+        if not without_pixels and (run_all or only_pixels or is_consistent):
+            analysis, analysis_method = self.__pixels_analysis
+            if all_pixels_tests:
+                analysis_method = self.__are_canvas_pixels_consistent
+            yield analysis, self.__run_analysis(analysis, analysis_method, fingerprint, details)
+
+    def __run_analyses_before(self, fingerprint: Fingerprint, deadline, run_all, only_pixels, all_pixels_tests,
+                              without_pixels, details):
+        """
+            Same as __run_analyses, but in increasing order of estimated cost,
+            and yields (Analysis, None) for the analyses skipped because
+            they would end after deadline
+        """
+        if self.metrics is not None and not only_pixels:
+            self.metrics.increment(SCANNED)
+
+        analyses = []
+        if not only_pixels:
+            # sort is stable, analyses never observed keep the Analysis order
+            analyses = sorted(self.__analyses, key=lambda x: self.cost_estimator.estimate(x[0]))
+        # the most expensive analysis, run last as in __run_analyses
+        if not without_pixels:
+            pixels_analysis, pixels_method = self.__pixels_analysis
+            if all_pixels_tests:
+                pixels_method = self.__are_canvas_pixels_consistent
+            analyses.append((pixels_analysis, pixels_method))
+
+        is_consistent = True
+        for analysis, analysis_method in analyses:
+            if not is_consistent and not run_all:
+                break
+            if time.perf_counter() + self.cost_estimator.estimate(analysis) > deadline:
+                self.cost_estimator.skip(analysis)
+                if self.metrics is not None:
+                    self.metrics.increment(ANALYSIS_SKIPPED, (("analysis", analysis.name),))
+                yield analysis, None
+                continue
+
+            result = self.__run_analysis(analysis, analysis_method, fingerprint, details, timed=True)
+            yield analysis, result
+            is_consistent = result[0]
+
+    def __run_analysis(self, analysis, analysis_method, fingerprint: Fingerprint, details, timed=False):
+        if self.profiler is None and self.metrics is None and not timed:
+            return analysis_method(fingerprint, details)
+
+        start = time.perf_counter()
+        if self.profiler is None:
+            result = analysis_method(fingerprint, details)
+        else:
+            with self.profiler.stage(analysis.name):
+                result = analysis_method(fingerprint, details)
+
+        elapsed_time = time.perf_counter() - start
+        self.cost_estimator.observe(analysis, elapsed_time)
+        if self.metrics is not None:
+            self.metrics.observe_analysis(analysis.name, elapsed_time, result[0])
+        return result
 
     def guess_real_info(self, fingerprint: Fingerprint, analyses_results):
         """
             If fingerprint has an inconsistency, tries to guess real information
             such as browser family, browser version and OS
+            analyses_results is a list of AnalysisResult or a ScanOutcome
         """
+        with self.pin_rule_data():
+            return self.__guess_real_info(fingerprint, analyses_results)
+
+    def __guess_real_info(self, fingerprint: Fingerprint, analyses_results):
+        if isinstance(analyses_results, ScanOutcome):
+            analyses_results = analyses_results.to_analysis_results()
 
         failed_os_analyses = set()
         failed_browser_analyses = set()
@@ -370,7 +700,21 @@ class Scanner:
 
         return real_os, real_browser_family, real_browser_version
 
-    def __are_uas_identical(self, fingerprint: Fingerprint):
+    def __use_prefilter(self, analysis, analysis_method, fingerprint: Fingerprint, details):
+        """
+            Result of analysis from the verdict computed by MongoDB if there is
+            one for the browser of the fingerprint, else runs analysis_method
+        """
+        prefilter = fingerprint.prefilter
+        if prefilter is None or prefilter.get(analysis.name) is None or \
+                prefilter.get("browser") != fingerprint.browser_ref_js:
+            return analysis_method(fingerprint, details)
+
+        if prefilter[analysis.name]:
+            return True, None, None
+        return False, PREFILTERED_ANALYSES[analysis](fingerprint), None
+
+    def __are_uas_identical(self, fingerprint: Fingerprint, details):
         """
             Analysis name: SAME_UAS
             Checks if ua http and ua navigator are the same
@@ -382,125 +726,63 @@ class Scanner:
                             (fingerprint.os_ref_js == fingerprint.os_ref_http)
         else:
             is_consistent = fingerprint.user_agent_js == fingerprint.user_agent_http
-        return AnalysisResult(Scanner.SAME_UAS, is_consistent, data={})
+        return is_consistent, None, None
 
-    def __is_platform_os_ref_consistent(self, fingerprint: Fingerprint):
+    def __is_platform_os_ref_consistent(self, fingerprint: Fingerprint, details):
         """
             Analysis name: PLATFORM_OS_REF
             Checks if navigator platform attribute is consistent with OS
             using user agent
         """
-        os_to_platforms = {
-            "Linux": ["Linux i686", "Linux x86_64"],
-            "Ubuntu": ["Linux x86_64", "Linux i686"],
-            "Fedora": ["Linux i686", "Linux x86_64"],
-            "FreeBSD": ["FreeBSD amd64", "FreeBSD i386", "OpenBSD amd64"],
-            "OpenBSD": ["OpenBSD amd64", "OpenBSD i386"],
-            "NetBSD": ["NetBSD amd64"],
-            "Windows 7": ["Win32", "Win64"],
-            "Windows 8": ["Win32", "Win64"],
-            "Windows 8.1": ["Win32", "Win64"],
-            "Windows 10": ["Win32", "Win64"],
-            "Windows Vista": ["Win32", "Win64"],
-            "Mac OS": ["MacIntel"],
-            "Other": ["Other", "PlayStation 4", "PlayStation 3", "Nintendo Wii"],
-            "Windows Phone OS": ["ARM", "Win32"],
-            "Windows Phone": ["ARM", "Win32"],
-            "Windows RT": ["ARM"],
-            "iOS": ["iPhone", "iPad"],
-            "Android": ["Linux armv7l", "Linux i686", "Linux armv8l"],
-            "Firefox OS": ['unknown'],
-            'PLAYSTATION': ['PlayStation 3']
-        }
-
-        is_consistent = fingerprint.platform in os_to_platforms[fingerprint.os_ref_js]
+        allowed_platforms = self.__expected_profile(fingerprint).allowed_platforms
+        is_consistent = fingerprint.platform in allowed_platforms
+        if is_consistent and not details:
+            return True, None, None
         data = {"os": fingerprint.os_ref_js, "platform": fingerprint.platform}
-        return AnalysisResult(Scanner.PLATFORM_OS_REF, is_consistent, data)
+        return is_consistent, data, None
 
-    def __are_mq_os_consistent(self, fingerprint: Fingerprint):
+    def __are_mq_os_consistent(self, fingerprint: Fingerprint, details):
         """
             Analysis name: MQ_OS
             Check if media queries about OS are consistent
             with the OS displayed in the user agent
             It also detects inconsistency with the browser (Firefox)
         """
+        any_mq_forbidden, is_mac, firefox_rules = self.__expected_profile(fingerprint).mq_rules
         inconsistent = False
-        data = dict()
+        # only created for an inconsistent fingerprint
+        data = None
         # we test if one one the media query is true and the browser
-        #  is not firefox
+        #  is not firefox
         found = False
         for mq in fingerprint.mq_os:
             if mq:
                 found = True
                 break
 
-        if found and (fingerprint.browser_ref_js != "Firefox" or (fingerprint.browser_ref_js == "Firefox" and \
-                                                                  fingerprint.browser_version_ref_js > 57)):
-            # starting at version 58, these media queries don't exist anymore either in normal mode or when
-            # fingerprinting protection is activated
+        if found and any_mq_forbidden:
             # When fingerprinting protection is activated the UA change the version to 52 which triggers a true positive
-            data["not_firefox"] = True
+            data = {"not_firefox": True}
             inconsistent = True
 
         # mq_os[0] tests mac OS X special theme
-        if fingerprint.mq_os[0] and fingerprint.os_ref_js != "Mac OS X":
+        if fingerprint.mq_os[0] and not is_mac:
+            data = data or dict()
             data["mq_failed"] = "Mac OS X"
             inconsistent = True
 
-        if fingerprint.browser_ref_js == 'Firefox' and fingerprint.browser_version_ref_js < 58:
-            # mq_os[1] tests Windows XP
-            if not inconsistent and \
-                    (fingerprint.mq_os[1] and fingerprint.os_ref_js != "Windows XP") or \
-                    (not fingerprint.mq_os[1] and fingerprint.os_ref_js == "Windows XP" and \
-                     (fingerprint.browser_ref_js == "Firefox" or found)):
-                data["mq_failed"] = "Windows XP"
-                inconsistent = True
-
-            # mq_os[2] tests Windows Vista
-            if not inconsistent and \
-                    (fingerprint.mq_os[2] and fingerprint.os_ref_js != "Windows Vista") or \
-                    (not fingerprint.mq_os[2] and fingerprint.os_ref_js == "Windows Vista" and \
-                     (fingerprint.browser_ref_js == "Firefox" or found)):
-                data["mq_failed"] = "Windows Vista"
-                inconsistent = True
-
-            # mq_os[3] tests Windows 7
+        # only Firefox < 58 has the media queries of the Windows versions
+        for mq_index, os_name, is_os_claimed in firefox_rules:
             if not inconsistent and \
-                    (fingerprint.mq_os[3] and fingerprint.os_ref_js != "Windows 7") or \
-                    (not fingerprint.mq_os[3] and fingerprint.os_ref_js == "Windows 7" and \
-                     (fingerprint.browser_ref_js == "Firefox" or found)):
-                data["mq_failed"] = "Windows 7"
+                    (fingerprint.mq_os[mq_index] and not is_os_claimed) or \
+                    (not fingerprint.mq_os[mq_index] and is_os_claimed):
+                data = data or dict()
+                data["mq_failed"] = os_name
                 inconsistent = True
 
-            # mq_os[4] tests Windows 8
-            # Warning, may fail if Windows 8.1?
-            if not inconsistent and \
-                    (fingerprint.mq_os[4] and "Windows 8" not in fingerprint.os_ref_js) or \
-                    (not fingerprint.mq_os[4] and "Windows 8" in fingerprint.os_ref_js and \
-                     (fingerprint.browser_ref_js == "Firefox" or found)):
-                data["mq_failed"] = "Windows 8"
-                inconsistent = True
-
-            # Duplicate for Windows 8.1
-            # May be removed later
-            if not inconsistent and \
-                    (fingerprint.mq_os[4] and fingerprint.os_ref_js != "Windows 8.1") or \
-                    (not fingerprint.mq_os[4] and fingerprint.os_ref_js == "Windows 8.1" and \
-                     (fingerprint.browser_ref_js == "Firefox" or found)):
-                data["mq_failed"] = "Windows 8.1"
-                inconsistent = True
-
-            # mq_os[5] tests Windows 10
-            if not inconsistent and \
-                    (fingerprint.mq_os[5] and fingerprint.os_ref_js != "Windows 10") or \
-                    (not fingerprint.mq_os[5] and fingerprint.os_ref_js == "Windows 10" and \
-                     (fingerprint.browser_ref_js == "Firefox" or found)):
-                data["mq_failed"] = "Windows 10"
-                inconsistent = True
+        return not inconsistent, data, None
 
-        return AnalysisResult(Scanner.MQ_OS, not inconsistent, data)
-
-    def __are_plugins_consistent_os(self, fingerprint: Fingerprint):
+    def __are_plugins_consistent_os(self, fingerprint: Fingerprint, details):
         """
             Analysis name: PLUGIN_OS
             Checks if plugins filename extension is consistent with the OS
@@ -509,36 +791,30 @@ class Scanner:
             On Windows .dll
             Some OSes shouldn't have plugins such as Android or iOS
         """
-        # Default case, everything is forbidden
-        forbidden_extensions = [".so", ".dll", ".plugin"]
         if "arm" in fingerprint.platform.lower():
-            forbidden_extensions = [".so", ".dll", ".plugin"]
-        elif fingerprint.os_ref_js != "Windows Phone" and "Windows" in fingerprint.os_ref_js:
-            forbidden_extensions = [".so", ".plugin"]
-        elif "Mac OS X" in fingerprint.os_ref_js:
-            forbidden_extensions = [".so", ".dll"]
-        elif "Linux" in fingerprint.os_ref_js or "Ubuntu" in fingerprint.os_ref_js:
-            forbidden_extensions = [".dll", ".plugin"]
+            forbidden_extensions = ALL_PLUGIN_EXTENSIONS
+        else:
+            forbidden_extensions = self.__expected_profile(fingerprint).forbidden_plugin_extensions
 
         forbidden_extension_found = False
-        data = dict()
+        data = None
         str_plugins = "-".join(fingerprint.plugins)
         for extension in forbidden_extensions:
             if extension in str_plugins:
                 forbidden_extension_found = True
-                data["forbidden_extension"] = extension
+                data = {"forbidden_extension": extension}
                 break
 
         consistent = not forbidden_extension_found
-        return AnalysisResult(Scanner.PLUGINS_OS, consistent, data)
+        return consistent, data, None
 
-    def __is_webgl_consistent_os(self, fingerprint: Fingerprint):
+    def __is_webgl_consistent_os(self, fingerprint: Fingerprint, details):
         """
             Analysis name: WEBGL_OS
             Checks if webgl vendor is consistent with the OS claimed
         """
         inconsistent = False
-        data = dict()
+        data = None
 
         # iPad/iPhone: vendor : Apple Inc. Apple A8 GPU
         # Apple Inc. / Apple A9X GPU
@@ -547,131 +823,86 @@ class Scanner:
         # Adreno, MaliXXX, Tegra X for android or windows phone
         # see http://www.anandtech.com/show/6426/ipad-4-gpu-performance-analyzed-powervr-sgx-554mp4-under-the-hood
 
-        if fingerprint.os_ref_js != "Windows Phone" and \
-                "Windows" in fingerprint.os_ref_js or \
-                fingerprint.os_ref_js == "Mac OS X" or \
-                fingerprint.os_ref_js == "Linux" or \
-                fingerprint.os_ref_js == "Ubuntu":
-            forbidden_extensions = ["ANGLE", "OpenGL", "Mesa", "Gallium", "Qualcomm"]
-            # False negative with Windows Phone, change this later
-            if "Windows" in fingerprint.os_ref_js:
-                forbidden_extensions = ["OpenGL", "Mesa", "Gallium", "Qualcomm"]
-            elif "Mac OS X" in fingerprint.os_ref_js:
-                forbidden_extensions = ["ANGLE", "Mesa", "Gallium", "Qualcomm"]
-            elif "Linux" in fingerprint.os_ref_js or "Ubuntu" in fingerprint.os_ref_js:
-                forbidden_extensions = ["ANGLE", "OpenGL", "Qualcomm"]
-
-            for extension in forbidden_extensions:
-                if extension in fingerprint.web_gl_info[1] or \
-                        extension in fingerprint.web_gl_info[0]:
-                    inconsistent = True
-                    data["forbidden_extension"] = extension
-                    break
+        # empty list for other OSes
+        for extension in self.__expected_profile(fingerprint).forbidden_webgl_substrings:
+            if extension in fingerprint.web_gl_info[1] or \
+                    extension in fingerprint.web_gl_info[0]:
+                inconsistent = True
+                data = {"forbidden_extension": extension}
+                break
 
-        return AnalysisResult(Scanner.WEBGL_OS, not inconsistent, data)
+        return not inconsistent, data, None
 
-    def __are_font_consistent_os(self, fingerprint: Fingerprint):
+    def __are_font_consistent_os(self, fingerprint: Fingerprint, details):
         """
             Analysis name: FONTS_OS
             Checks if fonts that should be present only on certain
             OS are present on the claimed OS
         """
-        # Default case is "other"
-        # For the moment we do it only for desktop devices
-        os_family = "Other"
-        if fingerprint.os_ref_js != "Windows Phone" and "Windows" in fingerprint.os_ref_js:
-            os_family = "Windows"
-        elif "Ubuntu" in fingerprint.os_ref_js or "Linux" in fingerprint.os_ref_js or "Fedora" \
-                in fingerprint.os_ref_js:
-            os_family = "Linux"
-        elif "Mac OS X" in fingerprint.os_ref_js:
-            os_family = "Mac OS X"
-
-        nb_wrong_fonts = 0
+        os_family = self.__expected_profile(fingerprint).fonts_os_family
+
         nb_right_fonts = 0
-        data = dict()
-        data["wrong_fonts"] = []
+        wrong_fonts = []
         for font in fingerprint.fonts_js:
             if fingerprint.fonts_js[font]:
                 try:
                     if self.font_to_os[font] != os_family:
-                        nb_wrong_fonts += 1
-                        data["wrong_fonts"].append(font)
+                        wrong_fonts.append(font)
                     else:
                         nb_right_fonts += 1
                 except KeyError:
                     # We pass, it just means the font has not been collected
                     pass
 
-        data["nb_wrong_fonts"] = len(data["wrong_fonts"])
-        data["nb_right_fonts"] = nb_right_fonts
+        nb_wrong_fonts = len(wrong_fonts)
         consistent = nb_wrong_fonts < self.number_wrong_fonts
-        return AnalysisResult(Scanner.FONTS_OS, consistent, data)
+        if consistent and not details:
+            return True, None, None
+        data = {"wrong_fonts": wrong_fonts, "nb_wrong_fonts": nb_wrong_fonts, "nb_right_fonts": nb_right_fonts}
+        return consistent, data, {"nb_wrong_fonts": nb_wrong_fonts}
 
-    def __are_devices_blocked(self, fingerprint: Fingerprint):
+    def __are_devices_blocked(self, fingerprint: Fingerprint, details):
         """
             Checks if multimedia devices have been blocked by Brave desktop
         """
-        return AnalysisResult(Scanner.MULTIMEDIA_DEVICES_BLOCKED, not fingerprint.devices_blocked, {})
+        return not fingerprint.devices_blocked, None, None
 
-    def __are_errors_consistent_browser(self, fingerprint: Fingerprint):
+    def __are_errors_consistent_browser(self, fingerprint: Fingerprint, details):
         """
             Checks if the errors are consistent with the browser claimed
         """
+        is_ie_or_edge, is_firefox, is_chrome_or_opera, is_chrome_opera_or_safari = \
+            self.__expected_profile(fingerprint).error_signatures
         inconsistent = False
         errors_failed = []
         # errors_generated[3] = error.description
         # errors_generated[4] = error.number
         # it is only available on IE browsers
-        if not inconsistent and \
-                (fingerprint.errors_generated[3] != None and \
-                 (fingerprint.browser_ref_js != "IE" and \
-                  fingerprint.browser_ref_js != "Edge")) or \
-                (fingerprint.errors_generated[3] == None and \
-                 (fingerprint.browser_ref_js == "IE" or \
-                  fingerprint.browser_ref_js == "Edge")):
+        if (fingerprint.errors_generated[3] != None) != is_ie_or_edge:
             inconsistent = True
             errors_failed.append("IE Edge exception signature")
 
         # errors_generated[1] = error.filename
         # its is only available on Firefox based browsers
         # works also for firefox mobile
-        if (fingerprint.errors_generated[1] != None and "Firefox" not in fingerprint.browser_ref_js) or \
-                (fingerprint.errors_generated[1] == None and "Firefox" in fingerprint.browser_ref_js):
+        if (fingerprint.errors_generated[1] != None) != is_firefox:
             inconsistent = True
             errors_failed.append("Firefox filename")
 
         # errors_generated[7] = websocket error.toString()
-        if ("An invalid or illegal" in fingerprint.errors_generated[7] and \
-            "Firefox" not in fingerprint.browser_ref_js) or \
-                ("An invalid or illegal" not in fingerprint.errors_generated[7] and \
-                 "Firefox" in fingerprint.browser_ref_js):
+        if ("An invalid or illegal" in fingerprint.errors_generated[7]) != is_firefox:
             inconsistent = True
             errors_failed.append("Firefox websocket constructor")
 
-        if ("Failed to construct 'WebSocket'" in fingerprint.errors_generated[7] and \
-            "Chrome" not in fingerprint.browser_ref_js and \
-            fingerprint.browser_ref_js != "Opera") or \
-                ("Failed to construct 'WebSocket'" not in fingerprint.errors_generated[7] and \
-                 ("Chrome" in fingerprint.browser_ref_js or fingerprint.browser_ref_js == "Opera")):
+        if ("Failed to construct 'WebSocket'" in fingerprint.errors_generated[7]) != is_chrome_or_opera:
             inconsistent = True
             errors_failed.append("Chrome websocket constructor")
 
-        if (fingerprint.res_overflow[1] == "InternalError" and \
-            "Firefox" not in fingerprint.browser_ref_js) or \
-                (fingerprint.res_overflow[1] != "InternalError" and \
-                 "Firefox" in fingerprint.browser_ref_js):
+        if (fingerprint.res_overflow[1] == "InternalError") != is_firefox:
             inconsistent = True
             errors_failed.append("Firefox stack overflow")
 
-        if (fingerprint.res_overflow[1] == "RangeError" and \
-            "Chrome" not in fingerprint.browser_ref_js and \
-            fingerprint.browser_ref_js != "Opera" and \
-            "Safari" not in fingerprint.browser_ref_js) or \
-                (fingerprint.res_overflow[1] != "RangeError" and \
-                 ("Chrome" in fingerprint.browser_ref_js or \
-                  fingerprint.browser_ref_js == "Opera" or \
-                  "Safari" in fingerprint.browser_ref_js)):
+        if (fingerprint.res_overflow[1] == "RangeError") != is_chrome_opera_or_safari:
             inconsistent = True
             errors_failed.append("Chrome stack overflow")
 
@@ -679,54 +910,10 @@ class Scanner:
         # errors_generated[0] = error.message
         # it depends on the browser
 
-        data = {"errors_failed": ";".join(errors_failed)} if errors_failed else {}
-        return AnalysisResult(Scanner.ERRORS_BROWSER, not inconsistent, data)
-
-    def __read_caniusefeatures(self):
-        """
-            Parse json file provided by caniuse.com
-            to translate it to a more usable structure
-        """
-        with open("./ressources/data_caniuse_v2.json", "r") as f:
-            caniuse_data = json.load(f)
-
-        caniuse_browser_to_ua_parser = {
-            "chrome": "Chrome",
-            "opera": "Opera",
-            "firefox": "Firefox",
-            "safari": "Safari",
-            "edge": "Edge",
-            "ie": "IE",
-            "and_chr": "Chrome mobile",
-            "android": "Android",
-            "ie_mob": "IE Mobile",
-            "ios_saf": "Mobile Safari"
-        }
-        features = dict()
-
-        for feature in caniuse_data["data"]:
-            features[feature] = dict()
-            for browser in caniuse_data["data"][feature]["stats"]:
-                if browser in caniuse_browser_to_ua_parser:
-                    features[feature][caniuse_browser_to_ua_parser[browser]] = set()
-                    for version in caniuse_data["data"][feature]["stats"][browser]:
-                        versions_split = version.split("-")
-                        if len(versions_split) > 1:
-                            version_key = versions_split[0].split(".")[0]
-                        else:
-                            version_key = version.split(".")[0]
-
-                        if self.__is_feature_supported(
-                                caniuse_data["data"][feature]["stats"][browser][version]
-                        ):
-                            features[feature][caniuse_browser_to_ua_parser[browser]].add(version_key)
-
-        return features
-
-    def __is_feature_supported(self, feature_data):
-        return "y" in feature_data or "a" in feature_data
+        data = {"errors_failed": ";".join(errors_failed)} if errors_failed else None
+        return not inconsistent, data, None
 
-    def __are_features_consistent_browser(self, fingerprint: Fingerprint):
+    def __are_features_consistent_browser(self, fingerprint: Fingerprint, details):
         """
             Analysis name: FEATURES_BROWSER
             Test if modernizr features are consistent with features
@@ -736,26 +923,36 @@ class Scanner:
         #  https://raw.githubusercontent.com/Fyrd/caniuse/master/data.json
         # Only 48 features have exactly the same name between Modernizr
         # And caniuse. Maybe remove the others.
-        nb_errors = 0
+        checked, supported = self.feature_vectors.expected(fingerprint.browser_ref_js,
+                                                           fingerprint.browser_version_ref_js)
+        indices, available = self.feature_vectors.observed(fingerprint.modernizr)
+        wrong_features = FeatureVectors.wrong_features(checked, supported, indices, available)
+        nb_errors = np.count_nonzero(wrong_features)
+
         errors_features = []
-        for feature in fingerprint.modernizr:
-            if feature in self.caniuse_features:
-                if fingerprint.browser_ref_js in self.caniuse_features[feature]:
-                    should_feature_be_available = (
-                            str(fingerprint.browser_version_ref_js) in \
-                            self.caniuse_features[feature][fingerprint.browser_ref_js]
-                    )
-                    if fingerprint.modernizr[feature] != should_feature_be_available:
-                        errors_features.append(feature)
-                        nb_errors += 1
+        if nb_errors > 0:
+            # in the order of the modernizr results
+            features = self.feature_vectors.features
+            errors_features = [features[index] for index in indices[wrong_features]]
 
         # 0 might be a bit too strict, maybe allow one error?
         # consistent = nb_errors <= 4
         consistent = nb_errors <= self.number_wrong_features
-        data = {"errors_features": ";".join(errors_features)} if errors_features else {}
-        return AnalysisResult(Scanner.FEATURES_BROWSER, consistent, data)
+        if consistent and not details:
+            return True, None, None
+        data = {"errors_features": ";".join(errors_features)} if errors_features else None
+        return consistent, data, {"nb_wrong_features": nb_errors}
+
+    def count_wrong_features(self, fingerprints):
+        """
+            Number of features inconsistent with the browser claimed of
+            each fingerprint, the FEATURES_BROWSER check of a whole batch
+            as a single matrix operation. Returns an array of counts
+        """
+        claims = [(fingerprint.browser_ref_js, fingerprint.browser_version_ref_js) for fingerprint in fingerprints]
+        return self.feature_vectors.count_wrong_features(claims, [fingerprint.modernizr for fingerprint in fingerprints])
 
-    def __is_navigator_overwritten(self, fingerprint: Fingerprint):
+    def __is_navigator_overwritten(self, fingerprint: Fingerprint, details):
         """
             Analysis name: NAVIGATOR_OVERWRITTEN
             Checks if there exists at least 1 methods or attributes
@@ -779,46 +976,44 @@ class Scanner:
                                               )
 
         data = {"properties_overwritten": "~~".join(overwritten_properties)} if \
-            overwritten_properties else {}
-        return AnalysisResult(Scanner.NAVIGATOR_OVERWRITTEN, consistent, data)
+            overwritten_properties else None
+        return consistent, data, None
 
-    def __is_canvas_overwritten(self, fingerprint: Fingerprint):
+    def __is_canvas_overwritten(self, fingerprint: Fingerprint, details):
         """
             Analysis name: CANVAS_OVERWRITTEN
             Checks if a property/method used to generate a
             canvas has been overwritten
         """
         consistent = "native code" in fingerprint.canvas_desc
-        return AnalysisResult(Scanner.CANVAS_OVERWRITTEN, consistent, data={})
+        return consistent, None, None
 
-    def __is_screen_overwritten(self, fingerprint: Fingerprint):
+    def __is_screen_overwritten(self, fingerprint: Fingerprint, details):
         """
             Analysis name: SCREEN_OVERWRITTEN
             Returns True if screen object has been overwritten,
             else False
         """
         consistent = fingerprint.screen_desc != "error"
-        return AnalysisResult(Scanner.SCREEN_OVERWRITTEN, consistent, data={})
+        return consistent, None, None
 
-    def __is_timezone_overwritten(self, fingerprint: Fingerprint):
+    def __is_timezone_overwritten(self, fingerprint: Fingerprint, details):
         """
             Analysis name: TIMEZONE_OVERWRITTEN
             Returns True if Date.getTimezoneOffset method has been
             overwritten, else False
         """
         consistent = fingerprint.timezone_desc != "error"
-        return AnalysisResult(Scanner.TIMEZONE_OVERWRITTEN, consistent, data={})
+        return consistent, None, None
 
-    def __is_accelerometer_consistent(self, fingerprint: Fingerprint):
+    def __is_accelerometer_consistent(self, fingerprint: Fingerprint, details):
         """
             Analysis name: ACCELEROMETER
             Returns True if accelerometer is consistent with the
             class of device, i.e mobile device and accelerometer is True,
             or computer device and accelerometer is False
         """
-        is_mobile_device = fingerprint.os_ref_js == "Android" or \
-                           fingerprint.os_ref_js == "iOS" or \
-                           fingerprint.os_ref_js == "Windows Phone"
+        is_mobile_device = self.__expected_profile(fingerprint).is_mobile
 
         consistent = True
         if is_mobile_device and not fingerprint.accelerometer:
@@ -826,36 +1021,26 @@ class Scanner:
         elif not is_mobile_device and fingerprint.accelerometer:
             consistent = False
 
-        return AnalysisResult(Scanner.ACCELEROMETER, consistent, data={})
+        return consistent, None, None
 
-    def __is_product_sub_consistent_browser(self, fingerprint: Fingerprint):
+    def __is_product_sub_consistent_browser(self, fingerprint: Fingerprint, details):
         """
             Analysis name: PRODUCT_SUB
             Returns True if productSub is "20030107" on
             Chrome, Safari and Opera
         """
-        consistent = True
-        data = {}
-        if (fingerprint.browser_ref_js == "Chrome" or \
-            fingerprint.browser_ref_js == "Chrome Mobile" or \
-            fingerprint.browser_ref_js == "Safari" or \
-            fingerprint.browser_ref_js == "Opera") and \
-                fingerprint.product_sub != "20030107":
-            consistent = False
-        elif fingerprint.browser_ref_js != "Other" and \
-                fingerprint.browser_ref_js != "Chrome" and \
-                fingerprint.browser_ref_js != "Chrome Mobile" and \
-                fingerprint.browser_ref_js != "Safari" and \
-                fingerprint.browser_ref_js != "Opera" and \
-                fingerprint.product_sub == "20030107":
-            consistent = False
+        # None for "Other" browsers
+        product_sub_20030107 = self.__expected_profile(fingerprint).product_sub_20030107
+        consistent = product_sub_20030107 is None or \
+            (fingerprint.product_sub == "20030107") == product_sub_20030107
+        data = None
 
         if not consistent:
-            data["product_sub"] = fingerprint.product_sub
+            data = {"product_sub": fingerprint.product_sub}
 
-        return AnalysisResult(Scanner.PRODUCT_SUB, consistent, data)
+        return consistent, data, None
 
-    def __is_etsl_consistent_browser(self, fingerprint: Fingerprint):
+    def __is_etsl_consistent_browser(self, fingerprint: Fingerprint, details):
         """
             Analysis name: ETSL
             Checks if eval.toString().length is equals to:
@@ -863,56 +1048,67 @@ class Scanner:
             - 39 for IE and Edge
             - 33 for Chrome, Opera
         """
-        browser_to_length = {
-            "Safari": 37,
-            "Firefox": 37,
-            "Internet Explorer": 39,
-            "Edge": 39,
-            "Chrome": 33,
-            "Opera": 33
-        }
+        expected_etsl = self.__expected_profile(fingerprint).etsl
 
         consistent = True
-        data = {}
-        if fingerprint.browser_ref_js in browser_to_length and \
-                browser_to_length[fingerprint.browser_ref_js] != fingerprint.etsl:
+        data = None
+        if expected_etsl is not None and expected_etsl != fingerprint.etsl:
             consistent = False
-            data["etsl"] = fingerprint.etsl
+            data = {"etsl": fingerprint.etsl}
 
-        return AnalysisResult(Scanner.ETSL, consistent, data)
+        return consistent, data, None
 
-    def __is_touch_support_consistent(self, fingerprint: Fingerprint):
+    def __is_touch_support_consistent(self, fingerprint: Fingerprint, details):
         """
             Analysis name: TOUCH_SUPPORT
             Checks if touch support is active only on Android, iOS, or
             Windows Phone devices
         """
         consistent = True
-        data = {}
-        if (fingerprint.os_ref_js == "Android" or \
-            fingerprint.os_ref_js == "iOS" or \
-            fingerprint.os_ref_js == "Windows Phone") and \
+        data = None
+        if self.__expected_profile(fingerprint).is_mobile and \
                 fingerprint.touch_support == "0;false;false":
             consistent = False
-            data["touch_support"] = fingerprint.touch_support
+            data = {"touch_support": fingerprint.touch_support}
 
-        return AnalysisResult(Scanner.TOUCH_SUPPORT, consistent, data)
+        return consistent, data, None
 
-    def __are_canvas_pixels_consistent(self, fingerprint: Fingerprint, all_tests=True):
+    def __are_canvas_pixels_consistent(self, fingerprint: Fingerprint, details=True, all_tests=True, use_index=True):
         """
             Analysis name: CANVAS_PIXELS
             Checks if pixels of a canvas have been modified by an extension
         """
         inconsistent = False
         data = {}
-        # new version from raw image
+        # counts computed, compared to the thresholds
+        raw_metrics = {"canvas_blocked": False}
+
+        # with all_tests, e.g. to record the raw metrics, the
+        # pixels are counted even if the index gives the verdict
+        if use_index and self.canvas_index is not None and fingerprint.canvas_hash is not None:
+            platforms = self.canvas_index.platforms_of(fingerprint.canvas_hash)
+            genuine = (fingerprint.os_ref_js, fingerprint.browser_ref_js) in platforms
+            if self.metrics is not None:
+                self.metrics.record_cache("canvas_index", genuine)
+            if genuine and not all_tests:
+                # rendered by a genuine browser of this platform, no need to decode it
+                return True, data, raw_metrics
+            if platforms and self.flag_foreign_canvases and not genuine:
+                inconsistent = True
+                data["canvas_platforms"] = ["{}/{}".format(os_name, browser) for os_name, browser in sorted(platforms)]
+                if not all_tests:
+                    return False, data, raw_metrics
 
+        # new version from raw image
         if fingerprint.canvas_img is None:
             data["canvas_blocked"] = True
+            raw_metrics["canvas_blocked"] = True
             inconsistent = True
         else:
+            # the image is only read, it may be read-only or shared
+            # with other scans
             img = fingerprint.canvas_img
-            img.setflags(write=1)
+            layout = self.canvas_layout if self.canvas_layout is not None and self.canvas_layout.fits(img) else None
 
             if not inconsistent or all_tests:
                 # We look for specific colors as defined in the canvas definition
@@ -920,15 +1116,16 @@ class Scanner:
                 MAX_NORM = 4
                 failed_one_color = False
                 for color in colors_to_detect:
-                    nb_equals = 0
-                    nb_close = 0
-                    for v1 in fingerprint.canvas_img:
-                        for v2 in v1:
-                            norm = np.linalg.norm(v2[:3] - color[:3])
-                            if norm < MAX_NORM and norm > 0:
-                                nb_close += 1
-                            if np.array_equal(v2[:3] - color[:3], [0, 0, 0]):
-                                nb_equals += 1
+                    if layout is None:
+                        nb_equals, nb_close = count_color_pixels(img, color, MAX_NORM)
+                    else:
+                        nb_equals, nb_close = 0, 0
+                        for view in layout.color_views(img):
+                            nb_equals_view, nb_close_view = count_color_pixels(view, color, MAX_NORM)
+                            nb_equals += nb_equals_view
+                            nb_close += nb_close_view
+                    raw_metrics["nb_color_equals"] = nb_equals
+                    raw_metrics["nb_color_close"] = nb_close
                     if nb_equals == 0 or \
                             7 * nb_equals < nb_close:
                         failed_one_color = True
@@ -939,45 +1136,148 @@ class Scanner:
                 if failed_one_color:
                     inconsistent = True
 
+            # binary mask of the non transparent pixels
+            alpha_mask = img[:, :, 3] > 0
+
             if not inconsistent or all_tests:
                 # We count the number of transparent pixels
-                id_t = img[:, :, 3] > 0
-                id_f = img[:, :, 3] == 0
-                img[id_t, 3] = 1
-                img[id_f, 3] = 0
-                img = img[:, :, 3]
-                nb_zeros = 24000 - np.count_nonzero(img)
+                nb_zeros = CANVAS_NB_PIXELS - np.count_nonzero(alpha_mask)
+                raw_metrics["nb_transparent_pixels"] = nb_zeros
 
                 # if nb_zeros < 4000 or nb_zeros == 24000:
-                if nb_zeros < self.number_transparent_pixels or nb_zeros == 24000:
+                if nb_zeros < self.number_transparent_pixels or nb_zeros == CANVAS_NB_PIXELS:
                     inconsistent = True
                     data["zeros_pixels"] = nb_zeros
 
             if not inconsistent or all_tests:
                 # We count the number of isolated cells
-                filtered_array = filter_isolated_cells(img, struct=np.ones((3, 3)))
-                diff_mat = img != filtered_array
-                isolated_pixels = np.nonzero(diff_mat == True)
-                if len(isolated_pixels[0]) > 8:
+                if layout is None:
+                    nb_isolated_pixels = count_isolated_pixels(alpha_mask)
+                    max_isolated_pixels = MAX_ISOLATED_PIXELS
+                else:
+                    nb_isolated_pixels = sum(np.count_nonzero(isolated_pixels(view)[region])
+                                             for view, region in layout.isolated_views(alpha_mask))
+                    max_isolated_pixels = layout.max_isolated_pixels
+                raw_metrics["nb_isolated_pixels"] = nb_isolated_pixels
+                if nb_isolated_pixels > max_isolated_pixels:
                     inconsistent = True
-                    data["isolated_pixels"] = len(isolated_pixels[0])
+                    data["isolated_pixels"] = nb_isolated_pixels
 
-        return AnalysisResult(Scanner.CANVAS_PIXELS, not inconsistent, data)
+        return not inconsistent, data, raw_metrics
 
 
 class AnalysisResult:
 
-    def __init__(self, name, is_consistent, data):
+    def __init__(self, name, is_consistent, data, raw_metrics=None):
         """
             name is a string representing the point being analysed
             is_consistent is True if the analysis checked no inconsistency, else False
             data is a dict containing data relative to the analysis
+            raw_metrics is None or a dict of the counts compared to a threshold
         """
         self.name = name
         self.is_consistent = is_consistent
         self.data = data
+        self.raw_metrics = raw_metrics
 
     def __str__(self):
         str_repr = "Analysis: %s\nResult: %s\n" % (self.name, self.is_consistent)
         data_repr = "\n".join([("%s: %s" % (x, self.data[x])) for x in self.data])
         return str_repr + data_repr
+
+
+class ScanOutcome:
+    __slots__ = ("ran", "failed", "details", "raw_metrics", "skipped", "data_version")
+
+    def __init__(self, ran, failed, details=None, raw_metrics=None, skipped=0, data_version=None):
+        """
+            ran is a bitmask of the analyses run, indexed by Analysis
+            failed is a bitmask of the analyses that detected an inconsistency
+            details is None or a dict Analysis -> data, filled only for failed analyses
+            raw_metrics is None or a dict of the counts recorded with record_raw_metrics
+            skipped is a bitmask of the analyses not run to meet a deadline
+            data_version is the version of the RuleData the analyses used
+        """
+        self.ran = ran
+        self.failed = failed
+        self.details = details
+        self.raw_metrics = raw_metrics
+        self.skipped = skipped
+        self.data_version = data_version
+
+    @property
+    def is_consistent(self):
+        return self.failed == 0
+
+    def has_run(self, analysis):
+        return bool(self.ran >> analysis & 1)
+
+    def has_failed(self, analysis):
+        return bool(self.failed >> analysis & 1)
+
+    def analyses_run(self):
+        return [analysis for analysis in Analysis if self.ran >> analysis & 1]
+
+    def analyses_failed(self):
+        return [analysis for analysis in Analysis if self.failed >> analysis & 1]
+
+    def merge(self, other):
+        """
+            Returns a ScanOutcome with the analyses of self and other,
+            e.g. the pixels analysis run apart
+        """
+        details = self.details
+        if other.details is not None:
+            details = dict(details) if details is not None else dict()
+            details.update(other.details)
+        raw_metrics = self.raw_metrics
+        if other.raw_metrics is not None:
+            raw_metrics = dict(raw_metrics) if raw_metrics is not None else dict()
+            raw_metrics.update(other.raw_metrics)
+        # the pixels analysis doesn't use the RuleData
+        data_version = self.data_version if self.data_version is not None else other.data_version
+        return ScanOutcome(self.ran | other.ran, self.failed | other.failed, details, raw_metrics,
+                           (self.skipped | other.skipped) & ~(self.ran | other.ran), data_version)
+
+    def has_been_skipped(self, analysis):
+        return bool(self.skipped >> analysis & 1)
+
+    def analyses_skipped(self):
+        return [analysis for analysis in Analysis if self.skipped >> analysis & 1]
+
+    def to_analysis_results(self):
+        """
+            Adapter to the list of AnalysisResult returned by check_fingerprint.
+            Consistent analyses have an empty data dict
+        """
+        analyses_results = []
+        for analysis in self.analyses_run():
+            if self.failed >> analysis & 1:
+                data = self.details.get(analysis, {}) if self.details is not None else {}
+                analyses_results.append(AnalysisResult(analysis.name, False, data))
+            else:
+                analyses_results.append(AnalysisResult(analysis.name, True, {}))
+        return analyses_results
+
+    @classmethod
+    def from_analysis_results(cls, analyses_results):
+        ran = 0
+        failed = 0
+        details = None
+        for result in analyses_results:
+            analysis = Analysis[result.name]
+            ran |= 1 << analysis
+            if not result.is_consistent:
+                failed |= 1 << analysis
+                if details is None:
+                    details = dict()
+                details[analysis] = result.data
+        return cls(ran, failed, details)
+
+    def __str__(self):
+        failed = [analysis.name for analysis in self.analyses_failed()]
+        str_repr = "Analyses run: %d\nFailed: %s" % (bin(self.ran).count("1"), ", ".join(failed) or "none")
+        if self.skipped:
+            skipped = [analysis.name for analysis in self.analyses_skipped()]
+            str_repr += "\nSkipped: %s" % ", ".join(skipped)
+        return str_repr
@@ -1,169 +1,317 @@
-from sklearn.metrics import accuracy_score
-
-from fingerprint_data_manager import FingerprintDataManager
-from inconsistency_scanner import Scanner
-import time
+import argparse
+import os
 import sys
-import pandas as pd
 
-fp_manager = FingerprintDataManager()
-scanner = Scanner(number_wrong_fonts=2, number_wrong_features=1, number_transparent_pixels=17200)
+# The commands are run by the modules imported in run_command, and the
+# scanner and the database connection are created there, so importing
+# this module doesn't import numpy, pymongo or the scanner, which matters
+# for short CLI invocations and spawned worker processes
+
+SCANNER_PARAMETERS = dict(number_wrong_fonts=2, number_wrong_features=1, number_transparent_pixels=17200)
 
+COMMANDS = ["scan", "cm", "analyse", "bench", "bench-memory", "bench-scaling", "bench-startup", "bench-decode",
+            "sweep", "roi-report", "diff", "serve", "canvas-index", "stats", "create-indexes"]
 
 PREDICTION_FILE = "results/res_prediction.csv"
 REAL_VALUES_FILE = "results/res_real_values.csv"
+STARTUP_BENCH_FILE = "results/bench_startup.csv"
+MEMORY_BENCH_FILE = "results/bench_memory.csv"
+SCALING_BENCH_FILE = "results/bench_scaling.csv"
+DECODE_BENCH_FILE = "results/bench_decode.csv"
+RAW_METRICS_FILE = "results/raw_metrics.csv"
+SWEEP_FILE = "results/sweep.csv"
+ROI_REPORT_FILE = "results/canvas_roi.csv"
+DIFFERENTIAL_FILE = "results/differential.csv"
+CANVAS_INDEX_FILE = "ressources/canvas_index.bin"
+STATS_FILE = "results/stats.json"
+PIPELINE_STATS_FILE = "results/pipeline_stats.csv"
 
 
-def generate_analysis_str_vector(fingerprint, scan_results, ground_truth):
-    is_consistent = True
-    analysis_vector = [fingerprint.countermeasure]
-    for analysis_result in scan_results:
-        analysis_vector.append(1) if analysis_result.is_consistent else analysis_vector.append(0)
-        if not analysis_result.is_consistent:
-            is_consistent = False
-
-    analysis_vector.append(1) if is_consistent else analysis_vector.append(0)
-    analysis_vector.append(1) if ground_truth else analysis_vector.append(0)
-    analysis_vector.append(1) if fingerprint.fpjs2_consistent else analysis_vector.append(0)
-    analysis_vector.append(1) if fingerprint.augur_consistent else analysis_vector.append(0)
-
-    return ','.join([str(x) for x in analysis_vector])
-
-def generate_real_values_str_vector(fingerprint, real_os_guessed, real_browser_guessed, ground_truth):
-    predict_vec = [
-        fingerprint.countermeasure,
-        str(ground_truth),
-        fingerprint.real_os,
-        fingerprint.real_browser,
-        real_os_guessed,
-        real_browser_guessed
-    ]
-    return ','.join([str(x) for x in predict_vec])
-
-def scan_fingerprints(fingerprints, prediction_file, real_values_file):
-    with open(prediction_file, 'w+') as f_detection, open(real_values_file, 'w+') as f_real_values:
-        for counter, fingerprint in enumerate(fingerprints):
-            scan_results = scanner.check_fingerprint(fingerprint, run_all=True)
-            real_os_guessed, real_browser_guessed, _ = scanner.guess_real_info(fingerprint, scan_results)
-            ground_truth = scanner.should_be_consistent(fingerprint)
-            analysis_str_vector = generate_analysis_str_vector(fingerprint, scan_results, ground_truth)
-            real_values_str_vector = generate_real_values_str_vector(fingerprint, real_os_guessed,
-                                                                     real_browser_guessed, ground_truth)
-
-            has_predicted_incons = False in [x.is_consistent for x in scan_results]
-            if has_predicted_incons or (real_os_guessed != fingerprint.real_os or  real_browser_guessed != fingerprint.real_browser):
-                print("error")
-                print(fingerprint)
-                print(real_os_guessed, real_browser_guessed)
-                for scan_res in scan_results:
-                    if not scan_res.is_consistent:
-                        print(scan_res)
-                print('-----')
-            else:
-                print('ok:')
-                print(fingerprint)
-
-            if counter == 0:
-                headers = ",".join(["countermeasure"] + [x.name for x in scan_results] + \
-                          ["prediction", "ground_truth", "fpjs2", "augur"])
-                f_detection.write('{}\n'.format(headers))
-
-                predict_headers = ["countermeasure", "consistent", "realOs", "realBrowser",
-                                   "predictedOs", "predictedBrowser"]
-
-                f_real_values.write('{}\n'.format(",".join(predict_headers)))
-
-            f_detection.write('{}\n'.format(analysis_str_vector))
-            f_real_values.write('{}\n'.format(real_values_str_vector))
-
-
-def analyse_results(prediction_file, real_values_file):
-    COUNTERMEASURES = ['no', 'cd', 'ffp', 'ras', 'brave', 'uas', 'cfpb', 'fpr']
-    df = pd.read_csv(prediction_file)
-
-    for countermeasure in COUNTERMEASURES:
-        sub_df = df[df.countermeasure == countermeasure]
-        print('{}, {:d} fingerprints'.format(countermeasure, len(sub_df)))
-        df_pred = sub_df['prediction']
-        df_truth = sub_df['ground_truth']
-        df_fpjs2 = sub_df['fpjs2']
-        df_augur = sub_df['augur']
-        print("Accuracy FPScanner: {:f} " .format(accuracy_score(df_truth, df_pred)))
-        print("Accuracy FPJS2: {:f}".format(accuracy_score(df_truth, df_fpjs2)))
-        print("Accuracy Augur: {:f}\n".format(accuracy_score(df_truth, df_augur)))
-
-    df_real_values = pd.read_csv(real_values_file)
-    # only for these countermeasures since other don't alter nor the OS or the browser
-    for countermeasure in ['ffp', 'ras', 'uas']:
-        sub_df = df_real_values[df_real_values.countermeasure == countermeasure]
-        nb_fps = len(sub_df)
-        nb_rights_browser = len(sub_df[sub_df["realBrowser"] == sub_df["predictedBrowser"]])
-        # nb_rights_os = len(sub_df[sub_df["realOs"] == sub_df["predictedOs"]])
-        # dont test for pure equality since predicting Linux for ubuntu or fedora is not  wrong, same for windows
-        # when the exact version is predicted
-        nb_rights_os = 0
-        for index, row in sub_df.iterrows():
-            if row['realOs'] == row['predictedOs']:
-                nb_rights_os += 1
-            elif 'Win' in row['realOs'] and 'Win' in row['predictedOs']:
-                nb_rights_os += 1
-            elif (row['realOs'] in ['Ubuntu', 'Fedora'] and  row['predictedOs'] == 'Linux') or \
-                    (row['predictedOs'] in ['Ubuntu', 'Fedora'] and row['realOs'] == 'Linux'):
-                nb_rights_os += 1
-
-        accuracy_browser = float(nb_rights_browser / nb_fps)
-        accuracy_os = float(nb_rights_os / nb_fps)
-        print('{}, {:d} fingerprints'.format(countermeasure, len(sub_df)))
-        print("Accuracy OS: %f" % accuracy_os)
-        print("Accuracy browser: %f\n" % accuracy_browser)
-        # print(sub_df[sub_df["realOs"] != sub_df["predictedOs"]])
-        # print(sub_df[sub_df["realBrowser"] != sub_df["predictedBrowser"]])
-
-
-def run_benchmark(fingerprints):
-    # first we run all tests no matter if an  inconsistency is detected
-    with open('results/bench_situation1.csv', 'w+') as f_bench1, \
-            open('results/bench_situation2.csv', 'w+') as f_bench2, \
-            open('results/bench_situation3.csv', 'w+') as f_bench3:
-        header_str = 'elapsed_time'
-        f_bench1.write('{}\n'.format(header_str))
-        f_bench2.write('{}\n'.format(header_str))
-        f_bench3.write('{}\n'.format(header_str))
-
-        for counter, fingerprint in enumerate(fingerprints):
-            print('Fingerprint', counter)
-            # all tests
-            start = time.time()
-            scanner.check_fingerprint(fingerprint, run_all=True)
-            end = time.time()
-            f_bench1.write('{:f}\n'.format(end-start))
-
-            # stop when inconsistency found
-            start = time.time()
-            scanner.check_fingerprint(fingerprint, run_all=False)
-            end = time.time()
-            f_bench2.write('{:f}\n'.format(end - start))
-
-            # run only pixels test
-            start = time.time()
-            scanner.check_fingerprint(fingerprint, run_all=False, only_pixels=True)
-            end = time.time()
-            f_bench3.write('{:f}\n'.format(end - start))
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Detects inconsistencies in browser fingerprints")
+    subparsers = parser.add_subparsers(dest="command")
+
+    profile_options = argparse.ArgumentParser(add_help=False)
+    profile_options.add_argument("--profile", nargs="?", const="", default=None, metavar="PREFIX",
+                                 help="profile CPU and memory per stage, the report is written to "
+                                      "PREFIX.txt and PREFIX.collapsed (default results/profile_<command>)")
+
+    canvas_options = argparse.ArgumentParser(add_help=False)
+    canvas_options.add_argument("--canvas-roi", action="store_true",
+                                help="only analyse the regions of the canvas where a modification is expected")
+    canvas_options.add_argument("--canvas-index", nargs="?", const=CANVAS_INDEX_FILE, default=None, metavar="FILE",
+                                help="canvases of genuine browsers, not analysed again (default {})".format(
+                                    CANVAS_INDEX_FILE))
+    canvas_options.add_argument("--flag-foreign-canvases", action="store_true",
+                                help="with --canvas-index, a canvas only seen on other OS or browsers is inconsistent")
+
+    scan_options = argparse.ArgumentParser(add_help=False, parents=[profile_options, canvas_options])
+    # canvases are shared with the worker processes through shared memory
+    scan_options.add_argument("--workers", type=int, default=1,
+                              help="number of processes used to scan the fingerprints")
+    scan_options.add_argument("--canvas-threads", type=int, default=0,
+                              help="run the pixels analysis in this number of threads, "
+                                   "behind the other analyses")
+    scan_options.add_argument("--budget-ms", type=float, default=None,
+                              help="time allowed to scan a fingerprint, the expensive analyses "
+                                   "that don't fit are skipped")
+    scan_options.add_argument("--accuracy-interval", type=float, default=30.0,
+                              help="seconds between two prints of the accuracy computed so far")
+    scan_options.add_argument("--prefilter", action="store_true",
+                              help="compute the analyses that only compare fields of the documents in MongoDB, "
+                                   "and only fetch the fields needed by the other ones")
+    scan_options.add_argument("--stats", nargs="?", const=STATS_FILE, default=None, metavar="FILE",
+                              help="count distinct and frequent attributes and the failures by browser while "
+                                   "scanning, in a fixed memory, and write them to FILE (default {})".format(STATS_FILE))
+    scan_options.add_argument("--pipeline", action="store_true",
+                              help="read, parse, scan and write the fingerprints in concurrent stages, "
+                                   "and write the time spent by each stage to {}".format(PIPELINE_STATS_FILE))
+    scan_options.add_argument("--parse-threads", type=int, default=2,
+                              help="with --pipeline, number of threads parsing the fingerprints and decoding the canvases")
+    scan_options.add_argument("--scan-threads", type=int, default=1,
+                              help="with --pipeline, number of threads scanning the fingerprints")
+    scan_options.add_argument("--queue-size", type=int, default=256,
+                              help="with --pipeline, number of fingerprints waiting between two stages")
+    scan_options.add_argument("--mongo-pool-size", type=int, default=100,
+                              help="maximum number of connections to MongoDB")
+    scan_options.add_argument("--metrics-port", type=int, default=None,
+                              help="expose Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    scan_options.add_argument("--metrics-file", default=None,
+                              help="dump Prometheus metrics to this file periodically")
+    scan_options.add_argument("--metrics-interval", type=float, default=10.0,
+                              help="seconds between two dumps of --metrics-file")
+
+    subparsers.add_parser("scan", parents=[scan_options],
+                          help="scan all the fingerprints (default command)")
+    cm_parser = subparsers.add_parser("cm", parents=[scan_options],
+                                      help="scan the fingerprints of a countermeasure")
+    cm_parser.add_argument("countermeasure")
+    subparsers.add_parser("analyse", parents=[profile_options],
+                          help="compute the accuracy from the result files of a previous scan")
+    subparsers.add_parser("bench", parents=[profile_options],
+                          help="measure the execution time of the scanner")
+    subparsers.add_parser("bench-memory",
+                          help="measure the memory needed to load, decode and scan the fingerprints")
+    scaling_parser = subparsers.add_parser("bench-scaling",
+                                           help="measure the throughput for several numbers of workers and corpus sizes")
+    scaling_parser.add_argument("--fixtures", default=None,
+                                help="mongoexport file of the fingerprints the synthetic corpora are built from, "
+                                     "read instead of the database")
+    scaling_parser.add_argument("--modes", default="sequential,processes,canvas_threads")
+    scaling_parser.add_argument("--workers", default=None,
+                                help="numbers of workers, \"1,2,4\" or \"start:stop:step\" (default 1 to the number of cores)")
+    scaling_parser.add_argument("--sizes", default="1000,10000",
+                                help="numbers of synthetic fingerprints, e.g. 1000,10000,100000,1000000")
+    scaling_parser.add_argument("--seed", type=int, default=0)
+    startup_parser = subparsers.add_parser("bench-startup", help="measure the startup time")
+    startup_parser.add_argument("--runs", type=int, default=10)
+    subparsers.add_parser("roi-report", parents=[profile_options],
+                          help="compare the pixels analysis on the whole canvas and on its regions of interest")
+    diff_parser = subparsers.add_parser("diff", help="compare the execution modes of the scanner to the reference")
+    diff_parser.add_argument("--fixtures", default=None,
+                             help="mongoexport file of fingerprints, read instead of the database")
+    diff_parser.add_argument("--modes", default="scan_outcome,cost_ordered,two_tier,two_tier_scanner,parallel,pipeline,"
+                             "canvas_index",
+                             help="modes compared to check_fingerprint and guess_real_info")
+    diff_parser.add_argument("--reference-outcomes", default=None, metavar="FILE",
+                             help="compare the modes and check_fingerprint to the outcomes of this file, "
+                                  "e.g. written by an earlier commit")
+    diff_parser.add_argument("--synthetic", type=int, default=None, metavar="SIZE",
+                             help="compare on SIZE fingerprints mixing the attributes of the loaded ones")
+    diff_parser.add_argument("--seed", type=int, default=0)
+    diff_parser.add_argument("--workers", type=int, default=1)
+    serve_parser = subparsers.add_parser("serve", parents=[canvas_options], help="scan NDJSON fingerprint documents read from stdin or a "
+                                                       "Unix socket, without restarting the scanner")
+    serve_parser.add_argument("--socket", default=None, metavar="PATH",
+                              help="listen on this Unix socket instead of reading stdin")
+    serve_parser.add_argument("--workers", type=int, default=1,
+                              help="number of processes forked once the scanner is loaded")
+    serve_parser.add_argument("--budget-ms", type=float, default=None,
+                              help="time allowed to scan a fingerprint")
+    serve_parser.add_argument("--reload-interval", type=float, default=None, metavar="SECONDS",
+                              help="check the fonts and caniuse files every SECONDS and use them once they change")
+    stats_parser = subparsers.add_parser("stats", help="merge and print the statistics of scans run with --stats")
+    stats_parser.add_argument("stats_files", nargs="+", metavar="FILE")
+    stats_parser.add_argument("--output", default=None, help="write the merged statistics to this file")
+    subparsers.add_parser("create-indexes", help="create the indexes of the fingerprints collection, once per database")
+    index_parser = subparsers.add_parser("canvas-index",
+                                         help="add the canvases of the genuine fingerprints to the canvas index")
+    index_parser.add_argument("--index", default=CANVAS_INDEX_FILE, metavar="FILE")
+    decode_parser = subparsers.add_parser("bench-decode", help="measure the decoding time of the canvases")
+    decode_parser.add_argument("--canvases", type=int, default=1000, help="number of canvases decoded")
+    sweep_parser = subparsers.add_parser("sweep", parents=[profile_options],
+                                         help="evaluate a grid of thresholds of the scanner")
+    sweep_parser.add_argument("--rescan", action="store_true",
+                              help="record the raw metrics again even if {} exists".format(RAW_METRICS_FILE))
+    # a grid is "1,2,4" or "start:stop:step"
+    sweep_parser.add_argument("--fonts", default="1:5:1", help="values of number_wrong_fonts")
+    sweep_parser.add_argument("--features", default="0:4:1", help="values of number_wrong_features")
+    sweep_parser.add_argument("--transparent", default="14000:20000:400",
+                              help="values of number_transparent_pixels")
+
+    if len(argv) == 0 or argv[0] not in COMMANDS + ["-h", "--help"]:
+        argv = ["scan"] + list(argv)
+    args = parser.parse_args(argv)
+    if getattr(args, "pipeline", False) and (args.workers > 1 or args.canvas_threads > 0):
+        parser.error("--pipeline scans in --scan-threads threads, it can't be used with --workers or --canvas-threads")
+    return args
 
 
 def main(argv):
-    if len(argv) > 0 and argv[0] == "cm":
-        fingerprints = fp_manager.get_fingerprints_countermeasure(argv[1])
-        scan_fingerprints(fingerprints, PREDICTION_FILE, REAL_VALUES_FILE)
-    elif len(argv) > 0 and argv[0] == 'analyse':
-        analyse_results(PREDICTION_FILE, REAL_VALUES_FILE)
-    elif len(argv) > 0 and argv[0] == 'bench':
-        fingerprints = fp_manager.get_all_fingerprints()
-        run_benchmark(fingerprints)
+    args = parse_arguments(argv)
+
+    profiler = None
+    if getattr(args, "profile", None) is not None:
+        # only the main process is profiled, not the --workers processes
+        from profiler import StageProfiler
+        profiler = StageProfiler()
+        profiler.start()
+
+    try:
+        run_command(args, profiler)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profile_prefix = args.profile or "results/profile_{}".format(args.command)
+            profiler.write_report(profile_prefix)
+            print("Profile written to {0}.txt and {0}.collapsed".format(profile_prefix))
+
+
+def run_command(args, profiler):
+    from profiler import profile_stage
+
+    if args.command == 'analyse':
+        from scan_command import analyse_results
+        with profile_stage(profiler, "analyse_results"):
+            analyse_results(PREDICTION_FILE, REAL_VALUES_FILE)
+    elif args.command == 'bench-startup':
+        from startup_benchmark import run_startup_benchmark
+        run_startup_benchmark(args.runs, STARTUP_BENCH_FILE)
+    elif args.command == 'sweep':
+        if args.rescan or not os.path.exists(RAW_METRICS_FILE):
+            # the thresholds of the scanner don't matter, all the counts are recorded
+            from fingerprint_data_manager import FingerprintDataManager
+            from inconsistency_scanner import Scanner
+            from threshold_sweep import record_raw_metrics
+            fp_manager = FingerprintDataManager()
+            fp_manager.profiler = profiler
+            scanner = Scanner(**SCANNER_PARAMETERS)
+            scanner.profiler = profiler
+            record_raw_metrics(scanner, fp_manager.get_all_fingerprints(), RAW_METRICS_FILE)
+        from threshold_sweep import run_sweep
+        with profile_stage(profiler, "sweep"):
+            run_sweep(RAW_METRICS_FILE, SWEEP_FILE, args.fonts, args.features, args.transparent)
+    elif args.command == 'diff':
+        from differential import run_differential_command
+        documents = load_documents(args.fixtures)
+        mismatches = run_differential_command(documents, SCANNER_PARAMETERS, args.modes, args.synthetic, args.seed,
+                                              args.workers, DIFFERENTIAL_FILE, args.reference_outcomes)
+        if mismatches:
+            sys.exit(1)
+    elif args.command == 'serve':
+        from scan_command import budget_seconds
+        from scan_daemon import ScanDaemon
+        with ScanDaemon(scanner_parameters(args), args.workers, budget=budget_seconds(args),
+                        reload_interval=args.reload_interval) as scan_daemon:
+            if args.socket is not None:
+                scan_daemon.serve_unix_socket(args.socket)
+            else:
+                scan_daemon.serve_stream(sys.stdin, sys.stdout)
+    elif args.command == 'stats':
+        from stream_stats import merge_stats
+        merge_stats(args.stats_files, args.output)
+    elif args.command == 'create-indexes':
+        from fingerprint_data_manager import FingerprintDataManager
+        FingerprintDataManager(create_indexes=True)
+    elif args.command == 'canvas-index':
+        from canvas_index import update_canvas_index
+        from fingerprint_data_manager import FingerprintDataManager
+        from inconsistency_scanner import Scanner
+        # the canvases are analysed by a scanner without index
+        scanner = Scanner(**dict(scanner_parameters(args), canvas_index=None, flag_foreign_canvases=False))
+        update_canvas_index(FingerprintDataManager(), scanner, args.index)
+    elif args.command == 'bench-scaling':
+        import multiprocessing
+        from scaling_benchmark import run_scaling_benchmark
+        from threshold_sweep import parse_grid
+        workers_counts = parse_grid(args.workers) if args.workers is not None else \
+            list(range(1, multiprocessing.cpu_count() + 1))
+        run_scaling_benchmark(SCANNER_PARAMETERS, load_documents(args.fixtures), args.modes.split(","),
+                              workers_counts, parse_grid(args.sizes), SCALING_BENCH_FILE, args.seed)
+    elif args.command == 'bench-decode':
+        from decode_benchmark import run_decode_benchmark
+        from fingerprint_data_manager import FingerprintDataManager
+        fp_manager = FingerprintDataManager()
+        run_decode_benchmark(fp_manager.get_all_fingerprints(), args.canvases, DECODE_BENCH_FILE)
+    elif args.command == 'roi-report':
+        from fingerprint_data_manager import FingerprintDataManager
+        from roi_report import run_roi_report
+        fp_manager = FingerprintDataManager()
+        fp_manager.profiler = profiler
+        run_roi_report(SCANNER_PARAMETERS, fp_manager.get_all_fingerprints(), ROI_REPORT_FILE)
     else:
+        from fingerprint_data_manager import FingerprintDataManager
+        from inconsistency_scanner import Scanner
+        fp_manager = FingerprintDataManager(max_pool_size=getattr(args, "mongo_pool_size", 100))
+        scanner = Scanner(**scanner_parameters(args))
+        fp_manager.profiler = profiler
+        scanner.profiler = profiler
+
+        metrics_server = None
+        stop_metrics_dump = None
+        if getattr(args, "metrics_port", None) is not None or getattr(args, "metrics_file", None) is not None:
+            from metrics import MetricsRegistry
+            metrics = MetricsRegistry()
+            fp_manager.metrics = metrics
+            scanner.metrics = metrics
+            if args.metrics_port is not None:
+                metrics_server = metrics.serve(args.metrics_port)
+            if args.metrics_file is not None:
+                stop_metrics_dump = metrics.dump_periodically(args.metrics_file, args.metrics_interval)
+
+        try:
+            run_scan_command(args, fp_manager, scanner, profiler)
+        finally:
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            if stop_metrics_dump is not None:
+                stop_metrics_dump()
+
+
+def load_documents(fixtures_file):
+    """
+        Fingerprint documents of a mongoexport file, or of the database if it is None
+    """
+    if fixtures_file is not None:
+        from differential import load_fixtures
+        return load_fixtures(fixtures_file)
+    from fingerprint_data_manager import FingerprintDataManager
+    return list(FingerprintDataManager().collection.find())
+
+
+def scanner_parameters(args):
+    return dict(SCANNER_PARAMETERS, canvas_roi=getattr(args, "canvas_roi", False),
+                canvas_index=getattr(args, "canvas_index", None),
+                flag_foreign_canvases=getattr(args, "flag_foreign_canvases", False))
+
+
+def run_scan_command(args, fp_manager, scanner, profiler):
+    from scan_command import scan_and_report
+
+    if args.command == "cm":
+        scan_and_report(args, scanner, fp_manager, {'countermeasure': args.countermeasure}, profiler,
+                        PREDICTION_FILE, REAL_VALUES_FILE, PIPELINE_STATS_FILE)
+    elif args.command == 'bench':
+        from time_benchmark import run_benchmark
         fingerprints = fp_manager.get_all_fingerprints()
-        scan_fingerprints(fingerprints, PREDICTION_FILE, REAL_VALUES_FILE)
+        run_benchmark(scanner, fingerprints, profiler)
+    elif args.command == 'bench-memory':
+        from memory_benchmark import run_memory_benchmark
+        run_memory_benchmark(fp_manager, scanner, MEMORY_BENCH_FILE)
+    else:
+        scan_and_report(args, scanner, fp_manager, None, profiler, PREDICTION_FILE, REAL_VALUES_FILE,
+                        PIPELINE_STATS_FILE)
+
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
@@ -0,0 +1,121 @@
+import gc
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+
+MEMORY_BENCH_HEADER = ["stage", "nb_fingerprints", "retained_bytes", "retained_bytes_per_fingerprint",
+                       "traced_peak_bytes", "rss_steady_bytes", "rss_peak_bytes"]
+
+
+def rss_bytes():
+    """
+        Resident set size of the process, from /proc on Linux, else
+        the highest one reached so far
+    """
+    try:
+        with open("/proc/self/statm") as f_statm:
+            return int(f_statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # kilobytes on Linux and the BSDs, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class RssSampler:
+    """
+        Samples the RSS of the process in a thread every interval seconds,
+        to catch the peak of a stage tracemalloc doesn't see (numpy
+        buffers allocated outside Python's allocator, fragmentation...)
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+
+    def __sample(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes())
+            if self.__stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__stop.set()
+        self.__thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def measure_stage(name, nb_fingerprints, stage):
+    """
+        Runs stage() and returns its row following MEMORY_BENCH_HEADER and
+        what stage() returned. The memory retained is the memory still
+        allocated once the stage is over, e.g. the fingerprints loaded
+    """
+    gc.collect()
+    tracemalloc.reset_peak()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    with RssSampler() as rss_sampler:
+        result = stage()
+    gc.collect()
+    traced_after, traced_peak = tracemalloc.get_traced_memory()
+    retained = traced_after - traced_before
+    row = [name, nb_fingerprints, retained, retained / nb_fingerprints if nb_fingerprints else 0,
+           traced_peak - traced_before, rss_bytes(), rss_sampler.peak]
+    return row, result
+
+
+def run_memory_benchmark(fp_manager, scanner, bench_file):
+    """
+        Measures the memory needed to load the fingerprints, to decode their
+        canvases and to scan them in the three situations of run_benchmark,
+        and writes a row per stage to bench_file
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    rows = []
+    try:
+        row, fingerprints = measure_stage("load_corpus", 0, fp_manager.get_all_fingerprints)
+        nb_fingerprints = len(fingerprints)
+        row[1] = nb_fingerprints
+        row[3] = row[2] / nb_fingerprints if nb_fingerprints else 0
+        rows.append(row)
+
+        def decode_canvases():
+            # the canvases are decoded on first access and kept by each fingerprint
+            for fingerprint in fingerprints:
+                fingerprint.canvas_img
+
+        rows.append(measure_stage("decode_canvases", nb_fingerprints, decode_canvases)[0])
+
+        situations = [
+            ("scan_situation1", dict(run_all=True)),
+            ("scan_situation2", dict(run_all=False)),
+            ("scan_situation3", dict(run_all=False, only_pixels=True)),
+        ]
+        for name, parameters in situations:
+            def scan():
+                for fingerprint in fingerprints:
+                    scanner.check_fingerprint(fingerprint, **parameters)
+
+            rows.append(measure_stage(name, nb_fingerprints, scan)[0])
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    with open(bench_file, 'w+') as f_bench:
+        f_bench.write('{}\n'.format(",".join(MEMORY_BENCH_HEADER)))
+        for row in rows:
+            f_bench.write('{},{:d},{:d},{:f},{:d},{:d},{:d}\n'.format(*row))
+            print('{}: retained {:.1f} KB ({:.1f} KB per fingerprint), peak {:.1f} KB, RSS {:.1f} MB (peak {:.1f} MB)'.format(
+                row[0], row[2] / 1024, row[3] / 1024, row[4] / 1024, row[5] / 2 ** 20, row[6] / 2 ** 20))
+    return rows
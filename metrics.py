@@ -0,0 +1,242 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+SCANNED = "fpscanner_fingerprints_scanned_total"
+SCAN_RATE = "fpscanner_fingerprints_scanned_per_second"
+LOADED = "fpscanner_fingerprints_loaded_total"
+ANALYSIS_FAILURES = "fpscanner_analysis_failures_total"
+ANALYSIS_LATENCY = "fpscanner_analysis_latency_seconds"
+ANALYSIS_SKIPPED = "fpscanner_analysis_skipped_total"
+CACHE_HITS = "fpscanner_cache_hits_total"
+CACHE_MISSES = "fpscanner_cache_misses_total"
+QUEUE_DEPTH = "fpscanner_queue_depth"
+
+METRICS_HELP = {
+    SCANNED: ("counter", "Fingerprints scanned"),
+    SCAN_RATE: ("gauge", "Fingerprints scanned per second over the last rate window, 60 s by default"),
+    LOADED: ("counter", "Fingerprints loaded from MongoDB"),
+    ANALYSIS_FAILURES: ("counter", "Inconsistencies detected, by analysis"),
+    ANALYSIS_LATENCY: ("histogram", "Execution time of the analyses"),
+    ANALYSIS_SKIPPED: ("counter", "Analyses skipped to meet a deadline, by analysis"),
+    CACHE_HITS: ("counter", "Cache hits, by cache"),
+    CACHE_MISSES: ("counter", "Cache misses, by cache"),
+    QUEUE_DEPTH: ("gauge", "Fingerprints waiting in a queue, by queue"),
+}
+
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class _Shard:
+    """
+        Counters and histograms updated by a single thread
+    """
+
+    def __init__(self):
+        self.counters = dict()
+        # key -> [count of each bucket..., count above the last bucket, sum]
+        self.histograms = dict()
+
+
+class MetricsRegistry:
+    """
+        Counters, histograms and gauges of the scanner.
+        Each thread updates its own shard without locking,
+        the shards are merged when the metrics are read.
+        Labels are tuples of (name, value) pairs.
+        The scan rate is computed over the last rate_window seconds, from
+        the reads of all the readers (HTTP endpoint, periodic dump...)
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, rate_window=60.0):
+        self.latency_buckets = latency_buckets
+        self.rate_window = rate_window
+        self.gauges = dict()
+        self.__local = threading.local()
+        self.__shards = []
+        self.__lock = threading.Lock()
+        # (time, fingerprints scanned) at each read, the first one
+        # is the start of the window
+        self.__reads = deque([(time.time(), 0)])
+
+    def __shard(self):
+        try:
+            return self.__local.shard
+        except AttributeError:
+            shard = _Shard()
+            with self.__lock:
+                self.__shards.append(shard)
+            self.__local.shard = shard
+            return shard
+
+    def increment(self, name, labels=(), value=1):
+        counters = self.__shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        histograms = self.__shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = [0] * (len(self.latency_buckets) + 2)
+            histograms[key] = histogram
+        histogram[bisect.bisect_left(self.latency_buckets, value)] += 1
+        histogram[-1] += value
+
+    def observe_analysis(self, analysis_name, latency, is_consistent):
+        labels = (("analysis", analysis_name),)
+        self.observe(ANALYSIS_LATENCY, latency, labels)
+        if not is_consistent:
+            self.increment(ANALYSIS_FAILURES, labels)
+
+    def record_outcome(self, scan_outcome):
+        """
+            Counts a ScanOutcome computed elsewhere, e.g. by a worker process
+        """
+        self.increment(SCANNED)
+        for analysis in scan_outcome.analyses_failed():
+            self.increment(ANALYSIS_FAILURES, (("analysis", analysis.name),))
+        for analysis in scan_outcome.analyses_skipped():
+            self.increment(ANALYSIS_SKIPPED, (("analysis", analysis.name),))
+
+    def record_cache(self, cache_name, hit):
+        self.increment(CACHE_HITS if hit else CACHE_MISSES, (("cache", cache_name),))
+
+    def set_gauge(self, name, value, labels=()):
+        self.gauges[(name, labels)] = value
+
+    def snapshot(self):
+        """
+            Merges the shards of all threads.
+            Returns (counters, histograms, gauges) dicts keyed by (name, labels)
+        """
+        counters = dict()
+        histograms = dict()
+        with self.__lock:
+            shards = list(self.__shards)
+
+        for shard in shards:
+            # copying a dict is atomic, the owner thread may keep updating it
+            for key, value in dict(shard.counters).items():
+                counters[key] = counters.get(key, 0) + value
+            for key, histogram in dict(shard.histograms).items():
+                histogram = list(histogram)
+                if key in histograms:
+                    histograms[key] = [x + y for x, y in zip(histograms[key], histogram)]
+                else:
+                    histograms[key] = histogram
+
+        gauges = dict(self.gauges)
+        scanned = counters.get((SCANNED, ()), 0)
+        with self.__lock:
+            now = time.time()
+            # the window starts at the last read at least rate_window seconds old,
+            # or at the first one
+            while len(self.__reads) > 1 and self.__reads[1][0] <= now - self.rate_window:
+                self.__reads.popleft()
+            start_time, start_scanned = self.__reads[0]
+            self.__reads.append((now, scanned))
+        gauges[(SCAN_RATE, ())] = (scanned - start_scanned) / max(now - start_time, 1e-9)
+        return counters, histograms, gauges
+
+    def to_prometheus(self):
+        """
+            Returns the metrics in the Prometheus text exposition format
+        """
+        counters, histograms, gauges = self.snapshot()
+        lines = []
+        documented = set()
+
+        def header(name):
+            if name not in documented and name in METRICS_HELP:
+                documented.add(name)
+                metric_type, metric_help = METRICS_HELP[name]
+                lines.append("# HELP {} {}".format(name, metric_help))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+
+        for values in (counters, gauges):
+            for (name, labels), value in sorted(values.items()):
+                header(name)
+                lines.append("{}{} {}".format(name, _format_labels(labels), _format_value(value)))
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name)
+            cumulative_count = 0
+            for bucket, count in zip(list(self.latency_buckets) + ["+Inf"], histogram[:-1]):
+                cumulative_count += count
+                bucket_labels = labels + (("le", str(bucket)),)
+                lines.append("{}_bucket{} {}".format(name, _format_labels(bucket_labels), cumulative_count))
+            lines.append("{}_sum{} {}".format(name, _format_labels(labels), _format_value(histogram[-1])))
+            lines.append("{}_count{} {}".format(name, _format_labels(labels), cumulative_count))
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+            Exposes the metrics on http://host:port/metrics from a daemon thread.
+            Returns the HTTP server, call its shutdown() method to stop it
+        """
+        # imported here, the scanner imports this module for its metric names
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def dump_periodically(self, path, interval=10.0):
+        """
+            Writes the metrics to path every interval seconds from a daemon
+            thread, for batch jobs. Returns a function stopping the dumps
+            after a last one
+        """
+        stop_event = threading.Event()
+
+        def dump_loop():
+            while not stop_event.wait(interval):
+                self.dump(path)
+            self.dump(path)
+
+        dump_thread = threading.Thread(target=dump_loop, daemon=True)
+        dump_thread.start()
+
+        def stop():
+            stop_event.set()
+            dump_thread.join()
+
+        return stop
+
+    def dump(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w+") as f_metrics:
+            f_metrics.write(self.to_prometheus())
+        # readers never see a partially written file
+        os.replace(tmp_path, path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
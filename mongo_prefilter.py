@@ -0,0 +1,131 @@
+from expected_profile import BROWSER_TO_ETSL, PRODUCT_SUB_20030107_BROWSERS
+
+# field of the documents returned by the pipeline with the verdicts computed by MongoDB
+PREFILTER_FIELD = "_prefilter"
+
+# fields read when a Fingerprint is created
+FINGERPRINT_FIELDS = [
+    "browser.userAgent", "browser.userAgentHttp", "browser.name", "browser.version", "browser.localStorage",
+    "browser.dnt", "browser.languageHttp", "os.name", "os.platform", "os.colorDepth", "os.hardwareConcurrency",
+    "os.processors", "os.oscpu", "os.devicesBlockedByBrave", "os.videoCard", "os.touchScreen",
+    "geolocation.timezone", "scanner.mediaQueries", "scanner.canvasDesc", "scanner.historyDesc",
+    "scanner.screenDesc", "scanner.bindDesc", "scanner.timezoneOffsetDesc", "scanner.accelerometerUsed",
+    "scanner.productSub", "scanner.resOverflow", "scanner.etsl", "scanner.errorsGenerated",
+    "unknownImageError", "fpjs2", "augurIncons", "realBrowser", "realOS", "realVersion", "countermeasure",
+]
+
+# large fields parsed on first access, only needed by the analyses that read
+# them and by guess_real_info. They are left out of the pipeline and fetched
+# afterwards for the fingerprints whose scan reads them, see large_fields
+LAZY_FIELDS = {
+    "CANVAS_PIXELS": ["browser.canvas"],
+    "FONTS_OS": ["browser.fonts"],
+    "PLUGINS_OS": ["browser.plugins"],
+    "FEATURES_BROWSER": ["scanner.modernizr"],
+    "NAVIGATOR_OVERWRITTEN": ["scanner.navigatorPrototype"],
+}
+# guess_real_info checks if the canvas can be decoded on Android
+GUESS_REAL_INFO_FIELDS = ["browser.canvas", "browser.fonts", "browser.plugins", "scanner.modernizr",
+                          "scanner.navigatorPrototype"]
+# fields parsed on first access that no analysis reads, short enough to be always fetched
+OTHER_LAZY_FIELDS = ["os.languages", "os.resolution", "browser.mimeTypes", "overwrittenObjects"]
+
+def _is_string(expression):
+    # strings sort after numbers and before objects in the BSON order
+    return {"$and": [{"$gte": [expression, ""]}, {"$lt": [expression, {}]}]}
+
+
+def prefilter_flags():
+    """
+        Expressions computing the verdict of the analyses that only compare
+        fields of the document. A verdict is None when it needs the parsed
+        user agent, the scanner then runs the analysis itself. The verdicts
+        are computed for the browser claimed by browser.name, kept in
+        "browser" so the scanner can check it is the one of the fingerprint
+    """
+    claimed_browser = {"$cond": [{"$eq": ["$browser.name", "Chromium"]}, "Chrome", "$browser.name"]}
+    # productSub is "" when it is missing
+    product_sub = {"$ifNull": ["$scanner.productSub", ""]}
+    return {
+        "browser": claimed_browser,
+        # on IE, the browser and OS parsed from both user agents are compared
+        "SAME_UAS": {"$cond": [{"$eq": [claimed_browser, "IE"]}, None,
+                               {"$eq": ["$browser.userAgent", "$browser.userAgentHttp"]}]},
+        "CANVAS_OVERWRITTEN": {"$cond": [_is_string("$scanner.canvasDesc"),
+                                         {"$regexMatch": {"input": "$scanner.canvasDesc", "regex": "native code"}},
+                                         None]},
+        "SCREEN_OVERWRITTEN": {"$ne": ["$scanner.screenDesc", "error"]},
+        "TIMEZONE_OVERWRITTEN": {"$ne": ["$scanner.timezoneOffsetDesc", "error"]},
+        "ETSL": {"$switch": {
+            "branches": [{"case": {"$eq": [claimed_browser, browser]}, "then": {"$eq": ["$scanner.etsl", etsl]}}
+                         for browser, etsl in sorted(BROWSER_TO_ETSL.items())],
+            # the length is unknown for the browser
+            "default": True}},
+        "PRODUCT_SUB": {"$switch": {
+            "branches": [{"case": {"$in": [claimed_browser, sorted(PRODUCT_SUB_20030107_BROWSERS)]},
+                          "then": {"$eq": [product_sub, "20030107"]}},
+                         {"case": {"$eq": [claimed_browser, "Other"]}, "then": True}],
+            "default": {"$ne": [product_sub, "20030107"]}}},
+    }
+
+
+def prefilter_pipeline(query=None):
+    """
+        Aggregation pipeline returning the documents matching query with
+        the verdicts of prefilter_flags and only the small fields: the ones
+        needed to create the fingerprints and OTHER_LAZY_FIELDS. The lazy
+        fields fetched are listed in the "fields" of the verdicts, the
+        attributes of the fingerprints parsed from the other ones raise a
+        KeyError until they are added, see large_fields
+    """
+    lazy_fields = sorted(OTHER_LAZY_FIELDS)
+    projection = {field: 1 for field in FINGERPRINT_FIELDS + lazy_fields}
+    projection[PREFILTER_FIELD] = dict(prefilter_flags(), fields={"$literal": lazy_fields})
+    pipeline = []
+    if query:
+        pipeline.append({"$match": query})
+    pipeline.append({"$project": projection})
+    return pipeline
+
+
+def large_fields(document, analyses=None, run_all=True, guess_real_info=True):
+    """
+        Sorted large fields the scan of a document of the prefilter pipeline
+        reads: the ones of analyses (names of Scanner.ANALYSES, all by
+        default) and, if guess_real_info is True, the ones needed to guess
+        the real OS and browser. Unless run_all is True, the scan stops at
+        the first inconsistency: the fields of the analyses after a verdict
+        of MongoDB finding one are not read, e.g. the canvas
+    """
+    from inconsistency_scanner import Analysis
+    if analyses is None:
+        analyses = LAZY_FIELDS.keys()
+    fields = list(GUESS_REAL_INFO_FIELDS) if guess_real_info else []
+    prefilter = document[PREFILTER_FIELD]
+    # the scanner only uses the verdicts computed for the browser of the
+    # fingerprint, the ground truth of a Chrome fingerprint may replace it
+    # by the browser of the HTTP user agent, see Fingerprint
+    use_verdicts = not run_all and document.get("realBrowser") != "chr"
+    for analysis in Analysis:
+        if analysis.name in analyses:
+            fields += LAZY_FIELDS.get(analysis.name, [])
+        if use_verdicts and prefilter.get(analysis.name) is False:
+            break
+    return sorted(set(fields))
+
+
+def add_fields(document, fields, fetched_document):
+    """
+        Adds fields of fetched_document, fetched after the pipeline,
+        to a document of the pipeline and to the "fields" of its verdicts
+    """
+    for field in fields:
+        keys = field.split(".")
+        source, target = fetched_document, document
+        for key in keys[:-1]:
+            source = source.get(key, dict())
+            target = target.setdefault(key, dict())
+        if keys[-1] in source:
+            target[keys[-1]] = source[keys[-1]]
+    prefilter = document[PREFILTER_FIELD]
+    prefilter["fields"] = sorted(set(prefilter["fields"]).union(fields))
@@ -0,0 +1,236 @@
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from fingerprint import Fingerprint, lazy_attribute
+from inconsistency_scanner import Scanner
+from metrics import QUEUE_DEPTH
+
+# offsets of the canvases in an arena are aligned on this number of bytes
+ALIGNMENT = 64
+
+
+class CanvasArena:
+    """
+        Shared memory segment holding the decoded canvases of a batch of
+        fingerprints, one after the other.
+        reset() recycles the segment for the next batch, it is only
+        reallocated when a batch doesn't fit
+    """
+
+    def __init__(self, size=16 * 1024 * 1024):
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.offset = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def reset(self):
+        self.offset = 0
+
+    def reserve(self, nbytes):
+        """
+            Makes sure nbytes can be stored after reset(),
+            growing the segment if needed. Must not be called while
+            workers still read the arena
+        """
+        if nbytes > self.shm.size:
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 2 * self.shm.size))
+        self.reset()
+
+    def put(self, array):
+        """
+            Copies array in the arena and returns its location,
+            a tuple (offset, shape, dtype)
+        """
+        nbytes = array.nbytes
+        if self.offset + nbytes > self.shm.size:
+            raise MemoryError("canvas arena is full, call reserve() before the batch")
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=self.offset)
+        view[...] = array
+        location = (self.offset, array.shape, array.dtype.str)
+        self.offset += (nbytes + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+        return location
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# shared memory segments attached by a worker process, by name
+_attached_arenas = dict()
+
+
+def _attach_canvas(arena_name, location):
+    if arena_name not in _attached_arenas:
+        if len(_attached_arenas) >= 2:
+            # the parent replaced one of its two arenas by a bigger one
+            _attached_arenas.pop(next(iter(_attached_arenas))).close()
+        _attached_arenas[arena_name] = shared_memory.SharedMemory(name=arena_name)
+
+    offset, shape, dtype = location
+    canvas_img = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached_arenas[arena_name].buf, offset=offset)
+    canvas_img.setflags(write=False)
+    return canvas_img
+
+
+# fields of the document parsed by the analyses in the workers, the
+# canvas is read from a CanvasArena and the other fields are left out
+WORKER_LAZY_FIELDS = ["browser.fonts", "browser.plugins", "scanner.modernizr", "scanner.navigatorPrototype"]
+
+
+class SharedCanvasFingerprint(Fingerprint):
+    """
+        Fingerprint sent to the worker processes. It holds the parsed
+        attributes of a Fingerprint and, from its raw document, only the
+        WORKER_LAZY_FIELDS not parsed yet: the decoded canvas is read
+        from a CanvasArena
+    """
+
+    def __init__(self, fingerprint, arena_name, canvas_location):
+        for attribute, value in vars(fingerprint).items():
+            if attribute not in ("canvas", "canvas_img", "_raw_values", "_lazy_fields"):
+                self.__dict__[attribute] = value
+
+        # computed while the data URI is there, for the canvas index of the scanner
+        self.canvas_hash = fingerprint.canvas_hash
+        self._lazy_fields = [field for field in WORKER_LAZY_FIELDS
+                             if fingerprint._lazy_fields is None or field in fingerprint._lazy_fields]
+        self._raw_values = dict()
+        for field in self._lazy_fields:
+            section, key = field.split(".")
+            if key in fingerprint._raw_values.get(section, ()):
+                self._raw_values.setdefault(section, dict())[key] = fingerprint._raw_values[section][key]
+
+        self._arena_name = arena_name
+        self._canvas_location = canvas_location
+
+    @lazy_attribute
+    def canvas_img(self):
+        if self._canvas_location is None:
+            return None
+        return _attach_canvas(self._arena_name, self._canvas_location)
+
+    @lazy_attribute
+    def canvas(self):
+        raise AttributeError("the canvas data URI stays in the parent process, use canvas_img")
+
+
+_worker_scanner = None
+_worker_run_all = True
+_worker_budget = None
+
+
+def _init_worker(scanner_parameters, run_all, budget=None):
+    global _worker_scanner, _worker_run_all, _worker_budget
+    _worker_scanner = Scanner(**scanner_parameters)
+    _worker_run_all = run_all
+    _worker_budget = budget
+
+
+def _scan_shared_fingerprint(fingerprint):
+    # the budget starts when the worker gets the fingerprint
+    deadline = time.perf_counter() + _worker_budget if _worker_budget is not None else None
+    try:
+        with _worker_scanner.pin_rule_data():
+            scan_outcome = _worker_scanner.scan_fingerprint(fingerprint, run_all=_worker_run_all, deadline=deadline)
+            real_info = _worker_scanner.guess_real_info(fingerprint, scan_outcome)
+    finally:
+        # releases the view on the arena before it is recycled
+        fingerprint.__dict__.pop("canvas_img", None)
+    return scan_outcome, real_info
+
+
+class ParallelScanner:
+    """
+        Scans fingerprints in a pool of worker processes.
+        Canvases are decoded by the parent into one of two CanvasArena
+        used alternately: while the workers scan a batch, the next one is
+        decoded in the other arena
+    """
+
+    def __init__(self, scanner_parameters, workers=None, batch_size=256, run_all=True, metrics=None, budget=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        # MetricsRegistry updated with the outcomes of the workers and
+        # the number of fingerprints submitted to them
+        self.metrics = metrics
+        self.nb_pending = 0
+        self.arenas = [CanvasArena(), CanvasArena()]
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                         initargs=(scanner_parameters, run_all, budget))
+
+    def scan(self, fingerprints):
+        """
+            Yields (fingerprint, ScanOutcome, (real_os, real_browser, real_versions))
+            tuples, in the order of fingerprints
+        """
+        pending = None
+        batch = []
+        batch_index = 0
+        for fingerprint in fingerprints:
+            batch.append(fingerprint)
+            if len(batch) == self.batch_size:
+                submitted = self.__submit(batch, self.arenas[batch_index % 2])
+                if pending is not None:
+                    yield from self.__collect(pending)
+                pending = submitted
+                batch = []
+                batch_index += 1
+
+        if batch:
+            submitted = self.__submit(batch, self.arenas[batch_index % 2])
+            if pending is not None:
+                yield from self.__collect(pending)
+            pending = submitted
+
+        if pending is not None:
+            yield from self.__collect(pending)
+
+    def __submit(self, batch, arena):
+        canvases = []
+        for fingerprint in batch:
+            was_decoded = "canvas_img" in vars(fingerprint)
+            canvases.append(fingerprint.canvas_img)
+            if not was_decoded:
+                # the parent doesn't keep the decoded canvases of the corpus
+                del fingerprint.canvas_img
+
+        arena.reserve(sum((img.nbytes + ALIGNMENT) for img in canvases if img is not None))
+        proxies = []
+        for fingerprint, canvas_img in zip(batch, canvases):
+            location = arena.put(canvas_img) if canvas_img is not None else None
+            proxies.append(SharedCanvasFingerprint(fingerprint, arena.name, location))
+
+        self.nb_pending += len(batch)
+        if self.metrics is not None:
+            self.metrics.set_gauge(QUEUE_DEPTH, self.nb_pending, (("queue", "workers"),))
+
+        chunksize = max(1, len(proxies) // (4 * self.workers))
+        return batch, self.pool.map_async(_scan_shared_fingerprint, proxies, chunksize)
+
+    def __collect(self, pending):
+        batch, async_result = pending
+        results = async_result.get()
+        self.nb_pending -= len(batch)
+        if self.metrics is not None:
+            self.metrics.set_gauge(QUEUE_DEPTH, self.nb_pending, (("queue", "workers"),))
+            for scan_outcome, _ in results:
+                self.metrics.record_outcome(scan_outcome)
+
+        for fingerprint, (scan_outcome, real_info) in zip(batch, results):
+            yield fingerprint, scan_outcome, real_info
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for arena in self.arenas:
+            arena.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
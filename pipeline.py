@@ -0,0 +1,261 @@
+import heapq
+import queue
+import threading
+import time
+from fingerprint import Fingerprint, lazy_attribute
+from metrics import LOADED, QUEUE_DEPTH
+
+PIPELINE_STATS_HEADER = ["stage", "workers", "nb_items", "items_per_second", "busy_seconds", "idle_seconds",
+                         "blocked_seconds", "utilization"]
+
+# attributes parsed by the parse stage, the canvas decoding included
+PARSED_ATTRIBUTES = [name for name, value in vars(Fingerprint).items() if isinstance(value, lazy_attribute)]
+
+_END = object()
+
+
+class StageStats:
+    """
+        Time spent by the workers of a stage: busy processing items, idle
+        waiting for an item from the previous stage, and blocked waiting for
+        room in the queue of the next stage. The bottleneck is the stage
+        busy most of the time, the stages after it are idle and the stages
+        before it are blocked
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.nb_items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self.__lock = threading.Lock()
+
+    def add(self, nb_items=0, busy=0.0, idle=0.0, blocked=0.0):
+        with self.__lock:
+            self.nb_items += nb_items
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+
+    def row(self, elapsed_time):
+        utilization = self.busy / (elapsed_time * self.workers) if elapsed_time > 0 else 0.0
+        throughput = self.nb_items / elapsed_time if elapsed_time > 0 else 0.0
+        return [self.name, self.workers, self.nb_items, throughput, self.busy, self.idle, self.blocked, utilization]
+
+
+class Pipeline:
+    """
+        Runs items of source through stages, a list of (name, function,
+        workers), each stage in its own threads. The stages are joined by
+        queues of queue_size items: a stage slower than the next ones
+        blocks the previous ones instead of piling up items.
+        run() yields the results of the last stage in the order of source,
+        the time spent by the caller between two results is the one of
+        the last stage, named last_stage. At most queue_size items are
+        between the reader and the caller: a slow item blocks the reader
+        instead of piling up the results after it in the reorder buffer
+    """
+
+    def __init__(self, source, stages, queue_size=256, last_stage="output", metrics=None):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.stats = [StageStats("read", 1)] + [StageStats(name, workers) for name, _, workers in stages] + \
+                     [StageStats(last_stage, 1)]
+        self.queues = [queue.Queue(queue_size) for _ in range(len(stages) + 1)]
+        self.elapsed_time = 0.0
+        # exception of a stage, raised again by run()
+        self.errors = []
+        self.__stop = threading.Event()
+        # one per item read and not yielded yet
+        self.__window = threading.Semaphore(queue_size)
+
+    def __put(self, queue_index, item):
+        # False if the pipeline is stopped
+        while not self.__stop.is_set():
+            try:
+                self.queues[queue_index].put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            if self.metrics is not None:
+                self.metrics.set_gauge(QUEUE_DEPTH, self.queues[queue_index].qsize(),
+                                       (("queue", self.stats[queue_index + 1].name),))
+            return True
+        return False
+
+    def __get(self, queue_index):
+        while not self.__stop.is_set():
+            try:
+                return self.queues[queue_index].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def __acquire_window(self):
+        # False if the pipeline is stopped
+        while not self.__stop.is_set():
+            if self.__window.acquire(timeout=0.1):
+                return True
+        return False
+
+    def __read(self):
+        stats = self.stats[0]
+        try:
+            iterator = iter(self.source)
+            sequence = 0
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _END)
+                read = time.perf_counter()
+                if item is _END:
+                    break
+                if not self.__acquire_window() or not self.__put(0, (sequence, item)):
+                    return
+                stats.add(1, busy=read - start, blocked=time.perf_counter() - read)
+                sequence += 1
+        except Exception as e:
+            self.__fail(e)
+        finally:
+            self.__put(0, _END)
+
+    def __work(self, stage_index, function, finished_workers):
+        stats = self.stats[stage_index + 1]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self.__get(stage_index)
+                got = time.perf_counter()
+                if item is _END:
+                    stats.add(idle=got - start)
+                    break
+                sequence, value = item
+                result = function(value)
+                done = time.perf_counter()
+                if not self.__put(stage_index + 1, (sequence, result)):
+                    return
+                stats.add(1, busy=done - got, idle=got - start, blocked=time.perf_counter() - done)
+        except Exception as e:
+            self.__fail(e)
+        finally:
+            # the other workers of the stage need the end marker too, the
+            # last one to finish passes it to the next stage
+            with finished_workers[1]:
+                finished_workers[0] += 1
+                last = finished_workers[0] == self.stages[stage_index][2]
+            if last:
+                self.__put(stage_index + 1, _END)
+            else:
+                self.__put(stage_index, _END)
+
+    def __fail(self, exception):
+        self.errors.append(exception)
+        self.__stop.set()
+
+    def run(self):
+        start_time = time.perf_counter()
+        threads = [threading.Thread(target=self.__read, daemon=True)]
+        for stage_index, (_, function, workers) in enumerate(self.stages):
+            finished_workers = [0, threading.Lock()]
+            threads += [threading.Thread(target=self.__work, args=(stage_index, function, finished_workers),
+                                         daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        stats = self.stats[-1]
+        # results ahead of the next one in the order of source
+        reorder_buffer = []
+        next_sequence = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self.__get(len(self.stages))
+                stats.add(idle=time.perf_counter() - start)
+                if item is _END:
+                    break
+                heapq.heappush(reorder_buffer, (item[0], id(item[1]), item[1]))
+                while reorder_buffer and reorder_buffer[0][0] == next_sequence:
+                    result = heapq.heappop(reorder_buffer)[2]
+                    next_sequence += 1
+                    self.__window.release()
+                    start = time.perf_counter()
+                    yield result
+                    stats.add(1, busy=time.perf_counter() - start)
+        finally:
+            self.__stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed_time = time.perf_counter() - start_time
+        if self.errors:
+            raise self.errors[0]
+
+    def rows(self):
+        return [stats.row(self.elapsed_time) for stats in self.stats]
+
+    def write_stats(self, stats_file):
+        with open(stats_file, 'w+') as f_stats:
+            f_stats.write('{}\n'.format(",".join(PIPELINE_STATS_HEADER)))
+            for row in self.rows():
+                f_stats.write('{},{:d},{:d},{:f},{:f},{:f},{:f},{:f}\n'.format(*row))
+
+    def report(self):
+        lines = ["Pipeline of {:.2f} s".format(self.elapsed_time)]
+        rows = self.rows()
+        for name, workers, nb_items, throughput, busy, idle, blocked, utilization in rows:
+            lines.append("{}: {:d} workers, {:d} items, {:.1f} items/s, busy {:.1%}, idle {:.2f} s, "
+                         "blocked {:.2f} s".format(name, workers, nb_items, throughput, utilization, idle, blocked))
+        bottleneck = max(rows, key=lambda row: row[-1])
+        lines.append("Bottleneck: {}".format(bottleneck[0]))
+        return "\n".join(lines)
+
+
+def parse_fingerprint(document):
+    """
+        Fingerprint of a document with all its lazy attributes parsed
+    """
+    fingerprint = Fingerprint(document)
+    for name in PARSED_ATTRIBUTES:
+        try:
+            getattr(fingerprint, name)
+        except Exception:
+            # raised again by the analysis that needs it
+            pass
+    return fingerprint
+
+
+class ScanPipeline:
+    """
+        Scans fingerprint documents read lazily, e.g. from a Mongo cursor,
+        in four stages: reading, parsing (creation of the fingerprints and
+        canvas decoding included) in parse_threads threads, scanning in
+        scan_threads threads, and writing by the caller.
+        Like ParallelScanner.scan, scan() yields (fingerprint, ScanOutcome,
+        real info) tuples in the order of the documents
+    """
+
+    def __init__(self, scanner, parse_threads=2, scan_threads=1, queue_size=256, budget=None):
+        self.scanner = scanner
+        self.parse_threads = parse_threads
+        self.scan_threads = scan_threads
+        self.queue_size = queue_size
+        self.budget = budget
+        self.pipeline = None
+
+    def __parse(self, document):
+        if self.scanner.metrics is not None:
+            self.scanner.metrics.increment(LOADED)
+        return parse_fingerprint(document)
+
+    def __scan(self, fingerprint):
+        deadline = time.perf_counter() + self.budget if self.budget is not None else None
+        with self.scanner.pin_rule_data():
+            scan_outcome = self.scanner.scan_fingerprint(fingerprint, run_all=True, deadline=deadline)
+            return fingerprint, scan_outcome, self.scanner.guess_real_info(fingerprint, scan_outcome)
+
+    def scan(self, documents):
+        stages = [("parse", self.__parse, self.parse_threads), ("scan", self.__scan, self.scan_threads)]
+        self.pipeline = Pipeline(documents, stages, self.queue_size, last_stage="write",
+                                 metrics=self.scanner.metrics)
+        return self.pipeline.run()
@@ -0,0 +1,235 @@
+import cProfile
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        # cProfile profiles of the stage, empty if it only ran in other
+        # threads than the main one, see StageProfiler
+        self.profiles = []
+        self.calls = 0
+        self.elapsed_time = 0.0
+        # highest memory allocated during the stage, above the memory
+        # allocated when it started
+        self.peak_memory = 0
+
+
+class StageProfiler:
+    """
+        CPU and memory profiler split by stage (Mongo fetch, construction
+        of the fingerprints, each analysis...).
+        Each stage has its own cProfile profile, and its peak memory is
+        measured with tracemalloc. When stages are nested, the elapsed_time
+        of the outer stage includes the inner one, only its cProfile data
+        leaves out the functions called in the inner stage.
+        Stages can run in several threads, each one has its own stack of
+        running stages, but only the stages of the main thread are profiled:
+        since Python 3.12 a single cProfile profile can be enabled at a time.
+        The stages of the other threads, or of a process already profiled
+        (e.g. by python -m cProfile), are only timed. tracemalloc is global
+        to the process: the peak memory of a stage includes the allocations
+        of the other threads
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = dict()
+        self.__lock = threading.Lock()
+        # per thread: frames of the running stages, [StageStats, memory at start, peak,
+        # enabled profile or None]
+        self.__local = threading.local()
+        # cProfile profile of each stage in the main thread
+        self.__profiles = dict()
+
+    @property
+    def running(self):
+        running = getattr(self.__local, "running", None)
+        if running is None:
+            running = self.__local.running = []
+        return running
+
+    def __profile(self, stage_stats):
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        profile = self.__profiles.get(stage_stats.name)
+        if profile is None:
+            profile = self.__profiles[stage_stats.name] = cProfile.Profile()
+            with self.__lock:
+                stage_stats.profiles.append(profile)
+        return profile
+
+    @staticmethod
+    def __enable(profile):
+        """
+            Enables profile and returns it, None if it is None or
+            can't be enabled because another profiler is active
+        """
+        if profile is None:
+            return None
+        try:
+            profile.enable()
+        except ValueError:
+            return None
+        return profile
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        with self.__lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats(name)
+            stage_stats = self.stages[name]
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        running = self.running
+        profile = self.__profile(stage_stats)
+
+        if running:
+            parent = running[-1]
+            if parent[3] is not None:
+                parent[3].disable()
+            if tracing:
+                parent[2] = max(parent[2], tracemalloc.get_traced_memory()[1])
+
+        frame = [stage_stats, 0, 0, None]
+        if tracing:
+            tracemalloc.reset_peak()
+            frame[1] = tracemalloc.get_traced_memory()[0]
+        running.append(frame)
+
+        start = time.perf_counter()
+        frame[3] = self.__enable(profile)
+        try:
+            yield
+        finally:
+            if frame[3] is not None:
+                frame[3].disable()
+            elapsed_time = time.perf_counter() - start
+            running.pop()
+
+            peak_memory = 0
+            if tracing:
+                peak = max(frame[2], tracemalloc.get_traced_memory()[1])
+                peak_memory = peak - frame[1]
+                if running:
+                    # the peak of the inner stage is also a peak of the outer one
+                    running[-1][2] = max(running[-1][2], peak)
+                tracemalloc.reset_peak()
+
+            with self.__lock:
+                stage_stats.elapsed_time += elapsed_time
+                stage_stats.calls += 1
+                stage_stats.peak_memory = max(stage_stats.peak_memory, peak_memory)
+
+            if running:
+                running[-1][3] = self.__enable(running[-1][3])
+
+    def write_report(self, prefix, nb_functions=20):
+        """
+            Writes prefix.txt, a summary per stage followed by the
+            most expensive functions of each stage, and prefix.collapsed,
+            the collapsed stacks (one "stage;frame;frame value" line,
+            value in microseconds) read by flame graph tools
+        """
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        stages = sorted(self.stages.values(), key=lambda x: x.elapsed_time, reverse=True)
+        with open(prefix + '.txt', 'w+') as f_report:
+            f_report.write('{:<28} {:>10} {:>14} {:>14} {:>16}\n'.format(
+                'stage', 'calls', 'total_time', 'mean_time', 'peak_memory_kb'))
+            for stage_stats in stages:
+                f_report.write('{:<28} {:>10d} {:>14f} {:>14f} {:>16.1f}\n'.format(
+                    stage_stats.name, stage_stats.calls, stage_stats.elapsed_time,
+                    stage_stats.elapsed_time / max(stage_stats.calls, 1),
+                    stage_stats.peak_memory / 1024))
+
+            for stage_stats in stages:
+                f_report.write('\n----- {} -----\n'.format(stage_stats.name))
+                try:
+                    stats = pstats.Stats(*stage_stats.profiles, stream=f_report)
+                except TypeError:
+                    # nothing was profiled in this stage
+                    continue
+                stats.sort_stats('cumulative').print_stats(nb_functions)
+
+        with open(prefix + '.collapsed', 'w+') as f_collapsed:
+            for stage_stats in stages:
+                for stack, value in collapse_stacks(stage_stats).items():
+                    if value > 0:
+                        f_collapsed.write('{} {:d}\n'.format(stack, value))
+
+
+def _frame_label(func):
+    filename, line, name = func
+    if filename == '~':
+        # built-in function
+        return name
+    return '{}:{}({})'.format(os.path.basename(filename), line, name)
+
+
+def collapse_stacks(stage_stats, max_depth=64, min_time=1e-5):
+    """
+        Rebuilds approximate call stacks from the caller/callee times of
+        cProfile: the time of a function called from several places is
+        split between them proportionally to the time of each call edge.
+        Returns a dict "stage;frame;...;frame" -> self time in microseconds
+    """
+    try:
+        stats = pstats.Stats(*stage_stats.profiles).stats
+    except TypeError:
+        return dict()
+
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge))
+
+    collapsed = defaultdict(int)
+
+    def walk(func, path, time_on_path):
+        _, _, self_time, cumulative_time, _ = stats[func]
+        share = time_on_path / cumulative_time if cumulative_time > 0 else 0.0
+        labels = path + [_frame_label(func)]
+        collapsed[';'.join(labels)] += int(self_time * share * 1e6)
+        if len(labels) > max_depth:
+            return
+        for callee, edge in callees.get(func, []):
+            callee_time = edge[3] * share
+            if callee in walking or callee_time < min_time:
+                continue
+            walking.add(callee)
+            walk(callee, labels, callee_time)
+            walking.discard(callee)
+
+    walking = set()
+    for func, (_, _, _, cumulative_time, callers) in stats.items():
+        if not callers:
+            walking.add(func)
+            walk(func, [stage_stats.name], cumulative_time)
+            walking.discard(func)
+
+    return collapsed
+
+
+def profile_stage(profiler, name):
+    """
+        Context manager profiling a stage when profiler is not None
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
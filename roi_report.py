@@ -0,0 +1,65 @@
+import time
+
+from accuracy import COUNTERMEASURES, ConfusionMatrix
+from inconsistency_scanner import Analysis, Scanner
+
+
+def run_roi_report(scanner_parameters, fingerprints, report_file):
+    """
+        Scans the fingerprints with the pixels analysis on the whole canvas
+        and on its regions of interest, and writes the accuracy of both per
+        countermeasure, how often their verdicts on the pixels agree and
+        the time spent in the pixels analysis
+    """
+    modes = [("full", Scanner(**scanner_parameters)),
+             ("roi", Scanner(**dict(scanner_parameters, canvas_roi=True)))]
+    # countermeasure -> mode -> ConfusionMatrix
+    confusion_matrices = dict()
+    # countermeasure -> mode -> seconds spent in the pixels analysis
+    pixels_times = dict()
+    # countermeasure -> number of fingerprints with the same CANVAS_PIXELS verdict
+    agreements = dict()
+
+    for counter, fingerprint in enumerate(fingerprints):
+        countermeasure = fingerprint.countermeasure
+        if countermeasure not in confusion_matrices:
+            confusion_matrices[countermeasure] = {mode: ConfusionMatrix() for mode, _ in modes}
+            pixels_times[countermeasure] = {mode: 0.0 for mode, _ in modes}
+            agreements[countermeasure] = 0
+
+        pixels_verdicts = []
+        for mode, scanner in modes:
+            scan_outcome = scanner.scan_fingerprint(fingerprint, run_all=True)
+            confusion_matrices[countermeasure][mode].add(scanner.should_be_consistent(fingerprint),
+                                                         scan_outcome.is_consistent)
+            pixels_verdicts.append(scan_outcome.has_failed(Analysis.CANVAS_PIXELS))
+            # the pixels analysis timed alone, the other analyses are the same for both modes
+            start = time.perf_counter()
+            scanner.scan_fingerprint(fingerprint, run_all=True, only_pixels=True)
+            pixels_times[countermeasure][mode] += time.perf_counter() - start
+        if pixels_verdicts[0] == pixels_verdicts[1]:
+            agreements[countermeasure] += 1
+
+        if counter % 1000 == 0:
+            print('Fingerprint', counter)
+
+    with open(report_file, 'w+') as f_report:
+        f_report.write('countermeasure,mode,nb_fingerprints,accuracy,tp,fp,tn,fn,pixels_agreement,pixels_time_ms\n')
+        for countermeasure in COUNTERMEASURES:
+            if countermeasure not in confusion_matrices:
+                continue
+            print(countermeasure)
+            for mode, _ in modes:
+                confusion_matrix = confusion_matrices[countermeasure][mode]
+                nb_fingerprints = confusion_matrix.total()
+                agreement = agreements[countermeasure] / nb_fingerprints
+                pixels_time_ms = 1000 * pixels_times[countermeasure][mode] / nb_fingerprints
+                f_report.write('{},{},{:d},{:f},{:d},{:d},{:d},{:d},{:f},{:f}\n'.format(
+                    countermeasure, mode, nb_fingerprints, confusion_matrix.accuracy(),
+                    confusion_matrix.true_positives, confusion_matrix.false_positives,
+                    confusion_matrix.true_negatives, confusion_matrix.false_negatives,
+                    agreement, pixels_time_ms))
+                print("{}: accuracy {:f} ({}), pixels analysis {:f} ms".format(
+                    mode, confusion_matrix.accuracy(), confusion_matrix, pixels_time_ms))
+            print("Same pixels verdict: {:f}".format(agreements[countermeasure] / nb_fingerprints))
+    print("Report written to {}".format(report_file))
@@ -0,0 +1,173 @@
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+from feature_vectors import FeatureVectors
+
+FONTS_FILE = "./experiments/fonts_linked.csv"
+CANIUSE_FILE = "./ressources/data_caniuse_v2.json"
+
+CANIUSE_BROWSER_TO_UA_PARSER = {
+    "chrome": "Chrome",
+    "opera": "Opera",
+    "firefox": "Firefox",
+    "safari": "Safari",
+    "edge": "Edge",
+    "ie": "IE",
+    "and_chr": "Chrome mobile",
+    "android": "Android",
+    "ie_mob": "IE Mobile",
+    "ios_saf": "Mobile Safari"
+}
+
+
+def parse_font_to_os(content):
+    """
+        dict font -> OS family it is linked to, from the lines "font,OS family"
+    """
+    font_to_os = dict()
+    # same lines as the file opened in text mode
+    for line in io.StringIO(content.decode(), newline=None):
+        l_split = line.split(",")
+        font_to_os[l_split[0]] = l_split[1]
+    return font_to_os
+
+
+def is_feature_supported(feature_data):
+    return "y" in feature_data or "a" in feature_data
+
+
+def parse_caniuse_features(content):
+    """
+        Parse json file provided by caniuse.com
+        to translate it to a more usable structure:
+        feature -> browser -> set of versions supporting it
+    """
+    caniuse_data = json.loads(content)
+    features = dict()
+
+    for feature in caniuse_data["data"]:
+        features[feature] = dict()
+        for browser in caniuse_data["data"][feature]["stats"]:
+            if browser in CANIUSE_BROWSER_TO_UA_PARSER:
+                features[feature][CANIUSE_BROWSER_TO_UA_PARSER[browser]] = set()
+                for version in caniuse_data["data"][feature]["stats"][browser]:
+                    versions_split = version.split("-")
+                    if len(versions_split) > 1:
+                        version_key = versions_split[0].split(".")[0]
+                    else:
+                        version_key = version.split(".")[0]
+
+                    if is_feature_supported(caniuse_data["data"][feature]["stats"][browser][version]):
+                        features[feature][CANIUSE_BROWSER_TO_UA_PARSER[browser]].add(version_key)
+
+    return features
+
+
+def files_signature(files):
+    # changes when one of the files is replaced or rewritten
+    signature = []
+    for file in files:
+        try:
+            stat = os.stat(file)
+            signature.append((file, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((file, None, None))
+    return tuple(signature)
+
+
+class RuleData:
+    """
+        Data the analyses compare the fingerprints to, read from the fonts
+        and caniuse files. It is never modified once built: to use new
+        files, a scanner replaces its RuleData by a new one, see RuleDataReloader.
+        version identifies the content of the files
+    """
+
+    def __init__(self, font_to_os, caniuse_features, fonts_version, caniuse_version, feature_vectors=None):
+        self.font_to_os = font_to_os
+        self.caniuse_features = caniuse_features
+        self.feature_vectors = feature_vectors if feature_vectors is not None else FeatureVectors(caniuse_features)
+        self.fonts_version = fonts_version
+        self.caniuse_version = caniuse_version
+        self.version = "{}-{}".format(fonts_version, caniuse_version)
+
+    @classmethod
+    def load(cls, fonts_file=FONTS_FILE, caniuse_file=CANIUSE_FILE, previous=None):
+        """
+            Reads the files. The parts of previous, a RuleData, whose file
+            didn't change are reused, with the vectors already computed
+        """
+        with open(fonts_file, "rb") as f:
+            fonts_content = f.read()
+        with open(caniuse_file, "rb") as f:
+            caniuse_content = f.read()
+        fonts_version = hashlib.sha1(fonts_content).hexdigest()[:8]
+        caniuse_version = hashlib.sha1(caniuse_content).hexdigest()[:8]
+
+        if previous is not None and previous.fonts_version == fonts_version:
+            font_to_os = previous.font_to_os
+        else:
+            font_to_os = parse_font_to_os(fonts_content)
+        if previous is not None and previous.caniuse_version == caniuse_version:
+            return cls(font_to_os, previous.caniuse_features, fonts_version, caniuse_version,
+                       previous.feature_vectors)
+        return cls(font_to_os, parse_caniuse_features(caniuse_content), fonts_version, caniuse_version)
+
+
+class RuleDataReloader:
+    """
+        Thread checking the files of the RuleData of a scanner every
+        interval seconds. When they change, a new RuleData is built in the
+        thread then given to the scanner: the scans in progress end with
+        the former one. If the new files can't be read, the scanner keeps
+        its RuleData until they change again
+    """
+
+    def __init__(self, scanner, interval=5.0, fonts_file=FONTS_FILE, caniuse_file=CANIUSE_FILE):
+        self.scanner = scanner
+        self.interval = interval
+        self.files = (fonts_file, caniuse_file)
+        self.signature = files_signature(self.files)
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__watch, daemon=True)
+
+    def reload_if_changed(self):
+        """
+            Returns True if the scanner got a new RuleData
+        """
+        signature = files_signature(self.files)
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        try:
+            rule_data = RuleData.load(*self.files, previous=self.scanner.rule_data)
+        except (OSError, ValueError, IndexError) as e:
+            # e.g. a file read while it is written, read again once it changes
+            print("rule data not reloaded: {}".format(e), file=sys.stderr)
+            return False
+        if rule_data.version == self.scanner.rule_data.version:
+            return False
+        self.scanner.rule_data = rule_data
+        return True
+
+    def __watch(self):
+        while not self.__stop.wait(self.interval):
+            self.reload_if_changed()
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,115 @@
+import os
+import subprocess
+import time
+import numpy as np
+from differential import iter_synthetic_corpus
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+
+SCALING_BENCH_HEADER = ["revision", "mode", "workers", "nb_fingerprints", "elapsed_time", "fingerprints_per_second",
+                        "speed_up", "efficiency", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms",
+                        "latency_max_ms"]
+
+# parallel execution modes, "sequential" is the reference of the speed-up
+SCALING_MODES = ["sequential", "processes", "canvas_threads"]
+
+
+def revision():
+    """
+        git revision of the scanner, to compare the results of several releases
+    """
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _scan(mode, workers, scanner_parameters, fingerprints):
+    """
+        Yields the fingerprints scanned with mode and workers
+        processes or threads, once their final verdict is known
+    """
+    if mode == "sequential":
+        scanner = Scanner(**scanner_parameters)
+        for fingerprint in fingerprints:
+            with scanner.pin_rule_data():
+                scan_outcome = scanner.scan_fingerprint(fingerprint, run_all=True)
+                scanner.guess_real_info(fingerprint, scan_outcome)
+            yield fingerprint
+    elif mode == "processes":
+        from parallel_scanner import ParallelScanner
+        with ParallelScanner(scanner_parameters, workers=workers) as parallel_scanner:
+            for fingerprint, _, _ in parallel_scanner.scan(fingerprints):
+                yield fingerprint
+    elif mode == "canvas_threads":
+        from scan_command import scan_two_tier
+        for fingerprint, _, _ in scan_two_tier(Scanner(**scanner_parameters), fingerprints, workers):
+            yield fingerprint
+    else:
+        raise ValueError("unknown mode {}, choose among {}".format(mode, ", ".join(SCALING_MODES)))
+
+
+def measure_throughput(mode, workers, scanner_parameters, documents, nb_fingerprints, seed=0):
+    """
+        Scans nb_fingerprints synthetic fingerprints built from documents and
+        returns (elapsed time, latencies). The latency of a fingerprint goes
+        from the moment the mode takes it to its final verdict, queueing included.
+        The fingerprints are built while scanning and not kept, so the corpus
+        can be larger than the memory
+    """
+    submitted = dict()
+
+    def fingerprints():
+        for document in iter_synthetic_corpus(documents, nb_fingerprints, seed):
+            fingerprint = Fingerprint(document)
+            submitted[id(fingerprint)] = time.perf_counter()
+            yield fingerprint
+
+    latencies = np.empty(nb_fingerprints)
+    nb_scanned = 0
+    start = time.perf_counter()
+    for fingerprint in _scan(mode, workers, scanner_parameters, fingerprints()):
+        latencies[nb_scanned] = time.perf_counter() - submitted.pop(id(fingerprint))
+        nb_scanned += 1
+    elapsed_time = time.perf_counter() - start
+    return elapsed_time, latencies[:nb_scanned]
+
+
+def run_scaling_benchmark(scanner_parameters, documents, modes, workers_counts, sizes, bench_file, seed=0):
+    """
+        Measures the throughput and the latency of each mode for each number
+        of workers and corpus size, and appends a row per run to bench_file,
+        so the results of several releases end up in the same table
+    """
+    unknown = [mode for mode in modes if mode not in SCALING_MODES]
+    if unknown:
+        raise ValueError("unknown modes {}, choose among {}".format(", ".join(unknown), ", ".join(SCALING_MODES)))
+
+    current_revision = revision()
+    write_header = not os.path.exists(bench_file)
+    with open(bench_file, 'a') as f_bench:
+        if write_header:
+            f_bench.write('{}\n'.format(",".join(SCALING_BENCH_HEADER)))
+        # the sequential run first, the speed-up of the others is relative to it
+        modes = sorted(modes, key=SCALING_MODES.index)
+        for nb_fingerprints in sizes:
+            # throughput of a single process, reference of the speed-up
+            sequential_throughput = None
+            for mode in modes:
+                # a single sequential run, it has no workers
+                for workers in (workers_counts if mode != "sequential" else [1]):
+                    elapsed_time, latencies = measure_throughput(mode, workers, scanner_parameters, documents,
+                                                                 nb_fingerprints, seed)
+                    throughput = len(latencies) / elapsed_time
+                    if mode == "sequential":
+                        sequential_throughput = throughput
+                    speed_up = throughput / sequential_throughput if sequential_throughput else float('nan')
+                    p50, p95, p99, p_max = 1000 * np.percentile(latencies, [50, 95, 99, 100])
+                    f_bench.write('{},{},{:d},{:d},{:f},{:f},{:f},{:f},{:f},{:f},{:f},{:f}\n'.format(
+                        current_revision, mode, workers, len(latencies), elapsed_time, throughput,
+                        speed_up, speed_up / workers, p50, p95, p99, p_max))
+                    f_bench.flush()
+                    print('{} {:d} workers, {:d} fingerprints: {:.1f} fingerprints/s, speed-up {:.2f}, '
+                          'latency p50 {:.2f} ms p99 {:.2f} ms'.format(mode, workers, len(latencies), throughput,
+                                                                       speed_up, p50, p99))
@@ -0,0 +1,229 @@
+import time
+
+from accuracy import OnlineAccuracy
+from inconsistency_scanner import Analysis
+from profiler import profile_stage
+
+# scan, cm and analyse commands of main.py: scanning the fingerprints,
+# writing the result files and computing the accuracy
+
+
+def analyses_in_columns(scan_outcome):
+    # analyses skipped to meet a deadline have an empty column
+    return [analysis for analysis in Analysis
+            if scan_outcome.has_run(analysis) or scan_outcome.has_been_skipped(analysis)]
+
+
+def generate_analysis_str_vector(fingerprint, scan_outcome, ground_truth):
+    analysis_vector = [fingerprint.countermeasure]
+    for analysis in analyses_in_columns(scan_outcome):
+        if scan_outcome.has_been_skipped(analysis):
+            analysis_vector.append('')
+        else:
+            analysis_vector.append(0) if scan_outcome.has_failed(analysis) else analysis_vector.append(1)
+
+    analysis_vector.append(1) if scan_outcome.is_consistent else analysis_vector.append(0)
+    analysis_vector.append(1) if ground_truth else analysis_vector.append(0)
+    analysis_vector.append(1) if fingerprint.fpjs2_consistent else analysis_vector.append(0)
+    analysis_vector.append(1) if fingerprint.augur_consistent else analysis_vector.append(0)
+
+    return ','.join([str(x) for x in analysis_vector])
+
+
+def generate_real_values_str_vector(fingerprint, real_os_guessed, real_browser_guessed, ground_truth):
+    predict_vec = [
+        fingerprint.countermeasure,
+        str(ground_truth),
+        fingerprint.real_os,
+        fingerprint.real_browser,
+        real_os_guessed,
+        real_browser_guessed
+    ]
+    return ','.join([str(x) for x in predict_vec])
+
+
+def scan_sequentially(scanner, fingerprints, profiler=None, budget=None):
+    for fingerprint in fingerprints:
+        deadline = time.perf_counter() + budget if budget is not None else None
+        with scanner.pin_rule_data():
+            scan_outcome = scanner.scan_fingerprint(fingerprint, run_all=True, deadline=deadline)
+            with profile_stage(profiler, "guess_real_info"):
+                real_info = scanner.guess_real_info(fingerprint, scan_outcome)
+        yield fingerprint, scan_outcome, real_info
+
+
+def scan_two_tier(scanner, fingerprints, threads, max_pending=4096):
+    """
+        Runs the pixels analysis in a pool of threads while the other
+        analyses of the next fingerprints run, see TwoTierScanner.
+        Yields the same tuples as scan_sequentially, in the order the
+        final verdicts are known
+    """
+    import queue
+    from two_tier_scanner import TwoTierScanner
+
+    final_results = queue.Queue()
+
+    def on_final(fingerprint, scan_outcome):
+        final_results.put((fingerprint, scan_outcome, scanner.guess_real_info(fingerprint, scan_outcome)))
+
+    def next_final_result(two_tier_scanner):
+        # a fingerprint whose pixels analysis failed never gets a result
+        while True:
+            try:
+                return final_results.get(timeout=1)
+            except queue.Empty:
+                if two_tier_scanner.errors:
+                    raise two_tier_scanner.errors[0]
+
+    nb_pending = 0
+    with TwoTierScanner(scanner, on_final, threads) as two_tier_scanner:
+        for fingerprint in fingerprints:
+            two_tier_scanner.scan(fingerprint)
+            nb_pending += 1
+            # don't let the first tier get too far ahead
+            while nb_pending > max_pending or not final_results.empty():
+                yield next_final_result(two_tier_scanner)
+                nb_pending -= 1
+
+        while nb_pending > 0:
+            yield next_final_result(two_tier_scanner)
+            nb_pending -= 1
+
+
+def write_scan_result(scanner, counter, fingerprint, scan_outcome, real_info, f_detection, f_real_values):
+    real_os_guessed, real_browser_guessed, _ = real_info
+    ground_truth = scanner.should_be_consistent(fingerprint)
+    analysis_str_vector = generate_analysis_str_vector(fingerprint, scan_outcome, ground_truth)
+    real_values_str_vector = generate_real_values_str_vector(fingerprint, real_os_guessed,
+                                                             real_browser_guessed, ground_truth)
+
+    has_predicted_incons = not scan_outcome.is_consistent
+    if has_predicted_incons or (real_os_guessed != fingerprint.real_os or  real_browser_guessed != fingerprint.real_browser):
+        print("error")
+        print(fingerprint)
+        print(real_os_guessed, real_browser_guessed)
+        for scan_res in scan_outcome.to_analysis_results():
+            if not scan_res.is_consistent:
+                print(scan_res)
+        print('-----')
+    else:
+        print('ok:')
+        print(fingerprint)
+
+    if counter == 0:
+        headers = ",".join(["countermeasure"] + [x.name for x in analyses_in_columns(scan_outcome)] + \
+                  ["prediction", "ground_truth", "fpjs2", "augur"])
+        f_detection.write('{}\n'.format(headers))
+
+        predict_headers = ["countermeasure", "consistent", "realOs", "realBrowser",
+                           "predictedOs", "predictedBrowser"]
+
+        f_real_values.write('{}\n'.format(",".join(predict_headers)))
+
+    f_detection.write('{}\n'.format(analysis_str_vector))
+    f_real_values.write('{}\n'.format(real_values_str_vector))
+
+
+def scan_fingerprints(scanner, fingerprints, prediction_file, real_values_file, workers=1, profiler=None,
+                      snapshot_interval=None, budget=None, canvas_threads=0, stats=None, pipeline=None):
+    """
+        Scans the fingerprints and writes the result files. The accuracy
+        is computed while scanning, printed every snapshot_interval seconds
+        if it is not None, and once the scan is over.
+        budget is None or the time in seconds allowed to scan a fingerprint,
+        the analyses that don't fit are skipped.
+        With canvas_threads > 0, the pixels analysis runs in that many
+        threads behind the other analyses.
+        stats is None or a StreamStatistics updated with each fingerprint scanned.
+        pipeline is None or a ScanPipeline: reading, parsing, scanning and
+        writing then overlap and fingerprints are documents, see pipeline.py
+    """
+    accuracy = OnlineAccuracy(snapshot_interval)
+    if pipeline is not None:
+        parallel_scanner = None
+        scanned_fingerprints = pipeline.scan(fingerprints)
+    elif workers > 1:
+        from parallel_scanner import ParallelScanner
+        parallel_scanner = ParallelScanner(scanner.parameters, workers=workers, metrics=scanner.metrics, budget=budget)
+        scanned_fingerprints = parallel_scanner.scan(fingerprints)
+    elif canvas_threads > 0:
+        parallel_scanner = None
+        scanned_fingerprints = scan_two_tier(scanner, fingerprints, canvas_threads)
+    else:
+        parallel_scanner = None
+        scanned_fingerprints = scan_sequentially(scanner, fingerprints, profiler, budget)
+
+    with open(prediction_file, 'w+') as f_detection, open(real_values_file, 'w+') as f_real_values:
+        for counter, (fingerprint, scan_outcome, real_info) in enumerate(scanned_fingerprints):
+            with profile_stage(profiler, "output_writing"):
+                write_scan_result(scanner, counter, fingerprint, scan_outcome, real_info,
+                                  f_detection, f_real_values)
+            accuracy.add_scan_result(fingerprint, scan_outcome, real_info, scanner.should_be_consistent(fingerprint))
+            accuracy.maybe_print_snapshot()
+            if stats is not None:
+                with profile_stage(profiler, "statistics"):
+                    stats.add(fingerprint, scan_outcome)
+
+    if parallel_scanner is not None:
+        parallel_scanner.close()
+
+    print(accuracy.report(title='Accuracy'))
+    return accuracy
+
+
+def analyse_results(prediction_file, real_values_file):
+    import csv
+
+    accuracy = OnlineAccuracy()
+    with open(prediction_file) as f_detection:
+        for row in csv.DictReader(f_detection):
+            accuracy.add_detection(row['countermeasure'], row['ground_truth'] == '1', row['prediction'] == '1',
+                                   row['fpjs2'] == '1', row['augur'] == '1')
+
+    with open(real_values_file) as f_real_values:
+        for row in csv.DictReader(f_real_values):
+            accuracy.add_guess(row['countermeasure'], row['realOs'], row['realBrowser'],
+                               row['predictedOs'], row['predictedBrowser'])
+
+    print(accuracy.report())
+    return accuracy
+
+
+def scan_and_report(args, scanner, fp_manager, query, profiler, prediction_file, real_values_file,
+                    pipeline_stats_file):
+    """
+        Scans the fingerprints matching query with the options of the scan
+        commands and writes the statistics and the report of the pipeline
+    """
+    stats = None
+    if args.stats is not None:
+        from stream_stats import StreamStatistics
+        stats = StreamStatistics()
+    pipeline = None
+    if args.pipeline:
+        from pipeline import ScanPipeline
+        pipeline = ScanPipeline(scanner, args.parse_threads, args.scan_threads, args.queue_size,
+                                budget_seconds(args))
+        # the documents are read lazily, the fingerprints are created by the parse stage
+        fingerprints = fp_manager.iter_documents(query, args.prefilter)
+    elif args.prefilter:
+        fingerprints = fp_manager.get_prefiltered_fingerprints(query)
+    elif query is not None:
+        fingerprints = fp_manager.get_fingerprints_countermeasure(query['countermeasure'])
+    else:
+        fingerprints = fp_manager.get_all_fingerprints()
+
+    scan_fingerprints(scanner, fingerprints, prediction_file, real_values_file, args.workers, profiler,
+                      args.accuracy_interval, budget_seconds(args), args.canvas_threads, stats, pipeline)
+    if pipeline is not None:
+        print(pipeline.pipeline.report())
+        pipeline.pipeline.write_stats(pipeline_stats_file)
+    if stats is not None:
+        stats.save(args.stats)
+        print(stats.report())
+        print("Statistics written to {}".format(args.stats))
+
+
+def budget_seconds(args):
+    return args.budget_ms / 1000 if args.budget_ms is not None else None
@@ -0,0 +1,233 @@
+import gc
+import io
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from bson import json_util
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from rule_data import RuleDataReloader
+
+# scanner of the daemon, created before the workers are forked so
+# they share its read-only data (fonts, caniuse...) copy-on-write
+_daemon_scanner = None
+_daemon_run_all = True
+_daemon_budget = None
+_daemon_reloader = None
+
+
+def _json_default(value):
+    # numpy values and sets of the data of the failed analyses, ObjectIds...
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return json_util.default(value)
+
+
+def scan_line(line):
+    """
+        Scans the fingerprint document of an NDJSON line, in MongoDB
+        extended JSON as written by mongoexport, and returns the result line.
+        A document that can't be scanned gives a line with an "error" field
+        instead of stopping the stream
+    """
+    document_id = None
+    try:
+        document = json_util.loads(line)
+        document_id = document.setdefault("_id", None)
+        fingerprint = Fingerprint(document)
+        # the budget starts when the worker gets the fingerprint
+        deadline = time.perf_counter() + _daemon_budget if _daemon_budget is not None else None
+        with _daemon_scanner.pin_rule_data():
+            scan_outcome = _daemon_scanner.scan_fingerprint(fingerprint, run_all=_daemon_run_all, deadline=deadline)
+            real_os, real_browser, real_versions = _daemon_scanner.guess_real_info(fingerprint, scan_outcome)
+        result = dict(
+            _id=str(document_id) if document_id is not None else None,
+            consistent=scan_outcome.is_consistent,
+            failed=[analysis.name for analysis in scan_outcome.analyses_failed()],
+            skipped=[analysis.name for analysis in scan_outcome.analyses_skipped()],
+            details={analysis.name: data for analysis, data in (scan_outcome.details or dict()).items()},
+            real_os=real_os,
+            real_browser=real_browser,
+            real_versions=sorted(real_versions),
+            data_version=scan_outcome.data_version,
+        )
+    except Exception as e:
+        result = dict(_id=str(document_id) if document_id is not None else None,
+                      error="{}: {}".format(type(e).__name__, e))
+    return json.dumps(result, default=_json_default)
+
+
+def _start_reloader(reload_interval):
+    # each process checks the files, the RuleData built after the fork isn't shared
+    global _daemon_reloader
+    _daemon_reloader = RuleDataReloader(_daemon_scanner, reload_interval).start()
+
+
+def _init_worker(reload_interval):
+    # a Ctrl-C stops the daemon, which then stops its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if reload_interval:
+        _start_reloader(reload_interval)
+
+
+class ScanDaemon:
+    """
+        Long-lived scanner reading fingerprint documents as NDJSON and
+        writing a result line per document, in the same order.
+        The scanner is created once, then with workers > 1, workers
+        processes are forked, so each request only pays for its scan.
+        With reload_interval, the fonts and caniuse files are checked every
+        reload_interval seconds and the scanners use them once they change
+    """
+
+    def __init__(self, scanner_parameters, workers=1, run_all=True, budget=None, max_pending=1024,
+                 reload_interval=None):
+        global _daemon_scanner, _daemon_run_all, _daemon_budget
+        _daemon_scanner = Scanner(**scanner_parameters)
+        _daemon_run_all = run_all
+        _daemon_budget = budget
+        # number of documents read ahead of the result being written
+        self.max_pending = max_pending
+        self.pool = None
+        if workers > 1:
+            # the objects created so far move to the permanent generation: the
+            # collections of the workers don't touch them and their pages stay shared
+            gc.collect()
+            gc.freeze()
+            # unlike a multiprocessing.Pool, the executor fails the pending
+            # scans when a worker dies instead of waiting for them forever
+            self.pool = ProcessPoolExecutor(workers, multiprocessing.get_context("fork"), _init_worker,
+                                            (reload_interval,))
+            # the workers are forked on the first scan, before the threads of serve_stream start
+            self.pool.submit(os.getpid).result()
+        elif reload_interval:
+            _start_reloader(reload_interval)
+
+    def serve_stream(self, f_in, f_out):
+        """
+            Scans the NDJSON lines of f_in until its end and writes the
+            result lines to f_out, flushed one by one so a client can
+            wait for the result of a document before sending the next one.
+            If a worker dies, the reading stops and BrokenProcessPool is raised
+        """
+        if self.pool is None:
+            for line in f_in:
+                if line.strip():
+                    f_out.write(scan_line(line) + "\n")
+                    f_out.flush()
+            return
+
+        pending = queue.Queue(self.max_pending)
+        # error of the writer: the client is gone or a worker died
+        writer_error = []
+
+        def write_results():
+            while True:
+                future = pending.get()
+                if future is None:
+                    return
+                if writer_error:
+                    # the remaining results are dropped
+                    future.cancel()
+                    continue
+                try:
+                    result = future.result()
+                    f_out.write(result + "\n")
+                    f_out.flush()
+                except (OSError, ValueError, BrokenProcessPool) as e:
+                    writer_error.append(e)
+
+        def put(item):
+            # the writer may have stopped taking results
+            while not writer_error:
+                try:
+                    pending.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        writer = threading.Thread(target=write_results, daemon=True)
+        writer.start()
+        try:
+            for line in f_in:
+                if writer_error:
+                    break
+                if line.strip():
+                    put(self.pool.submit(scan_line, line))
+        finally:
+            # the writer empties the queue until the end marker
+            pending.put(None)
+            writer.join()
+        if writer_error and isinstance(writer_error[0], BrokenProcessPool):
+            raise writer_error[0]
+
+    def serve_unix_socket(self, path):
+        """
+            Serves each connection to the Unix socket path like serve_stream,
+            until interrupted or a worker dies. The connections share the workers
+        """
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise FileExistsError("{} exists and is not a socket".format(path))
+            # socket left by a daemon that was killed
+            os.unlink(path)
+        server = _UnixStreamServer(path, _StreamHandler)
+        server.scan_daemon = self
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(path)
+        if server.error is not None:
+            raise server.error
+
+    def close(self):
+        global _daemon_reloader
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            gc.unfreeze()
+        if _daemon_reloader is not None:
+            _daemon_reloader.stop()
+            _daemon_reloader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _UnixStreamServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # BrokenProcessPool raised by a connection, the workers can't scan anymore
+    error = None
+
+
+class _StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        f_in = io.TextIOWrapper(self.rfile, encoding="utf-8")
+        f_out = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+        try:
+            self.server.scan_daemon.serve_stream(f_in, f_out)
+        except BrokenProcessPool as e:
+            self.server.error = e
+            # from another thread, shutdown() waits for serve_forever() to return
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        finally:
+            # the socket files are closed by the server
+            f_in.detach()
+            f_out.detach()
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+import time
+
+
+def run_startup_benchmark(nb_runs, bench_file):
+    """
+        Measures the time needed by a new python process to import main,
+        and to import it and create the scanner
+    """
+    commands = [
+        ("import main", "import main"),
+        ("import main + Scanner", "import main; from inconsistency_scanner import Scanner; "
+                                  "Scanner(**main.SCANNER_PARAMETERS)"),
+    ]
+    with open(bench_file, 'w+') as f_bench:
+        f_bench.write('command,elapsed_time\n')
+        for name, command in commands:
+            for _ in range(nb_runs):
+                start = time.time()
+                subprocess.run([sys.executable, "-c", command], check=True)
+                end = time.time()
+                f_bench.write('{},{:f}\n'.format(name, end - start))
+                print(name, '{:f}'.format(end - start))
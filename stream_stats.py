@@ -0,0 +1,273 @@
+import base64
+import hashlib
+import heapq
+import json
+import math
+import numpy as np
+from inconsistency_scanner import Analysis
+
+
+def hash64(value):
+    # 64 bits hash of a string, stable across processes unlike hash()
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "little")
+
+
+def _encode_array(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode()
+
+
+def _decode_array(text, dtype, shape):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).reshape(shape).copy()
+
+
+class HyperLogLog:
+    """
+        Estimates the number of distinct values added with 2 ** precision
+        registers of one byte, about 1.04 / sqrt(2 ** precision) of error
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, value):
+        hashed = hash64(value)
+        index = hashed >> (64 - self.precision)
+        # position of the first 1 bit of the other bits
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        nb_zeros = m - np.count_nonzero(self.registers)
+        if estimate <= 2.5 * m and nb_zeros > 0:
+            # few values, linear counting is more accurate
+            estimate = m * math.log(m / nb_zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def to_dict(self):
+        return dict(precision=self.precision, registers=_encode_array(self.registers))
+
+    @classmethod
+    def from_dict(cls, values):
+        hyperloglog = cls(values["precision"])
+        hyperloglog.registers = _decode_array(values["registers"], np.uint8, (1 << values["precision"],))
+        return hyperloglog
+
+
+class CountMinSketch:
+    """
+        Counts of keys in a depth x width table, never underestimated:
+        the estimate of a key is at most the total count * e / width
+        above its count, with a probability of 1 - exp(-depth)
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.rows = np.arange(depth)
+
+    def __columns(self, key):
+        digest = hashlib.blake2b(str(key).encode(), digest_size=4 * self.depth).digest()
+        return np.frombuffer(digest, dtype="<u4") % self.width
+
+    def add(self, key, count=1):
+        self.table[self.rows, self.__columns(key)] += count
+
+    def estimate(self, key):
+        return int(self.table[self.rows, self.__columns(key)].min())
+
+    def merge(self, other):
+        self.table += other.table
+
+    def to_dict(self):
+        return dict(width=self.width, depth=self.depth, table=_encode_array(self.table.astype("<i8")))
+
+    @classmethod
+    def from_dict(cls, values):
+        sketch = cls(values["width"], values["depth"])
+        sketch.table = _decode_array(values["table"], "<i8", (values["depth"], values["width"])).astype(np.int64)
+        return sketch
+
+
+class SpaceSaving:
+    """
+        The (at most) k most frequent keys, with their count and the
+        maximum overestimation of the count. A key whose count is above
+        total / k is always kept
+    """
+
+    def __init__(self, k=100):
+        self.k = k
+        # key -> [count, error]
+        self.counters = dict()
+
+    def add(self, key, count=1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.k:
+            self.counters[key] = [count, 0]
+        else:
+            # the least frequent key is replaced, the new one may have had its count
+            min_key = min(self.counters, key=lambda counter_key: self.counters[counter_key][0])
+            min_count = self.counters.pop(min_key)[0]
+            self.counters[key] = [min_count + count, min_count]
+
+    def min_count(self):
+        if len(self.counters) < self.k:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """
+            A key missing from a full summary may have had up to
+            its smallest count, added to the error of the key
+        """
+        self_min, other_min = self.min_count(), other.min_count()
+        merged = dict()
+        for key in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(key, [self_min, self_min])
+            other_count, other_error = other.counters.get(key, [other_min, other_min])
+            merged[key] = [count + other_count, error + other_error]
+        self.counters = dict(heapq.nlargest(self.k, merged.items(), key=lambda item: item[1][0]))
+
+    def top(self, n=None):
+        """
+            [(key, count, error)...] by decreasing count
+        """
+        items = sorted(self.counters.items(), key=lambda item: (-item[1][0], str(item[0])))
+        return [(key, count, error) for key, (count, error) in items[:n]]
+
+    def to_dict(self):
+        return dict(k=self.k, counters=[[key, count, error] for key, count, error in self.top()])
+
+    @classmethod
+    def from_dict(cls, values):
+        space_saving = cls(values["k"])
+        space_saving.counters = {key: [count, error] for key, count, error in values["counters"]}
+        return space_saving
+
+
+# attributes of the fingerprints whose distinct values and most frequent values are counted
+STATS_ATTRIBUTES = {
+    "user_agent": lambda fingerprint: fingerprint.user_agent_js,
+    "platform_os": lambda fingerprint: "{}/{}".format(fingerprint.platform, fingerprint.os_ref_js),
+    "webgl_renderer": lambda fingerprint: ";;;".join(fingerprint.web_gl_info),
+    "canvas_hash": lambda fingerprint: "{:016x}".format(fingerprint.canvas_hash)
+    if fingerprint.canvas_hash is not None else None,
+    "claimed_browser": lambda fingerprint: fingerprint.browser_ref_js,
+}
+
+
+class StreamStatistics:
+    """
+        Statistics of a stream of scanned fingerprints in a fixed memory:
+        distinct values (HyperLogLog) and most frequent values (SpaceSaving)
+        of STATS_ATTRIBUTES, and failures of each analysis by claimed browser
+        (CountMinSketch). Statistics of several workers can be merged
+    """
+
+    def __init__(self, precision=12, k=100, width=2048, depth=4):
+        self.nb_fingerprints = 0
+        self.distinct = {attribute: HyperLogLog(precision) for attribute in STATS_ATTRIBUTES}
+        self.top = {attribute: SpaceSaving(k) for attribute in STATS_ATTRIBUTES}
+        # failures of each claimed browser and analysis, and
+        # their runs under the keys starting with "ran: "
+        self.failures = CountMinSketch(width, depth)
+
+    def add(self, fingerprint, scan_outcome):
+        self.nb_fingerprints += 1
+        for attribute, value_of in STATS_ATTRIBUTES.items():
+            value = value_of(fingerprint)
+            if value is None:
+                continue
+            self.distinct[attribute].add(value)
+            self.top[attribute].add(value)
+
+        browser = fingerprint.browser_ref_js
+        for analysis in scan_outcome.analyses_run():
+            self.failures.add("ran: {}/{}".format(browser, analysis.name))
+        for analysis in scan_outcome.analyses_failed():
+            self.failures.add("{}/{}".format(browser, analysis.name))
+
+    def failure_rates(self, nb_browsers=10):
+        """
+            {claimed browser: {analysis name: (failures, runs)}} for
+            the most frequent claimed browsers, estimated counts
+        """
+        rates = dict()
+        for browser, _, _ in self.top["claimed_browser"].top(nb_browsers):
+            rates[browser] = dict()
+            for analysis in Analysis:
+                nb_runs = self.failures.estimate("ran: {}/{}".format(browser, analysis.name))
+                if nb_runs > 0:
+                    rates[browser][analysis.name] = (self.failures.estimate("{}/{}".format(browser, analysis.name)),
+                                                     nb_runs)
+        return rates
+
+    def merge(self, other):
+        self.nb_fingerprints += other.nb_fingerprints
+        for attribute in STATS_ATTRIBUTES:
+            self.distinct[attribute].merge(other.distinct[attribute])
+            self.top[attribute].merge(other.top[attribute])
+        self.failures.merge(other.failures)
+
+    def to_dict(self):
+        return dict(
+            nb_fingerprints=self.nb_fingerprints,
+            distinct={attribute: hyperloglog.to_dict() for attribute, hyperloglog in self.distinct.items()},
+            top={attribute: space_saving.to_dict() for attribute, space_saving in self.top.items()},
+            failures=self.failures.to_dict(),
+        )
+
+    @classmethod
+    def from_dict(cls, values):
+        stats = cls()
+        stats.nb_fingerprints = values["nb_fingerprints"]
+        stats.distinct = {attribute: HyperLogLog.from_dict(hyperloglog)
+                          for attribute, hyperloglog in values["distinct"].items()}
+        stats.top = {attribute: SpaceSaving.from_dict(space_saving)
+                     for attribute, space_saving in values["top"].items()}
+        stats.failures = CountMinSketch.from_dict(values["failures"])
+        return stats
+
+    def save(self, stats_file):
+        with open(stats_file, 'w+') as f_stats:
+            json.dump(self.to_dict(), f_stats)
+
+    @classmethod
+    def load(cls, stats_file):
+        with open(stats_file) as f_stats:
+            return cls.from_dict(json.load(f_stats))
+
+    def report(self, nb_top=5, nb_browsers=10):
+        lines = ["Statistics of {:d} fingerprints".format(self.nb_fingerprints)]
+        for attribute in STATS_ATTRIBUTES:
+            lines.append("{}: ~{:d} distinct values".format(attribute, self.distinct[attribute].count()))
+            for value, count, error in self.top[attribute].top(nb_top):
+                lines.append("    {:d} (+{:d}) {}".format(count, error, value))
+        lines.append("Failures by claimed browser")
+        for browser, analyses in self.failure_rates(nb_browsers).items():
+            failed = ["{} {:.1%}".format(name, nb_failures / nb_runs)
+                      for name, (nb_failures, nb_runs) in analyses.items() if nb_failures > 0]
+            lines.append("    {}: {}".format(browser, ", ".join(failed) if failed else "none"))
+        return "\n".join(lines)
+
+
+def merge_stats(stats_files, output_file=None):
+    stats = StreamStatistics.load(stats_files[0])
+    for stats_file in stats_files[1:]:
+        stats.merge(StreamStatistics.load(stats_file))
+    if output_file is not None:
+        stats.save(output_file)
+    print(stats.report())
+    return stats
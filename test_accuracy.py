@@ -0,0 +1,110 @@
+import math
+
+import pandas as pd
+import pytest
+from sklearn.metrics import accuracy_score
+
+from accuracy import COUNTERMEASURES, DETECTORS, GUESS_COUNTERMEASURES, ConfusionMatrix, OnlineAccuracy, is_same_os
+from differential import load_fixtures, synthetic_corpus
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from scan_command import analyse_results, scan_fingerprints
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_is_same_os():
+    assert is_same_os("Mac OS X", "Mac OS X")
+    assert is_same_os("Windows 10", "Windows")
+    assert is_same_os("Ubuntu", "Linux") and is_same_os("Linux", "Fedora")
+    assert not is_same_os("Ubuntu", "Fedora")
+    assert not is_same_os("Linux", "Android")
+    assert not is_same_os("Windows", "Mac OS X")
+
+
+def test_confusion_matrix():
+    confusion_matrix = ConfusionMatrix()
+    assert math.isnan(confusion_matrix.accuracy())
+    # (ground_truth, predicted), True for a consistent fingerprint
+    for ground_truth, predicted in [(False, False), (False, False), (True, False), (True, True), (False, True)]:
+        confusion_matrix.add(ground_truth, predicted)
+    assert (confusion_matrix.true_positives, confusion_matrix.false_positives,
+            confusion_matrix.true_negatives, confusion_matrix.false_negatives) == (2, 1, 1, 1)
+    assert confusion_matrix.total() == 5
+    assert confusion_matrix.accuracy() == pytest.approx(3 / 5)
+    assert str(confusion_matrix) == "TP=2 FP=1 TN=1 FN=1"
+
+
+def test_guesses_only_for_guess_countermeasures():
+    accuracy = OnlineAccuracy()
+    accuracy.add_guess("no", "Linux", "Firefox", "Windows", "Chrome")
+    accuracy.add_guess("uas", "Ubuntu", "Firefox", "Linux", "Chrome")
+    assert list(accuracy.guesses) == ["uas"]
+    assert accuracy.guesses["uas"].accuracy_os() == 1.0
+    assert accuracy.guesses["uas"].accuracy_browser() == 0.0
+
+
+def baseline_analysis(prediction_file, real_values_file):
+    """
+        Accuracies computed from the result files with pandas and
+        scikit-learn, as the analyse command did before OnlineAccuracy
+    """
+    accuracies = dict()
+    df = pd.read_csv(prediction_file)
+    for countermeasure in COUNTERMEASURES:
+        sub_df = df[df.countermeasure == countermeasure]
+        if len(sub_df) == 0:
+            continue
+        accuracies[(countermeasure, 'nb_fingerprints')] = len(sub_df)
+        accuracies[(countermeasure, 'FPScanner')] = accuracy_score(sub_df['ground_truth'], sub_df['prediction'])
+        accuracies[(countermeasure, 'FPJS2')] = accuracy_score(sub_df['ground_truth'], sub_df['fpjs2'])
+        accuracies[(countermeasure, 'Augur')] = accuracy_score(sub_df['ground_truth'], sub_df['augur'])
+
+    df_real_values = pd.read_csv(real_values_file)
+    for countermeasure in GUESS_COUNTERMEASURES:
+        sub_df = df_real_values[df_real_values.countermeasure == countermeasure]
+        if len(sub_df) == 0:
+            continue
+        nb_rights_browser = len(sub_df[sub_df["realBrowser"] == sub_df["predictedBrowser"]])
+        nb_rights_os = 0
+        for _, row in sub_df.iterrows():
+            if row['realOs'] == row['predictedOs']:
+                nb_rights_os += 1
+            elif 'Win' in row['realOs'] and 'Win' in row['predictedOs']:
+                nb_rights_os += 1
+            elif (row['realOs'] in ['Ubuntu', 'Fedora'] and row['predictedOs'] == 'Linux') or \
+                    (row['predictedOs'] in ['Ubuntu', 'Fedora'] and row['realOs'] == 'Linux'):
+                nb_rights_os += 1
+        accuracies[(countermeasure, 'nb_guesses')] = len(sub_df)
+        accuracies[(countermeasure, 'OS')] = nb_rights_os / len(sub_df)
+        accuracies[(countermeasure, 'browser')] = nb_rights_browser / len(sub_df)
+    return accuracies
+
+
+def online_accuracies(accuracy):
+    accuracies = dict()
+    for countermeasure, confusion_matrices in accuracy.confusion_matrices.items():
+        accuracies[(countermeasure, 'nb_fingerprints')] = confusion_matrices['FPScanner'].total()
+        for detector in DETECTORS:
+            accuracies[(countermeasure, detector)] = confusion_matrices[detector].accuracy()
+    for countermeasure, guess_counts in accuracy.guesses.items():
+        accuracies[(countermeasure, 'nb_guesses')] = guess_counts.nb_fingerprints
+        accuracies[(countermeasure, 'OS')] = guess_counts.accuracy_os()
+        accuracies[(countermeasure, 'browser')] = guess_counts.accuracy_browser()
+    return accuracies
+
+
+def test_same_accuracy_as_baseline_analysis(tmp_path):
+    documents = load_fixtures(FIXTURES_FILE)
+    documents += synthetic_corpus(documents, 100, seed=6)
+    prediction_file = str(tmp_path / "res_prediction.csv")
+    real_values_file = str(tmp_path / "res_real_values.csv")
+    accuracy = scan_fingerprints(Scanner(**SCANNER_PARAMETERS), [Fingerprint(document) for document in documents],
+                                 prediction_file, real_values_file)
+
+    expected = baseline_analysis(prediction_file, real_values_file)
+    assert {countermeasure for countermeasure, _ in expected} == {"no", "cd", "ras", "uas"}
+    assert online_accuracies(accuracy) == pytest.approx(expected)
+    # the analyse command reads the same numbers back from the result files
+    assert online_accuracies(analyse_results(prediction_file, real_values_file)) == pytest.approx(expected)
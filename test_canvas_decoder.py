@@ -0,0 +1,44 @@
+import base64
+import io
+import matplotlib.image as mpimg
+import numpy as np
+from canvas_decoder import decode_canvas_uri, to_float
+from differential import load_fixtures
+from fingerprint import Fingerprint
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def canvas_uris():
+    return [document["browser"]["canvas"] for document in load_fixtures(FIXTURES_FILE)]
+
+
+def imread(data_uri):
+    # how Fingerprint decoded the canvases before canvas_decoder
+    return mpimg.imread(io.BytesIO(base64.b64decode(data_uri.split("base64,")[1].encode())), format='PNG')
+
+
+def test_same_pixels_as_imread():
+    for data_uri in canvas_uris():
+        expected = imread(data_uri)
+        canvas_img = to_float(decode_canvas_uri(data_uri))
+        assert canvas_img.dtype == expected.dtype == np.float32
+        assert canvas_img.shape == expected.shape
+        assert np.array_equal(canvas_img, expected)
+
+
+def test_fingerprint_canvas_img():
+    for document in load_fixtures(FIXTURES_FILE):
+        canvas_img = Fingerprint(document).canvas_img
+        assert canvas_img.dtype == np.uint8
+        assert np.array_equal(canvas_img, np.rint(imread(document["browser"]["canvas"]) * 255))
+
+
+def test_channels_into_buffer():
+    data_uris = canvas_uris()
+    pixels = decode_canvas_uri(data_uris[0])
+    out = np.zeros((len(data_uris),) + pixels.shape[:2] + (1,), dtype=np.uint8)
+    for index, data_uri in enumerate(data_uris):
+        assert np.shares_memory(decode_canvas_uri(data_uri, channels="A", out=out[index]), out)
+        assert np.array_equal(out[index], decode_canvas_uri(data_uri)[:, :, 3:])
+    assert np.array_equal(decode_canvas_uri(data_uris[0], channels="RGB"), pixels[:, :, :3])
@@ -0,0 +1,117 @@
+from canvas_index import CanvasIndex, GENUINE_COUNTERMEASURE, canvas_uri_hash
+from differential import load_fixtures
+from fingerprint import Fingerprint
+from inconsistency_scanner import Analysis, Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_save_load_and_grow(tmp_path):
+    index_file = str(tmp_path / "canvas_index.bin")
+    index = CanvasIndex()
+    index.add(canvas_uri_hash("a"), "Linux", "Firefox")
+    index.add(canvas_uri_hash("a"), "Windows 7", "Chrome")
+    index.add(canvas_uri_hash("b"), "Linux", "Firefox")
+    index.save(index_file)
+
+    index = CanvasIndex.load(index_file)
+    assert len(index) == 3
+    assert index.platforms_of(canvas_uri_hash("a")) == {("Linux", "Firefox"), ("Windows 7", "Chrome")}
+    assert index.platforms_of(canvas_uri_hash("c")) == set()
+
+    # entries already known aren't duplicated
+    index.add(canvas_uri_hash("b"), "Linux", "Firefox")
+    index.add(canvas_uri_hash("c"), "Mac OS X", "Safari")
+    assert index.platforms_of(canvas_uri_hash("c")) == {("Mac OS X", "Safari")}
+    index.save(index_file)
+    assert len(CanvasIndex.load(index_file)) == 4
+
+    CanvasIndex().save(index_file)
+    assert len(CanvasIndex.load(index_file)) == 0
+
+
+def test_scanner_skips_genuine_canvases(tmp_path):
+    index_file = str(tmp_path / "canvas_index.bin")
+    documents = load_fixtures(FIXTURES_FILE)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    index = CanvasIndex()
+    consistent_genuine = [document for document in documents if document["countermeasure"] == GENUINE_COUNTERMEASURE
+                          and scanner.are_canvas_pixels_consistent(Fingerprint(document))]
+    assert consistent_genuine
+    assert index.add_fingerprints((Fingerprint(document) for document in documents), scanner) == \
+        len(consistent_genuine)
+    index.save(index_file)
+
+    index_scanner = Scanner(**dict(SCANNER_PARAMETERS, canvas_index=index_file))
+    for document in documents:
+        fingerprint = Fingerprint(document)
+        results = {result.name: result
+                   for result in index_scanner.check_fingerprint(fingerprint, only_pixels=True)}
+        expected = {result.name: result for result in scanner.check_fingerprint(Fingerprint(document), only_pixels=True)}
+        assert results[Analysis.CANVAS_PIXELS.name].is_consistent == \
+            expected[Analysis.CANVAS_PIXELS.name].is_consistent
+        if document in consistent_genuine:
+            assert "canvas_img" not in vars(fingerprint)
+
+
+def test_index_of_other_parameters_refused(tmp_path):
+    index_file = str(tmp_path / "canvas_index.bin")
+    index = CanvasIndex()
+    index.add_fingerprints([Fingerprint(document) for document in load_fixtures(FIXTURES_FILE)],
+                           Scanner(**SCANNER_PARAMETERS))
+    index.save(index_file)
+    assert CanvasIndex.load(index_file).parameters == Scanner(**SCANNER_PARAMETERS).pixels_parameters
+
+    Scanner(**dict(SCANNER_PARAMETERS, canvas_index=index_file))
+    for parameters in [dict(canvas_roi=True), dict(number_transparent_pixels=19300)]:
+        try:
+            Scanner(**dict(SCANNER_PARAMETERS, canvas_index=index_file, **parameters))
+        except ValueError:
+            continue
+        assert False
+
+
+def test_scanner_flags_foreign_canvases(tmp_path):
+    index_file = str(tmp_path / "canvas_index.bin")
+    document = load_fixtures(FIXTURES_FILE)[0]
+    index = CanvasIndex()
+    index.add(canvas_uri_hash(document["browser"]["canvas"]), "Mac OS X", "Safari")
+    index.save(index_file)
+
+    for flag_foreign_canvases in [False, True]:
+        scanner = Scanner(**dict(SCANNER_PARAMETERS, canvas_index=index_file,
+                                 flag_foreign_canvases=flag_foreign_canvases))
+        result = scanner.check_fingerprint(Fingerprint(document), only_pixels=True)[-1]
+        assert ("canvas_platforms" in result.data) == flag_foreign_canvases
+        if flag_foreign_canvases:
+            assert not result.is_consistent
+            assert result.data["canvas_platforms"] == ["Mac OS X/Safari"]
+
+
+def test_scanner_flags_foreign_canvases_without_decoding(tmp_path):
+    index_file = str(tmp_path / "canvas_index.bin")
+    document = load_fixtures(FIXTURES_FILE)[0]
+    index = CanvasIndex()
+    index.add(canvas_uri_hash(document["browser"]["canvas"]), "Mac OS X", "Safari")
+    index.save(index_file)
+
+    scanner = Scanner(**dict(SCANNER_PARAMETERS, canvas_index=index_file, flag_foreign_canvases=True))
+    fingerprint = Fingerprint(document)
+    scanner.check_fingerprint(fingerprint, only_pixels=True)
+    assert "canvas_img" not in vars(fingerprint)
+
+
+def test_raw_metrics_counted_for_indexed_canvases(tmp_path):
+    index_file = str(tmp_path / "canvas_index.bin")
+    documents = [document for document in load_fixtures(FIXTURES_FILE)
+                 if document["countermeasure"] == GENUINE_COUNTERMEASURE]
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    index = CanvasIndex()
+    index.add_fingerprints((Fingerprint(document) for document in documents), scanner)
+    index.save(index_file)
+
+    index_scanner = Scanner(**dict(SCANNER_PARAMETERS, canvas_index=index_file))
+    for document in documents:
+        expected = scanner.scan_fingerprint(Fingerprint(document), record_raw_metrics=True).raw_metrics
+        assert index_scanner.scan_fingerprint(Fingerprint(document), record_raw_metrics=True).raw_metrics == expected
@@ -0,0 +1,62 @@
+import numpy as np
+from canvas_layout import CanvasLayout
+from differential import load_fixtures
+from fingerprint import Fingerprint
+from inconsistency_scanner import Analysis, Scanner, count_color_pixels, count_isolated_pixels, isolated_pixels
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+ORANGE = [255, 102, 0, 100]
+
+
+def test_regions_of_the_fixtures():
+    layout = CanvasLayout()
+    for document in load_fixtures(FIXTURES_FILE):
+        # the array the scanner analyses
+        canvas_img = Fingerprint(document).canvas_img
+        assert layout.fits(canvas_img)
+        # the color regions hold all the pixels of the rectangle and its border
+        nb_equals, nb_close = 0, 0
+        for view in layout.color_views(canvas_img):
+            nb_equals_view, nb_close_view = count_color_pixels(view, ORANGE, 4)
+            nb_equals += nb_equals_view
+            nb_close += nb_close_view
+        assert (nb_equals, nb_close) == count_color_pixels(canvas_img, ORANGE, 4)
+        if alpha_mask_is_drawn(canvas_img):
+            assert nb_equals > 7 * nb_close
+
+        alpha_mask = canvas_img[:, :, 3] > 0
+        nb_isolated_pixels = sum(np.count_nonzero(isolated_pixels(view)[region])
+                                 for view, region in layout.isolated_views(alpha_mask))
+        if document["countermeasure"] != "cd":
+            # nothing is drawn in the isolated regions of a genuine canvas
+            for row_start, row_end, col_start, col_end in layout.isolated_regions:
+                assert not alpha_mask[row_start:row_end, col_start:col_end].any()
+        # the noise of a countermeasure is found in both modes
+        assert (nb_isolated_pixels > layout.max_isolated_pixels) == (count_isolated_pixels(alpha_mask) > 8)
+
+
+def alpha_mask_is_drawn(canvas_img):
+    # the blank canvases of the fixtures have no rectangle
+    return np.count_nonzero(canvas_img[:, :, 3]) > 0
+
+
+def test_same_verdicts_as_full_canvas():
+    nb_consistent = 0
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    roi_scanner = Scanner(canvas_roi=True, **SCANNER_PARAMETERS)
+    for document in load_fixtures(FIXTURES_FILE):
+        scan_outcome = scanner.scan_fingerprint(Fingerprint(document), record_raw_metrics=True)
+        roi_scan_outcome = roi_scanner.scan_fingerprint(Fingerprint(document), record_raw_metrics=True)
+        assert roi_scan_outcome.failed == scan_outcome.failed
+        assert roi_scan_outcome.has_failed(Analysis.CANVAS_PIXELS) == scan_outcome.has_failed(Analysis.CANVAS_PIXELS)
+        for name in ("canvas_blocked", "nb_color_equals", "nb_color_close", "nb_transparent_pixels"):
+            assert roi_scan_outcome.raw_metrics.get(name) == scan_outcome.raw_metrics.get(name)
+        details = (scan_outcome.details or dict()).get(Analysis.CANVAS_PIXELS, dict())
+        roi_details = (roi_scan_outcome.details or dict()).get(Analysis.CANVAS_PIXELS, dict())
+        assert ("isolated_pixels" in roi_details) == ("isolated_pixels" in details)
+        assert "color_failed" not in details or not alpha_mask_is_drawn(Fingerprint(document).canvas_img)
+        nb_consistent += not scan_outcome.has_failed(Analysis.CANVAS_PIXELS)
+    # the genuine canvases and the ones of the other countermeasures pass
+    assert nb_consistent >= 8
@@ -0,0 +1,81 @@
+import time
+from cost_estimator import CostEstimator
+from differential import load_fixtures
+from fingerprint import Fingerprint
+from inconsistency_scanner import Analysis, Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+PIXELS = 1 << Analysis.CANVAS_PIXELS
+
+
+def test_estimates():
+    cost_estimator = CostEstimator(alpha=0.5, max_ratio=2.0, initial_costs={Analysis.ETSL: 1.0})
+    assert cost_estimator.estimate(Analysis.ETSL) == 1.0
+    assert cost_estimator.estimate(Analysis.SAME_UAS) == 0.0
+    # the first two observations replace the estimate
+    cost_estimator.observe(Analysis.SAME_UAS, 5.0)
+    cost_estimator.observe(Analysis.SAME_UAS, 2.0)
+    assert cost_estimator.estimate(Analysis.SAME_UAS) == 2.0
+    cost_estimator.observe(Analysis.SAME_UAS, 3.0)
+    assert cost_estimator.estimate(Analysis.SAME_UAS) == 2.5
+    # a pause is clipped to max_ratio times the estimate
+    cost_estimator.observe(Analysis.SAME_UAS, 100.0)
+    assert cost_estimator.estimate(Analysis.SAME_UAS) == 3.75
+
+
+def test_skips_decay_to_prior():
+    cost_estimator = CostEstimator(decay=0.5, initial_costs={Analysis.ETSL: 1.0})
+    cost_estimator.observe(Analysis.SAME_UAS, 4.0)
+    cost_estimator.observe(Analysis.ETSL, 5.0)
+    cost_estimator.skip(Analysis.SAME_UAS)
+    cost_estimator.skip(Analysis.ETSL)
+    assert cost_estimator.estimate(Analysis.SAME_UAS) == 2.0
+    assert cost_estimator.estimate(Analysis.ETSL) == 3.0
+    # an analysis never observed keeps its estimate of 0
+    cost_estimator.skip(Analysis.MQ_OS)
+    assert cost_estimator.estimate(Analysis.MQ_OS) == 0.0
+
+
+def test_pixels_run_again_after_slowdown():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    scanner.cost_estimator = CostEstimator(decay=0.1)
+    documents = load_fixtures(FIXTURES_FILE)
+    # a transient slowdown while the first scans ran
+    scanner.cost_estimator.observe(Analysis.CANVAS_PIXELS, 1.0)
+    scanner.cost_estimator.observe(Analysis.CANVAS_PIXELS, 1.0)
+    skipped = []
+    for index in range(100):
+        scan_outcome = scanner.scan_fingerprint(Fingerprint(documents[index % len(documents)]), run_all=True,
+                                                deadline=time.perf_counter() + 0.1)
+        skipped.append(scan_outcome.has_been_skipped(Analysis.CANVAS_PIXELS))
+    assert skipped[0]
+    # once the estimate fits in the budget, the pixels analysis runs and is observed again
+    assert not any(skipped[-10:])
+    assert scanner.cost_estimator.estimate(Analysis.CANVAS_PIXELS) < 0.1
+
+
+def test_deadline_skips_pixels():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    scanner.cost_estimator = CostEstimator(initial_costs={Analysis.CANVAS_PIXELS: 10.0})
+    for document in load_fixtures(FIXTURES_FILE):
+        expected = scanner.scan_fingerprint(Fingerprint(document), run_all=True)
+        scan_outcome = scanner.scan_fingerprint(Fingerprint(document), run_all=True,
+                                                deadline=time.perf_counter() + 1.0)
+        assert scan_outcome.skipped == PIXELS
+        assert scan_outcome.analyses_skipped() == [Analysis.CANVAS_PIXELS]
+        assert not scan_outcome.has_run(Analysis.CANVAS_PIXELS)
+        # the other analyses run and give the same verdicts
+        assert scan_outcome.ran == expected.ran & ~PIXELS
+        assert scan_outcome.failed == expected.failed & ~PIXELS
+
+
+def test_deadline_far_enough():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    for document in load_fixtures(FIXTURES_FILE):
+        expected = scanner.scan_fingerprint(Fingerprint(document), run_all=True)
+        scan_outcome = scanner.scan_fingerprint(Fingerprint(document), run_all=True,
+                                                deadline=time.perf_counter() + 60.0)
+        assert (scan_outcome.ran, scan_outcome.failed, scan_outcome.skipped) == (expected.ran, expected.failed, 0)
+        assert scan_outcome.details == expected.details
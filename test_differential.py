@@ -0,0 +1,85 @@
+from canvas_index import CanvasIndex
+from differential import DEFAULT_MODES, ExecutionMode, compare, get_modes, load_fixtures, load_reference_outcomes, \
+    run_differential, run_reference, synthetic_corpus, write_reference_outcomes
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+# outcomes of check_fingerprint and guess_real_info before the scanner was
+# optimized, for the fixtures and for synthetic_corpus(fixtures, 100, seed=1)
+REFERENCE_SAMPLE_FILE = "fixtures/reference_outcomes_sample.json"
+REFERENCE_SYNTHETIC_FILE = "fixtures/reference_outcomes_synthetic.json"
+
+
+def run_flipped(scanner, fingerprint):
+    # a broken mode, the first analysis gets the opposite verdict
+    analyses_results, real_info = run_reference(scanner, fingerprint)
+    analyses_results[0].is_consistent = not analyses_results[0].is_consistent
+    return analyses_results, real_info
+
+
+def test_modes_match_reference():
+    documents = load_fixtures(FIXTURES_FILE)
+    assert run_differential(documents, SCANNER_PARAMETERS, get_modes(DEFAULT_MODES)) == []
+
+
+def test_modes_match_reference_outcomes():
+    modes = get_modes(DEFAULT_MODES + ["prefilter"])
+    documents = load_fixtures(FIXTURES_FILE)
+    assert run_differential(documents, SCANNER_PARAMETERS, modes,
+                            reference_outcomes=load_reference_outcomes(REFERENCE_SAMPLE_FILE)) == []
+    documents = synthetic_corpus(documents, 100, seed=1)
+    assert run_differential(documents, SCANNER_PARAMETERS, modes,
+                            reference_outcomes=load_reference_outcomes(REFERENCE_SYNTHETIC_FILE)) == []
+
+
+def test_modes_match_reference_synthetic_parallel():
+    documents = synthetic_corpus(load_fixtures(FIXTURES_FILE), 60, seed=1)
+    modes = get_modes([name for name in DEFAULT_MODES if not get_modes([name])[0].processes])
+    assert run_differential(documents, SCANNER_PARAMETERS, modes, workers=2, chunk_size=20) == []
+
+
+def test_reference_outcomes_detect_a_change(tmp_path):
+    reference_file = str(tmp_path / "reference_outcomes.json")
+    documents = load_fixtures(FIXTURES_FILE)
+    write_reference_outcomes(documents, Scanner(**SCANNER_PARAMETERS), reference_file)
+    assert load_reference_outcomes(reference_file) == load_reference_outcomes(REFERENCE_SAMPLE_FILE)
+    # a scanner accepting fewer wrong fonts
+    mismatches = run_differential(documents, dict(SCANNER_PARAMETERS, number_wrong_fonts=1), [],
+                                  reference_outcomes=load_reference_outcomes(reference_file))
+    assert mismatches
+    assert all(row[1] == "reference" for row in mismatches)
+
+
+def test_canvas_index_agrees_with_pixels_analysis():
+    documents = load_fixtures(FIXTURES_FILE)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    fingerprints = [Fingerprint(document) for document in documents]
+    index = CanvasIndex()
+    nb_genuine = len([fingerprint for fingerprint in fingerprints if fingerprint.countermeasure == "no"])
+    # the blank canvases of some genuine fingerprints fail the analysis, they aren't indexed
+    assert 0 < index.add_fingerprints(fingerprints, scanner) < nb_genuine
+    assert run_differential(documents, SCANNER_PARAMETERS, get_modes(["canvas_index"])) == []
+
+
+def test_mismatch_reported_with_id():
+    documents = load_fixtures(FIXTURES_FILE)[:3]
+    mismatches = run_differential(documents, SCANNER_PARAMETERS, [ExecutionMode("flipped", run_flipped)])
+    assert [row[0] for row in mismatches] == [str(document["_id"]) for document in documents]
+    assert all(row[1:4] == ["flipped", "SAME_UAS", "is_consistent"] for row in mismatches)
+
+
+def test_compare_exceptions():
+    mode = ExecutionMode("flipped", run_flipped)
+    assert compare("id", mode, "KeyError", "KeyError") == []
+    assert compare("id", mode, "KeyError", ({}, ("Linux", "Firefox", []))) != []
+
+
+def test_synthetic_corpus_is_reproducible():
+    documents = load_fixtures(FIXTURES_FILE)
+    first = synthetic_corpus(documents, 20, seed=3)
+    second = synthetic_corpus(documents, 20, seed=3)
+    assert [document["browser"] for document in first] == [document["browser"] for document in second]
+    # the documents of the fixtures are not modified
+    assert load_fixtures(FIXTURES_FILE) == documents
@@ -0,0 +1,109 @@
+import copy
+from differential import load_fixtures
+from expected_profile import ExpectedProfile
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+OSES = ["Windows 7", "Windows 10", "Windows Phone", "Windows RT", "Mac OS X", "Linux", "Ubuntu", "Fedora",
+        "Android", "iOS", "Other"]
+BROWSERS = ["Chrome", "Chrome Mobile", "Chromium", "Firefox", "Safari", "Opera", "Edge", "IE", "Internet Explorer",
+            "Other"]
+
+
+# expectations computed by each analysis before ExpectedProfile
+def reference_plugin_extensions(os):
+    if os != "Windows Phone" and "Windows" in os:
+        return [".so", ".plugin"]
+    elif "Mac OS X" in os:
+        return [".so", ".dll"]
+    elif "Linux" in os or "Ubuntu" in os:
+        return [".dll", ".plugin"]
+    return [".so", ".dll", ".plugin"]
+
+
+def reference_webgl_substrings(os):
+    if os != "Windows Phone" and "Windows" in os or os == "Mac OS X" or os == "Linux" or os == "Ubuntu":
+        if "Windows" in os:
+            return ["OpenGL", "Mesa", "Gallium", "Qualcomm"]
+        elif "Mac OS X" in os:
+            return ["ANGLE", "Mesa", "Gallium", "Qualcomm"]
+        return ["ANGLE", "OpenGL", "Qualcomm"]
+    return []
+
+
+def reference_fonts_os_family(os):
+    if os != "Windows Phone" and "Windows" in os:
+        return "Windows"
+    elif "Ubuntu" in os or "Linux" in os or "Fedora" in os:
+        return "Linux"
+    elif "Mac OS X" in os:
+        return "Mac OS X"
+    return "Other"
+
+
+def reference_product_sub_consistent(browser, product_sub):
+    if browser in ("Chrome", "Chrome Mobile", "Safari", "Opera") and product_sub != "20030107":
+        return False
+    elif browser not in ("Other", "Chrome", "Chrome Mobile", "Safari", "Opera") and product_sub == "20030107":
+        return False
+    return True
+
+
+def test_same_expectations_as_the_analyses():
+    for os in OSES:
+        for browser in BROWSERS:
+            expected_profile = ExpectedProfile(browser, 60, os)
+            assert expected_profile.forbidden_plugin_extensions == reference_plugin_extensions(os)
+            assert expected_profile.forbidden_webgl_substrings == reference_webgl_substrings(os)
+            assert expected_profile.fonts_os_family == reference_fonts_os_family(os)
+            assert expected_profile.etsl == {"Safari": 37, "Firefox": 37, "Internet Explorer": 39, "Edge": 39,
+                                             "Chrome": 33, "Opera": 33}.get(browser)
+            for product_sub in ("20030107", "20100101", ""):
+                product_sub_20030107 = expected_profile.product_sub_20030107
+                consistent = product_sub_20030107 is None or (product_sub == "20030107") == product_sub_20030107
+                assert consistent == reference_product_sub_consistent(browser, product_sub)
+
+
+def test_unknown_os_fails_every_time():
+    expected_profile = ExpectedProfile("Chrome", 60, "Unknown OS")
+    for _ in range(2):
+        try:
+            expected_profile.allowed_platforms
+        except KeyError:
+            continue
+        assert False
+
+
+def claimed_documents():
+    documents = []
+    for document in load_fixtures(FIXTURES_FILE)[:4]:
+        for os in OSES:
+            for browser in BROWSERS:
+                for version in ("52", "60"):
+                    claimed = copy.deepcopy(document)
+                    claimed["os"]["name"] = os
+                    claimed["browser"]["name"] = browser
+                    claimed["browser"]["version"] = version
+                    documents.append(claimed)
+    return documents
+
+
+def scan_outcomes(scanner, documents):
+    outcomes = dict()
+    for index, document in documents:
+        try:
+            scan_outcome = scanner.scan_fingerprint(Fingerprint(document), run_all=True)
+            outcomes[index] = (scan_outcome.ran, scan_outcome.failed, scan_outcome.details)
+        except Exception as e:
+            outcomes[index] = type(e)
+    return outcomes
+
+
+def test_profiles_shared_between_claims():
+    # the profiles built for the claims seen first don't change the outcomes of the next ones
+    documents = list(enumerate(claimed_documents()))
+    assert scan_outcomes(Scanner(**SCANNER_PARAMETERS), documents) == \
+           scan_outcomes(Scanner(**SCANNER_PARAMETERS), documents[::-1])
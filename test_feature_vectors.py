@@ -0,0 +1,66 @@
+import copy
+import random
+import numpy as np
+from differential import load_fixtures, synthetic_corpus
+from feature_vectors import FeatureVectors
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def reference_wrong_features(caniuse_features, fingerprint):
+    # the FEATURES_BROWSER loop before FeatureVectors
+    errors_features = []
+    for feature in fingerprint.modernizr:
+        if feature in caniuse_features:
+            if fingerprint.browser_ref_js in caniuse_features[feature]:
+                should_feature_be_available = str(fingerprint.browser_version_ref_js) in \
+                                              caniuse_features[feature][fingerprint.browser_ref_js]
+                if fingerprint.modernizr[feature] != should_feature_be_available:
+                    errors_features.append(feature)
+    return errors_features
+
+
+def fingerprints():
+    # random claims and modernizr results, some versions unknown to caniuse
+    rng = random.Random(5)
+    documents = []
+    for document in synthetic_corpus(load_fixtures(FIXTURES_FILE), 100, seed=5):
+        document = copy.deepcopy(document)
+        document["browser"]["name"] = rng.choice(["Chrome", "Firefox", "Safari", "Edge", "IE", "Opera", "Other"])
+        document["browser"]["version"] = str(rng.randint(8, 70))
+        document["scanner"]["modernizr"] = [
+            "{}-{}".format(result.split("-")[0], rng.choice(["true", "false"]))
+            for result in document["scanner"]["modernizr"]]
+        documents.append(document)
+    return [Fingerprint(document) for document in documents]
+
+
+def test_same_wrong_features_as_lookups():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    feature_vectors = scanner.feature_vectors
+    for fingerprint in fingerprints():
+        checked, supported = feature_vectors.expected(fingerprint.browser_ref_js, fingerprint.browser_version_ref_js)
+        indices, available = feature_vectors.observed(fingerprint.modernizr)
+        wrong_features = FeatureVectors.wrong_features(checked, supported, indices, available)
+        assert [feature_vectors.features[index] for index in indices[wrong_features]] == \
+               reference_wrong_features(scanner.caniuse_features, fingerprint)
+
+
+def test_batch_count():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    batch = fingerprints()
+    counts = scanner.count_wrong_features(batch)
+    assert counts.tolist() == [len(reference_wrong_features(scanner.caniuse_features, fingerprint))
+                               for fingerprint in batch]
+
+
+def test_expected_computed_once_per_claim():
+    feature_vectors = FeatureVectors({"webgl": {"Chrome": {"60"}}, "flexbox": {"Firefox": {"52", "60"}}})
+    checked, supported = feature_vectors.expected("Chrome", 60)
+    assert feature_vectors.expected("Chrome", 60)[0] is checked
+    assert checked.tolist() == [True, False] and supported.tolist() == [True, False]
+    assert not checked.flags.writeable
+    assert np.count_nonzero(feature_vectors.expected("Other", 60)[0]) == 0
@@ -0,0 +1,97 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ua_parser import user_agent_parser
+from differential import load_fixtures
+from fingerprint import Fingerprint, lazy_attribute
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+LAZY_ATTRIBUTES = [name for name, value in vars(Fingerprint).items() if isinstance(value, lazy_attribute)]
+
+
+def parsed_value(fingerprint, name):
+    try:
+        return getattr(fingerprint, name)
+    except AttributeError:
+        # like the attributes the eager parsing didn't set
+        return AttributeError
+
+
+def test_lazy_attributes_parsed_once():
+    document = copy.deepcopy(load_fixtures(FIXTURES_FILE)[0])
+    # the ground truth of the fixtures reads browser_ref_http
+    del document["realBrowser"]
+    fingerprint = Fingerprint(document)
+    assert not any(name in vars(fingerprint) for name in LAZY_ATTRIBUTES)
+
+    fonts_js = fingerprint.fonts_js
+    assert fonts_js["Arial"] is True and fonts_js["Tlwg Mono"] is False
+    assert vars(fingerprint)["fonts_js"] is fonts_js
+    # later accesses don't parse the document again
+    document["browser"]["fonts"] = "Arial--false"
+    assert fingerprint.fonts_js is fonts_js
+    assert "plugins" not in vars(fingerprint)
+
+
+def test_user_agent_http_parsed_on_access():
+    for document in load_fixtures(FIXTURES_FILE):
+        fingerprint = Fingerprint(document)
+        parsed_ua_http = user_agent_parser.Parse(document["browser"]["userAgentHttp"])
+        expected_browser = parsed_ua_http["user_agent"]["family"]
+        assert fingerprint.browser_ref_http == ("Chrome" if expected_browser == "Chromium" else expected_browser)
+        assert fingerprint.os_ref_http == parsed_ua_http["os"]["family"]
+
+    document = copy.deepcopy(load_fixtures(FIXTURES_FILE)[0])
+    document["browser"]["userAgentHttp"] = "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:52.0) Gecko/20100101 " \
+                                           "Firefox/52.0"
+    fingerprint = Fingerprint(document)
+    assert fingerprint.os_ref_http == fingerprint.os_ref_js == "Linux"
+
+
+def test_lazy_attributes_not_parsed_when_unused():
+    document = copy.deepcopy(load_fixtures(FIXTURES_FILE)[0])
+    del document["scanner"]["modernizr"]
+    fingerprint = Fingerprint(document)
+    assert fingerprint.fonts_js
+    try:
+        fingerprint.modernizr
+    except KeyError:
+        return
+    assert False
+
+
+def test_attributes_independent_of_access_order():
+    for document in load_fixtures(FIXTURES_FILE):
+        fingerprint = Fingerprint(document)
+        parsed = {name: parsed_value(fingerprint, name) for name in LAZY_ATTRIBUTES if name != "canvas_img"}
+        other_fingerprint = Fingerprint(document)
+        # in the reverse order, an attribute doesn't depend on another one being parsed first
+        for name in reversed(list(parsed)):
+            assert parsed_value(other_fingerprint, name) == parsed[name]
+
+
+def test_canvas_img_read_only():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    fingerprints = [Fingerprint(document) for document in load_fixtures(FIXTURES_FILE)]
+    canvases = [fingerprint.canvas_img.copy() for fingerprint in fingerprints]
+    for fingerprint in fingerprints:
+        assert not fingerprint.canvas_img.flags.writeable
+        try:
+            fingerprint.canvas_img[0, 0, 3] = 128
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    # scanning the same fingerprints from several threads leaves their canvas unchanged
+    expected = [scanner.scan_fingerprint(fingerprint, run_all=True).failed for fingerprint in fingerprints]
+    with ThreadPoolExecutor(4) as executor:
+        for _ in range(3):
+            failed = list(executor.map(lambda fingerprint: scanner.scan_fingerprint(fingerprint).failed,
+                                       fingerprints))
+            assert failed == expected
+    for fingerprint, canvas_img in zip(fingerprints, canvases):
+        assert np.array_equal(fingerprint.canvas_img, canvas_img)
@@ -0,0 +1,148 @@
+import mongomock
+from bson.objectid import ObjectId
+from differential import load_fixtures
+from fingerprint import Fingerprint
+from fingerprint_data_manager import FingerprintDataManager, INDEXES
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def create_manager(**parameters):
+    client = mongomock.MongoClient()
+    documents = load_fixtures(FIXTURES_FILE)
+    client.usenix18.fingerprint.insert_many(documents)
+    return FingerprintDataManager(client=client, **parameters), documents
+
+
+def test_indexes_created():
+    fp_manager, _ = create_manager()
+    # only the _id index until they are asked for
+    assert len(fp_manager.collection.index_information()) == 1
+    fp_manager.create_indexes()
+    index_keys = [index["key"] for index in fp_manager.collection.index_information().values()]
+    for keys in INDEXES:
+        assert keys in index_keys
+    # creating them again does nothing
+    fp_manager.create_indexes()
+    assert len(fp_manager.collection.index_information()) == len(INDEXES) + 1
+
+
+def test_get_fingerprints_countermeasure():
+    fp_manager, documents = create_manager()
+    fingerprints = fp_manager.get_fingerprints_countermeasure("cd")
+    assert sorted(fingerprint._id for fingerprint in fingerprints) == \
+        sorted(document["_id"] for document in documents if document["countermeasure"] == "cd")
+
+
+def test_get_fingerprints_in_order_with_batches():
+    fp_manager, documents = create_manager()
+    ids = [document["_id"] for document in reversed(documents)]
+    # str ids, an unknown id, and batches smaller than the number of ids
+    asked = [str(fingerprint_id) for fingerprint_id in ids] + [str(ObjectId())]
+    fingerprints = fp_manager.get_fingerprints(asked, batch_size=5)
+    assert [fingerprint._id for fingerprint in fingerprints] == ids
+
+
+def test_get_fingerprint_cache():
+    fp_manager, documents = create_manager(cache_size=2)
+    first, second, third = [str(document["_id"]) for document in documents[:3]]
+    fingerprint = fp_manager.get_fingerprint(first)
+    assert fingerprint._id == documents[0]["_id"]
+    assert fp_manager.get_fingerprint(first) is fingerprint
+
+    second_fingerprint = fp_manager.get_fingerprint(second)
+    # first is the most recently used, second is evicted
+    fp_manager.get_fingerprint(first)
+    fp_manager.get_fingerprint(third)
+    assert fp_manager.get_fingerprint(first) is fingerprint
+    assert fp_manager.get_fingerprint(second) is not second_fingerprint
+
+
+def test_get_fingerprint_cache_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    fp_manager, documents = create_manager(cache_size=3)
+    ids = [str(document["_id"]) for document in documents] * 20
+    with ThreadPoolExecutor(8) as executor:
+        fingerprints = list(executor.map(fp_manager.get_fingerprint, ids))
+    assert [str(fingerprint._id) for fingerprint in fingerprints] == ids
+
+
+def test_get_fingerprint_unknown():
+    fp_manager, _ = create_manager()
+    try:
+        fp_manager.get_fingerprint(str(ObjectId()))
+    except IndexError:
+        return
+    assert False
+
+
+def test_prefiltered_fingerprints_same_verdicts():
+    from differential import run_reference, _json_outcome, _outcome
+    from inconsistency_scanner import Scanner
+    from main import SCANNER_PARAMETERS
+    fp_manager, documents = create_manager()
+    fingerprints = fp_manager.get_prefiltered_fingerprints()
+    assert sorted(fingerprint._id for fingerprint in fingerprints) == sorted(document["_id"] for document in documents)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    for fingerprint in fingerprints:
+        document = [document for document in documents if document["_id"] == fingerprint._id][0]
+        assert fingerprint.prefilter is not None
+        assert _json_outcome(*run_reference(scanner, fingerprint)) == _outcome(run_reference, scanner, document)
+
+
+def test_prefiltered_fingerprints_lazy_attributes():
+    fp_manager, documents = create_manager()
+    documents_by_id = {document["_id"]: document for document in documents}
+    for fingerprint in fp_manager.get_prefiltered_fingerprints():
+        expected = Fingerprint(documents_by_id[fingerprint._id])
+        for name in ["languages", "screen_resolution", "available_screen_resolution", "mime_types",
+                     "overwritten_objects", "canvas_hash"]:
+            try:
+                expected_value = getattr(expected, name)
+            except AttributeError:
+                # documents without overwrittenObjects
+                continue
+            assert getattr(fingerprint, name) == expected_value
+
+
+def test_prefiltered_fingerprints_without_canvas():
+    fp_manager, documents = create_manager()
+    fingerprints = fp_manager.get_prefiltered_fingerprints(analyses=["FONTS_OS"], guess_real_info=False)
+    for fingerprint in fingerprints:
+        assert "canvas" not in fingerprint._raw_values["browser"]
+        assert fingerprint.fonts_js
+        # not decoded as a blocked canvas
+        for name in ["canvas_img", "canvas_hash", "modernizr"]:
+            try:
+                getattr(fingerprint, name)
+            except KeyError:
+                continue
+            assert False
+
+
+def test_prefiltered_fingerprints_found_inconsistent_by_mongodb():
+    from inconsistency_scanner import Scanner
+    from main import SCANNER_PARAMETERS
+    client = mongomock.MongoClient()
+    documents = load_fixtures(FIXTURES_FILE)
+    for document in documents:
+        # SCREEN_OVERWRITTEN, computed by MongoDB, fails before the pixels analysis
+        document["scanner"]["screenDesc"] = "error"
+    client.usenix18.fingerprint.insert_many(documents)
+    fp_manager = FingerprintDataManager(client=client)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    documents_by_id = {document["_id"]: document for document in documents}
+    fingerprints = fp_manager.get_prefiltered_fingerprints(guess_real_info=False, run_all=False)
+    assert len(fingerprints) == len(documents)
+    nb_without_canvas = 0
+    for fingerprint in fingerprints:
+        # the scan stops before the pixels analysis, the canvas isn't fetched
+        # unless the ground truth may change the browser of the fingerprint
+        if documents_by_id[fingerprint._id]["realBrowser"] != "chr":
+            assert "canvas" not in fingerprint._raw_values["browser"]
+            nb_without_canvas += 1
+        expected = scanner.check_fingerprint(Fingerprint(documents_by_id[fingerprint._id]), run_all=False)
+        actual = scanner.check_fingerprint(fingerprint, run_all=False)
+        assert [(result.name, result.is_consistent, result.data) for result in actual] == \
+            [(result.name, result.is_consistent, result.data) for result in expected]
+    assert nb_without_canvas > 0
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+from main import parse_arguments
+
+# modules imported by the commands that need them
+HEAVY_MODULES = ["numpy", "scipy", "PIL", "pymongo", "ua_parser", "http.server", "inconsistency_scanner"]
+
+
+def imported_modules(statement):
+    """
+        Heavy modules in sys.modules after running statement in a new process
+    """
+    code = "import sys; {}; print(' '.join(module for module in {!r} if module in sys.modules))".format(
+        statement, HEAVY_MODULES)
+    return subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout.split()
+
+
+def test_import_main_is_lazy():
+    assert imported_modules("import main") == []
+    assert imported_modules("import main; main.parse_arguments(['cm', 'cd'])") == []
+
+
+def test_import_scanner_is_lazy():
+    # the scanner needs numpy, the user agents are parsed and the metrics served on demand
+    assert imported_modules("import inconsistency_scanner") == ["numpy", "inconsistency_scanner"]
+
+
+def test_scan_is_default_command():
+    assert parse_arguments([]).command == "scan"
+    assert parse_arguments(["--workers", "2"]).workers == 2
+    args = parse_arguments(["cm", "cd"])
+    assert (args.command, args.countermeasure) == ("cm", "cd")
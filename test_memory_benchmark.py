@@ -0,0 +1,65 @@
+import csv
+import tracemalloc
+from types import SimpleNamespace
+
+import mongomock
+
+import memory_benchmark
+from differential import load_fixtures
+from fingerprint_data_manager import FingerprintDataManager
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from memory_benchmark import MEMORY_BENCH_HEADER, RssSampler, rss_bytes, run_memory_benchmark
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_run_memory_benchmark(tmp_path):
+    client = mongomock.MongoClient()
+    documents = load_fixtures(FIXTURES_FILE)
+    client.usenix18.fingerprint.insert_many(documents)
+    bench_file = tmp_path / "bench_memory.csv"
+
+    rows = run_memory_benchmark(FingerprintDataManager(client=client), Scanner(**SCANNER_PARAMETERS), str(bench_file))
+    assert [row[0] for row in rows] == ["load_corpus", "decode_canvases", "scan_situation1", "scan_situation2",
+                                        "scan_situation3"]
+    assert all(row[1] == len(documents) for row in rows)
+    # the fingerprints and their decoded canvases are kept until the end
+    assert rows[0][2] > 0 and rows[1][2] > 0
+    assert rows[0][3] == rows[0][2] / len(documents)
+    assert all(row[5] > 0 and row[6] > 0 for row in rows)
+    # tracing is stopped when the benchmark started it
+    assert not tracemalloc.is_tracing()
+
+    with open(bench_file) as f_bench:
+        written_rows = list(csv.reader(f_bench))
+    assert written_rows[0] == MEMORY_BENCH_HEADER
+    assert [row[0] for row in written_rows[1:]] == [row[0] for row in rows]
+    assert [int(row[2]) for row in written_rows[1:]] == [row[2] for row in rows]
+
+
+def without_proc(monkeypatch, platform, max_rss):
+    def open_statm(*args, **kwargs):
+        raise OSError("no /proc")
+
+    monkeypatch.setattr(memory_benchmark, "open", open_statm, raising=False)
+    monkeypatch.setattr(memory_benchmark, "sys", SimpleNamespace(platform=platform))
+    monkeypatch.setattr(memory_benchmark.resource, "getrusage", lambda who: SimpleNamespace(ru_maxrss=max_rss))
+
+
+def test_rss_bytes_from_maxrss(monkeypatch):
+    assert rss_bytes() > 0
+    # kilobytes on Linux and the BSDs
+    without_proc(monkeypatch, "freebsd13", 2048)
+    assert rss_bytes() == 2048 * 1024
+    # bytes on macOS
+    without_proc(monkeypatch, "darwin", 2048)
+    assert rss_bytes() == 2048
+
+
+def test_rss_sampler_peak(monkeypatch):
+    samples = iter([1000, 5000, 2000])
+    monkeypatch.setattr(memory_benchmark, "rss_bytes", lambda: next(samples, 2000))
+    with RssSampler(interval=0.001) as rss_sampler:
+        pass
+    assert rss_sampler.peak == 5000
@@ -0,0 +1,46 @@
+import metrics
+from metrics import SCAN_RATE, SCANNED, MetricsRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def scan_rate(registry):
+    return registry.snapshot()[2][(SCAN_RATE, ())]
+
+
+def test_scan_rate_shared_by_readers(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(metrics.time, "time", clock.time)
+    registry = MetricsRegistry(rate_window=10.0)
+    # 10 fingerprints per second, the HTTP endpoint and the periodic dump read
+    # the metrics in turn and get the same rate
+    for _ in range(30):
+        clock.now += 1.0
+        registry.increment(SCANNED, value=10)
+        assert abs(scan_rate(registry) - 10.0) < 0.1
+        clock.now += 0.01
+        assert abs(scan_rate(registry) - 10.0) < 0.1
+
+    # the rate is the one of the last 10 seconds
+    for _ in range(10):
+        clock.now += 1.0
+        registry.increment(SCANNED, value=2)
+        scan_rate(registry)
+    assert abs(scan_rate(registry) - 2.0) < 0.1
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry()
+    registry.increment(SCANNED, value=3)
+    registry.observe_analysis("FONTS_OS", 0.002, False)
+    text = registry.to_prometheus()
+    assert "fpscanner_fingerprints_scanned_total 3\n" in text
+    assert 'fpscanner_analysis_failures_total{analysis="FONTS_OS"} 1\n' in text
+    assert 'fpscanner_analysis_latency_seconds_bucket{analysis="FONTS_OS",le="0.005"} 1\n' in text
+    assert "# TYPE fpscanner_fingerprints_scanned_per_second gauge\n" in text
@@ -0,0 +1,53 @@
+import pickle
+import numpy as np
+from differential import load_fixtures, synthetic_corpus
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from scan_command import scan_sequentially
+from parallel_scanner import CanvasArena, ParallelScanner, SharedCanvasFingerprint
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def scan_results(results):
+    return [(fingerprint._id, scan_outcome.ran, scan_outcome.failed, scan_outcome.details, real_info)
+            for fingerprint, scan_outcome, real_info in results]
+
+
+def test_same_results_as_sequential_scan():
+    # batches of 192 canvases don't fit in the 16 MiB of the arenas, they grow
+    documents = synthetic_corpus(load_fixtures(FIXTURES_FILE), 200, seed=3)
+    expected = scan_results(scan_sequentially(Scanner(**SCANNER_PARAMETERS),
+                                              (Fingerprint(document) for document in documents)))
+    with ParallelScanner(SCANNER_PARAMETERS, workers=2, batch_size=192) as parallel_scanner:
+        initial_size = parallel_scanner.arenas[0].shm.size
+        actual = scan_results(parallel_scanner.scan(Fingerprint(document) for document in documents))
+        assert parallel_scanner.arenas[0].shm.size > initial_size
+    assert actual == expected
+
+
+def test_arena_grows():
+    arena = CanvasArena(size=1024 * 1024)
+    try:
+        canvases = [np.full((400, 300, 4), value, dtype=np.float32) for value in range(20)]
+        arena.reserve(sum(canvas_img.nbytes for canvas_img in canvases))
+        assert arena.shm.size >= 20 * canvases[0].nbytes
+        locations = [arena.put(canvas_img) for canvas_img in canvases]
+        for canvas_img, (offset, shape, dtype) in zip(canvases, locations):
+            assert np.array_equal(np.ndarray(shape, dtype=dtype, buffer=arena.shm.buf, offset=offset), canvas_img)
+    finally:
+        arena.close()
+
+
+def test_shared_fingerprint_without_raw_document():
+    fingerprint = Fingerprint(load_fixtures(FIXTURES_FILE)[0])
+    shared_fingerprint = pickle.loads(pickle.dumps(SharedCanvasFingerprint(fingerprint, "arena", None)))
+    assert "canvas" not in shared_fingerprint._raw_values.get("browser", dict())
+    assert shared_fingerprint.fonts_js == fingerprint.fonts_js
+    assert shared_fingerprint.modernizr == fingerprint.modernizr
+    try:
+        shared_fingerprint.mime_types
+    except KeyError:
+        return
+    assert False
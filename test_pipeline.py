@@ -0,0 +1,83 @@
+import random
+import time
+from differential import load_fixtures, synthetic_corpus
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from scan_command import scan_sequentially
+from pipeline import Pipeline, ScanPipeline
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_results_in_order():
+    rng = random.Random(0)
+    delays = [rng.random() / 1000 for _ in range(200)]
+
+    def slow_square(value):
+        time.sleep(delays[value])
+        return value * value
+
+    pipeline = Pipeline(range(200), [("square", slow_square, 4), ("plus_one", lambda value: value + 1, 2)],
+                        queue_size=8)
+    assert list(pipeline.run()) == [value * value + 1 for value in range(200)]
+    rows = pipeline.rows()
+    assert [row[0] for row in rows] == ["read", "square", "plus_one", "output"]
+    assert all(row[2] == 200 for row in rows)
+
+
+def test_reorder_buffer_bounded():
+    # the first item is slow, the reader can't get further than queue_size items ahead of it
+    read = []
+
+    def source():
+        for value in range(100):
+            read.append(value)
+            yield value
+
+    def slow_first(value):
+        if value == 0:
+            time.sleep(0.2)
+            # queue_size items in the pipeline, and the one the reader waits to put
+            assert len(read) <= 8 + 1
+        return value
+
+    pipeline = Pipeline(source(), [("slow_first", slow_first, 4)], queue_size=8)
+    assert list(pipeline.run()) == list(range(100))
+
+
+def test_pipeline_rejects_workers():
+    from main import parse_arguments
+    for option in [["--workers", "2"], ["--canvas-threads", "1"]]:
+        try:
+            parse_arguments(["--pipeline"] + option)
+        except SystemExit:
+            continue
+        assert False
+    assert parse_arguments(["--pipeline", "--scan-threads", "2"]).pipeline
+
+
+def test_error_raised():
+    def fail_on_ten(value):
+        if value == 10:
+            raise ValueError("ten")
+        return value
+
+    try:
+        list(Pipeline(range(1000), [("fail", fail_on_ten, 2)], queue_size=4).run())
+    except ValueError:
+        return
+    assert False
+
+
+def test_same_results_as_sequential_scan():
+    documents = synthetic_corpus(load_fixtures(FIXTURES_FILE), 50, seed=2)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    expected = [(fingerprint._id, scan_outcome.ran, scan_outcome.failed, real_info[:2])
+                for fingerprint, scan_outcome, real_info
+                in scan_sequentially(scanner, (Fingerprint(document) for document in documents))]
+    scan_pipeline = ScanPipeline(Scanner(**SCANNER_PARAMETERS), parse_threads=2, scan_threads=2, queue_size=4)
+    actual = [(fingerprint._id, scan_outcome.ran, scan_outcome.failed, real_info[:2])
+              for fingerprint, scan_outcome, real_info in scan_pipeline.scan(iter(documents))]
+    assert actual == expected
+    assert "Bottleneck" in scan_pipeline.pipeline.report()
@@ -0,0 +1,58 @@
+import cProfile
+import threading
+import time
+import profiler as profiler_module
+from profiler import StageProfiler, collapse_stacks
+
+
+def test_nested_stages_in_threads(tmp_path):
+    profiler = StageProfiler(trace_memory=False)
+    barrier = threading.Barrier(4)
+    stacks = []
+
+    def run():
+        with profiler.stage("outer"):
+            barrier.wait()
+            with profiler.stage("inner"):
+                time.sleep(0.01)
+                barrier.wait()
+            # the stages of the other threads didn't touch this stack
+            stacks.append([frame[0].name for frame in profiler.running])
+
+    # the main thread is the fourth one
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    run()
+    for thread in threads:
+        thread.join()
+
+    assert stacks == [["outer"]] * 4
+    assert profiler.running == []
+    assert profiler.stages["outer"].calls == 4
+    assert profiler.stages["inner"].calls == 4
+    # the elapsed time of the outer stage includes the inner one
+    assert profiler.stages["outer"].elapsed_time >= profiler.stages["inner"].elapsed_time >= 4 * 0.01
+    # only the main thread is profiled
+    assert len(profiler.stages["inner"].profiles) == 1
+    assert any(stack.startswith("inner;") for stack in collapse_stacks(profiler.stages["inner"]))
+    profiler.write_report(str(tmp_path / "profile"))
+
+
+class ActiveProfile(cProfile.Profile):
+    # like a profile on Python 3.12 while another one is enabled
+    def enable(self, *args, **kwargs):
+        raise ValueError("Another profiling tool is already active")
+
+
+def test_timed_when_profile_cannot_be_enabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler_module.cProfile, "Profile", ActiveProfile)
+    profiler = StageProfiler(trace_memory=False)
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            time.sleep(0.01)
+    assert profiler.running == []
+    assert profiler.stages["outer"].calls == profiler.stages["inner"].calls == 1
+    assert profiler.stages["outer"].elapsed_time >= profiler.stages["inner"].elapsed_time >= 0.01
+    assert collapse_stacks(profiler.stages["inner"]) == dict()
+    profiler.write_report(str(tmp_path / "profile"))
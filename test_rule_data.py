@@ -0,0 +1,89 @@
+import shutil
+from differential import load_fixtures, run_scan_outcome
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from rule_data import CANIUSE_FILE, FONTS_FILE, RuleData, RuleDataReloader
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def copy_rule_files(tmp_path):
+    fonts_file = str(tmp_path / "fonts_linked.csv")
+    caniuse_file = str(tmp_path / "data_caniuse.json")
+    shutil.copy(FONTS_FILE, fonts_file)
+    shutil.copy(CANIUSE_FILE, caniuse_file)
+    return fonts_file, caniuse_file
+
+
+def test_reload_when_files_change(tmp_path):
+    fonts_file, caniuse_file = copy_rule_files(tmp_path)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    scanner.rule_data = RuleData.load(fonts_file, caniuse_file)
+    first_rule_data = scanner.rule_data
+    reloader = RuleDataReloader(scanner, fonts_file=fonts_file, caniuse_file=caniuse_file)
+    assert not reloader.reload_if_changed()
+
+    fingerprint = Fingerprint(load_fixtures(FIXTURES_FILE)[0])
+    assert scanner.scan_fingerprint(fingerprint).data_version == first_rule_data.version
+
+    with open(fonts_file, "a") as f:
+        f.write("Some New Font,Linux,1\n")
+    assert reloader.reload_if_changed()
+    assert scanner.rule_data.version != first_rule_data.version
+    assert scanner.font_to_os["Some New Font"] == "Linux"
+    # the caniuse file didn't change, its vectors are kept
+    assert scanner.feature_vectors is first_rule_data.feature_vectors
+    assert scanner.scan_fingerprint(fingerprint).data_version == scanner.data_version
+
+
+def test_broken_file_keeps_rule_data(tmp_path):
+    fonts_file, caniuse_file = copy_rule_files(tmp_path)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    scanner.rule_data = RuleData.load(fonts_file, caniuse_file)
+    version = scanner.data_version
+    reloader = RuleDataReloader(scanner, fonts_file=fonts_file, caniuse_file=caniuse_file)
+
+    with open(caniuse_file, "w") as f:
+        f.write('{"data": ')
+    assert not reloader.reload_if_changed()
+    assert scanner.data_version == version
+
+    shutil.copy(CANIUSE_FILE, caniuse_file)
+    with open(caniuse_file, "a") as f:
+        f.write(" ")
+    # same data, another version of the file
+    assert reloader.reload_if_changed()
+    documents = load_fixtures(FIXTURES_FILE)
+    reference = Scanner(**SCANNER_PARAMETERS)
+    for document in documents:
+        assert run_scan_outcome(scanner, Fingerprint(document))[1] == \
+            run_scan_outcome(reference, Fingerprint(document))[1]
+
+
+def test_guess_uses_the_rule_data_of_the_scan(tmp_path):
+    fonts_file, caniuse_file = copy_rule_files(tmp_path)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    documents = load_fixtures(FIXTURES_FILE)
+    expected = [run_scan_outcome(scanner, Fingerprint(document))[1] for document in documents]
+
+    # every font of the new file is on another OS, the guesses would change
+    with open(FONTS_FILE) as f_fonts, open(fonts_file, "w") as f_new_fonts:
+        f_new_fonts.write(next(f_fonts))
+        for line in f_fonts:
+            font, os_family, *rest = line.rstrip("\n").split(",")
+            f_new_fonts.write(",".join([font, "Other" if os_family != "Other" else "Windows"] + rest) + "\n")
+    new_rule_data = RuleData.load(fonts_file, caniuse_file)
+    other_scanner = Scanner(**SCANNER_PARAMETERS)
+    other_scanner.rule_data = new_rule_data
+    assert [run_scan_outcome(other_scanner, Fingerprint(document))[1] for document in documents] != expected
+
+    for document, real_info in zip(documents, expected):
+        fingerprint = Fingerprint(document)
+        scanner.rule_data = RuleData.load()
+        with scanner.pin_rule_data():
+            scan_outcome = scanner.scan_fingerprint(fingerprint)
+            # reloaded between the scan and the guess
+            scanner.rule_data = new_rule_data
+            assert scanner.guess_real_info(fingerprint, scan_outcome) == real_info
+        assert scan_outcome.data_version != scanner.data_version
@@ -0,0 +1,54 @@
+import csv
+
+import pytest
+
+from differential import load_fixtures, synthetic_corpus
+from fingerprint import Fingerprint
+from main import SCANNER_PARAMETERS
+from scaling_benchmark import SCALING_BENCH_HEADER, SCALING_MODES, _scan, measure_throughput, run_scaling_benchmark
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+@pytest.mark.parametrize("mode", SCALING_MODES)
+def test_scan_yields_every_fingerprint(mode):
+    fingerprints = [Fingerprint(document) for document in synthetic_corpus(load_fixtures(FIXTURES_FILE), 40, seed=7)]
+    scanned = list(_scan(mode, 2, SCANNER_PARAMETERS, iter(fingerprints)))
+    assert sorted(map(id, scanned)) == sorted(map(id, fingerprints))
+
+
+def test_scan_unknown_mode():
+    with pytest.raises(ValueError):
+        list(_scan("gpu", 2, SCANNER_PARAMETERS, []))
+
+
+def test_measure_throughput():
+    elapsed_time, latencies = measure_throughput("canvas_threads", 2, SCANNER_PARAMETERS,
+                                                 load_fixtures(FIXTURES_FILE), 30)
+    assert len(latencies) == 30
+    assert elapsed_time > 0 and (latencies >= 0).all() and latencies.max() <= elapsed_time
+
+
+def test_run_scaling_benchmark(tmp_path):
+    documents = load_fixtures(FIXTURES_FILE)
+    bench_file = str(tmp_path / "bench_scaling.csv")
+    with pytest.raises(ValueError):
+        run_scaling_benchmark(SCANNER_PARAMETERS, documents, ["gpu"], [1], [10], bench_file)
+
+    # the sequential run comes first whatever the order of the modes
+    run_scaling_benchmark(SCANNER_PARAMETERS, documents, ["canvas_threads", "sequential"], [1, 2], [10, 20],
+                          bench_file)
+    run_scaling_benchmark(SCANNER_PARAMETERS, documents, ["sequential"], [1, 2], [10], bench_file)
+    with open(bench_file) as f_bench:
+        rows = list(csv.DictReader(f_bench))
+    # the rows of the second run are appended under the same header
+    assert list(rows[0]) == SCALING_BENCH_HEADER
+    assert [(row["mode"], row["workers"], row["nb_fingerprints"]) for row in rows] == [
+        ("sequential", "1", "10"), ("canvas_threads", "1", "10"), ("canvas_threads", "2", "10"),
+        ("sequential", "1", "20"), ("canvas_threads", "1", "20"), ("canvas_threads", "2", "20"),
+        ("sequential", "1", "10")]
+    for row in rows:
+        if row["mode"] == "sequential":
+            assert float(row["speed_up"]) == 1.0
+        assert float(row["efficiency"]) == pytest.approx(float(row["speed_up"]) / int(row["workers"]), abs=1e-5)
+        assert float(row["latency_p50_ms"]) <= float(row["latency_p99_ms"]) <= float(row["latency_max_ms"])
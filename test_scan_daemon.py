@@ -0,0 +1,67 @@
+import io
+import json
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+from bson import json_util
+from differential import load_fixtures, run_scan_outcome
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from scan_daemon import ScanDaemon
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def serve(documents, workers, extra_lines=()):
+    f_in = io.StringIO("".join(json_util.dumps(document) + "\n" for document in documents) + "".join(extra_lines))
+    f_out = io.StringIO()
+    with ScanDaemon(SCANNER_PARAMETERS, workers=workers) as scan_daemon:
+        scan_daemon.serve_stream(f_in, f_out)
+    return [json.loads(line) for line in f_out.getvalue().splitlines()]
+
+
+def test_results_in_order_and_same_verdicts():
+    documents = load_fixtures(FIXTURES_FILE)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    for workers in [1, 2]:
+        results = serve(documents, workers)
+        assert [result["_id"] for result in results] == [str(document["_id"]) for document in documents]
+        for document, result in zip(documents, results):
+            analyses_results, (real_os, real_browser, _) = run_scan_outcome(scanner, Fingerprint(document))
+            assert result["failed"] == [r.name for r in analyses_results if not r.is_consistent]
+            assert result["consistent"] == (result["failed"] == [])
+            assert (result["real_os"], result["real_browser"]) == (real_os, real_browser)
+
+
+def test_invalid_lines():
+    documents = load_fixtures(FIXTURES_FILE)[:2]
+    results = serve(documents, 2, extra_lines=["not json\n", "\n", '{"_id": "x"}\n'])
+    assert len(results) == 4
+    assert "error" not in results[1]
+    assert results[2]["_id"] is None and "error" in results[2]
+    assert results[3]["_id"] == "x" and results[3]["error"].startswith("KeyError")
+
+
+def test_dead_worker_stops_the_stream():
+    documents = load_fixtures(FIXTURES_FILE)
+    f_in = io.StringIO("".join(json_util.dumps(document) + "\n" for document in documents * 10))
+    with ScanDaemon(SCANNER_PARAMETERS, workers=2, max_pending=4) as scan_daemon:
+        os.kill(scan_daemon.pool.submit(os.getpid).result(), signal.SIGKILL)
+        try:
+            scan_daemon.serve_stream(f_in, io.StringIO())
+        except BrokenProcessPool:
+            return
+    assert False
+
+
+def test_socket_path_not_a_socket(tmp_path):
+    path = tmp_path / "results.ndjson"
+    path.write_text("kept")
+    scan_daemon = ScanDaemon(SCANNER_PARAMETERS)
+    try:
+        scan_daemon.serve_unix_socket(str(path))
+    except FileExistsError:
+        assert path.read_text() == "kept"
+        return
+    assert False
@@ -0,0 +1,72 @@
+from differential import load_fixtures, synthetic_corpus
+from fingerprint import Fingerprint
+from inconsistency_scanner import Analysis, AnalysisResult, ScanOutcome, Scanner
+from main import SCANNER_PARAMETERS
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_bitmasks():
+    scan_outcome = ScanOutcome((1 << Analysis.SAME_UAS) | (1 << Analysis.FONTS_OS), 1 << Analysis.FONTS_OS,
+                               {Analysis.FONTS_OS: {"nb_wrong_fonts": 3}})
+    assert scan_outcome.has_run(Analysis.SAME_UAS) and not scan_outcome.has_failed(Analysis.SAME_UAS)
+    assert scan_outcome.has_failed(Analysis.FONTS_OS)
+    assert not scan_outcome.has_run(Analysis.CANVAS_PIXELS)
+    assert scan_outcome.analyses_run() == [Analysis.SAME_UAS, Analysis.FONTS_OS]
+    assert scan_outcome.analyses_failed() == [Analysis.FONTS_OS]
+    assert not scan_outcome.is_consistent
+
+    analyses_results = scan_outcome.to_analysis_results()
+    assert [(result.name, result.is_consistent, result.data) for result in analyses_results] == \
+           [("SAME_UAS", True, {}), ("FONTS_OS", False, {"nb_wrong_fonts": 3})]
+    round_trip = ScanOutcome.from_analysis_results(analyses_results)
+    assert (round_trip.ran, round_trip.failed, round_trip.details) == \
+           (scan_outcome.ran, scan_outcome.failed, scan_outcome.details)
+
+
+def test_merge():
+    first = ScanOutcome(1 << Analysis.SAME_UAS, 0, skipped=1 << Analysis.CANVAS_PIXELS,
+                        raw_metrics={"nb_wrong_fonts": 0}, data_version=2)
+    pixels = ScanOutcome(1 << Analysis.CANVAS_PIXELS, 1 << Analysis.CANVAS_PIXELS,
+                         {Analysis.CANVAS_PIXELS: {"zeros_pixels": 0}}, {"nb_transparent_pixels": 0})
+    merged = first.merge(pixels)
+    assert merged.ran == (1 << Analysis.SAME_UAS) | (1 << Analysis.CANVAS_PIXELS)
+    assert merged.failed == 1 << Analysis.CANVAS_PIXELS
+    # run apart, the pixels analysis is no longer skipped
+    assert merged.skipped == 0
+    assert merged.details == {Analysis.CANVAS_PIXELS: {"zeros_pixels": 0}}
+    assert merged.raw_metrics == {"nb_wrong_fonts": 0, "nb_transparent_pixels": 0}
+    assert merged.data_version == 2
+    # the merged outcomes are left unchanged
+    assert first.details is None and pixels.raw_metrics == {"nb_transparent_pixels": 0}
+
+
+def test_same_results_as_check_fingerprint():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    for document in synthetic_corpus(load_fixtures(FIXTURES_FILE), 50, seed=4):
+        for run_all in (True, False):
+            analyses_results = scanner.check_fingerprint(Fingerprint(document), run_all=run_all)
+            scan_outcome = scanner.scan_fingerprint(Fingerprint(document), run_all=run_all)
+            assert [(result.name, result.is_consistent) for result in analyses_results] == \
+                   [(result.name, result.is_consistent) for result in scan_outcome.to_analysis_results()]
+            assert {Analysis[result.name]: result.data for result in analyses_results
+                    if not result.is_consistent} == (scan_outcome.details or dict())
+
+
+def test_raw_metrics_of_consistent_analyses():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    for document in synthetic_corpus(load_fixtures(FIXTURES_FILE), 50, seed=5):
+        expected = dict()
+        for result in scanner.check_fingerprint(Fingerprint(document)):
+            expected.update(result.raw_metrics or dict())
+        raw_metrics = scanner.scan_fingerprint(Fingerprint(document), record_raw_metrics=True).raw_metrics
+        # the raw metrics also hold the counts of all the pixels tests
+        assert {name: raw_metrics[name] for name in expected} == expected
+        assert raw_metrics.keys() >= {"nb_wrong_fonts", "nb_wrong_features"}
+        # the consistent analyses only build their data to record the raw metrics
+        assert scanner.scan_fingerprint(Fingerprint(document)).raw_metrics is None
+
+
+def test_analysis_result_str():
+    assert str(AnalysisResult("FONTS_OS", False, {"nb_wrong_fonts": 3})) == \
+           "Analysis: FONTS_OS\nResult: False\nnb_wrong_fonts: 3"
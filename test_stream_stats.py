@@ -0,0 +1,67 @@
+import random
+from differential import load_fixtures
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from stream_stats import CountMinSketch, HyperLogLog, SpaceSaving, StreamStatistics
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_hyperloglog_merge():
+    first, second, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for value in range(30000):
+        (first if value % 2 else second).add(value)
+        union.add(value)
+    # duplicates aren't counted
+    for value in range(1000):
+        first.add(value)
+    first.merge(second)
+    assert (first.registers == union.registers).all()
+    assert abs(first.count() - 30000) < 30000 * 0.05
+    assert HyperLogLog().count() == 0
+
+
+def test_count_min_sketch_never_underestimates():
+    rng = random.Random(0)
+    sketch, other = CountMinSketch(width=256), CountMinSketch(width=256)
+    counts = dict()
+    for _ in range(5000):
+        key = "key {:d}".format(int(rng.paretovariate(1)))
+        counts[key] = counts.get(key, 0) + 2
+        sketch.add(key)
+        other.add(key)
+    sketch.merge(other)
+    assert all(counts[key] <= sketch.estimate(key) <= counts[key] + 5000 * 2 * 2.72 / 256 for key in counts)
+
+
+def test_space_saving_heavy_hitters():
+    rng = random.Random(1)
+    first, second = SpaceSaving(k=10), SpaceSaving(k=10)
+    for index in range(4000):
+        key = rng.choice(["a", "b", "c"]) if index % 2 else "rare {:d}".format(index)
+        (first if index % 4 < 2 else second).add(key)
+    first.merge(second)
+    assert sorted(key for key, _, _ in first.top(3)) == ["a", "b", "c"]
+    for key, count, error in first.top(3):
+        assert count - error <= 2000
+
+
+def test_statistics_save_load_merge(tmp_path):
+    documents = load_fixtures(FIXTURES_FILE)
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    first, second = StreamStatistics(), StreamStatistics()
+    for index, document in enumerate(documents):
+        fingerprint = Fingerprint(document)
+        (first if index % 2 else second).add(fingerprint, scanner.scan_fingerprint(fingerprint))
+
+    stats_file = str(tmp_path / "stats.json")
+    first.save(stats_file)
+    merged = StreamStatistics.load(stats_file)
+    merged.merge(second)
+    assert merged.nb_fingerprints == len(documents)
+    assert merged.distinct["claimed_browser"].count() == 2
+    assert sorted(key for key, _, _ in merged.top["claimed_browser"].top()) == ["Chrome", "Firefox"]
+    rates = merged.failure_rates()
+    assert rates["Chrome"]["CANVAS_PIXELS"][1] == len([d for d in documents if d["browser"]["name"] == "Chrome"])
+    assert "Statistics of {:d} fingerprints".format(len(documents)) in merged.report()
@@ -0,0 +1,59 @@
+import numpy as np
+from differential import load_fixtures, synthetic_corpus
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner, are_canvas_pixels_consistent
+from threshold_sweep import parse_grid, read_raw_metrics, record_raw_metrics, sweep
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def confusion(scanner, fingerprints):
+    # tp, fp, tn, fn of a scan, an inconsistent fingerprint is a positive
+    counts = [0, 0, 0, 0]
+    for fingerprint in fingerprints:
+        predicted = scanner.scan_fingerprint(fingerprint, run_all=True).is_consistent
+        truth = scanner.should_be_consistent(fingerprint)
+        counts[[[0, 3], [1, 2]][truth][predicted]] += 1
+    return counts
+
+
+def test_same_results_as_scans(tmp_path):
+    fingerprints = [Fingerprint(document)
+                    for document in synthetic_corpus(load_fixtures(FIXTURES_FILE), 80, seed=6)]
+    raw_metrics_file = str(tmp_path / "raw_metrics.csv")
+    record_raw_metrics(Scanner(2, 1, 17200), fingerprints, raw_metrics_file)
+    # thresholds around the counts of the corpus, so that the verdicts change
+    fonts_values, features_values, transparent_values = [1, 2], [0, 1], [17200, 19269, 19300, 24001]
+    rows = sweep(read_raw_metrics(raw_metrics_file), fonts_values, features_values, transparent_values)
+
+    rows_all = [row for row in rows if row[3] == "all"]
+    assert len(rows_all) == 16
+    for row in rows_all:
+        number_wrong_fonts, number_wrong_features, number_transparent_pixels = row[:3]
+        scanner = Scanner(number_wrong_fonts, number_wrong_features, number_transparent_pixels)
+        assert row[6:] == confusion(scanner, fingerprints)
+        assert row[4] == len(fingerprints)
+
+    countermeasures = {fingerprint.countermeasure for fingerprint in fingerprints}
+    for countermeasure in countermeasures:
+        subset = [fingerprint for fingerprint in fingerprints if fingerprint.countermeasure == countermeasure]
+        row = [row for row in rows if row[3] == countermeasure and row[:3] == [2, 1, 17200]][0]
+        assert row[6:] == confusion(Scanner(2, 1, 17200), subset)
+
+
+def test_pixels_decision_broadcast():
+    counts = [(False, 120, 3, 19300, 0), (False, 0, 0, 19300, 0), (False, 120, 900, 19300, 0),
+              (True, 0, 0, 0, 0), (False, 120, 3, 24000, 0), (False, 120, 3, 18000, 0), (False, 120, 3, 19300, 9)]
+    columns = [np.array(column) for column in zip(*counts)]
+    thresholds = np.array([17200, 19000, 20000])
+    decisions = are_canvas_pixels_consistent(*columns[:3], columns[3][None, :], columns[4], thresholds[:, None])
+    for i, threshold in enumerate(thresholds):
+        for j, (canvas_blocked, *pixel_counts) in enumerate(counts):
+            assert decisions[i, j] == are_canvas_pixels_consistent(canvas_blocked, *pixel_counts, threshold)
+    assert decisions[0].tolist() == [True, False, False, False, False, True, False]
+
+
+def test_parse_grid():
+    assert parse_grid("1,2,4") == [1, 2, 4]
+    assert parse_grid("14000:15000:400") == [14000, 14400, 14800]
+    assert parse_grid("1:3:1") == [1, 2, 3]
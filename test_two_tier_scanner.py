@@ -0,0 +1,41 @@
+from differential import load_fixtures
+from fingerprint import Fingerprint
+from inconsistency_scanner import Scanner
+from main import SCANNER_PARAMETERS
+from scan_command import scan_two_tier
+
+FIXTURES_FILE = "fixtures/fingerprints_sample.json"
+
+
+def test_same_outcomes_as_sequential_scan():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    documents = load_fixtures(FIXTURES_FILE)
+    expected = dict()
+    for document in documents:
+        fingerprint = Fingerprint(document)
+        scan_outcome = scanner.scan_fingerprint(fingerprint)
+        expected[document["_id"]] = (scan_outcome.ran, scan_outcome.failed, scan_outcome.details)
+
+    results = list(scan_two_tier(scanner, [Fingerprint(document) for document in documents], 2, max_pending=4))
+    assert len(results) == len(documents)
+    for fingerprint, scan_outcome, _ in results:
+        assert (scan_outcome.ran, scan_outcome.failed, scan_outcome.details) == expected[fingerprint._id]
+
+
+def test_pixels_analysis_error_raised():
+    scanner = Scanner(**SCANNER_PARAMETERS)
+    scan_fingerprint = scanner.scan_fingerprint
+
+    def failing_scan_fingerprint(fingerprint, **parameters):
+        if parameters.get("only_pixels"):
+            raise RuntimeError("pixels analysis failed")
+        return scan_fingerprint(fingerprint, **parameters)
+
+    scanner.scan_fingerprint = failing_scan_fingerprint
+    fingerprints = [Fingerprint(document) for document in load_fixtures(FIXTURES_FILE)]
+    try:
+        # more fingerprints than max_pending, the first tier waits for the second one
+        list(scan_two_tier(scanner, fingerprints, 2, max_pending=2))
+    except RuntimeError:
+        return
+    assert False
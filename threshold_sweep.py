@@ -0,0 +1,131 @@
+import csv
+import numpy as np
+from accuracy import COUNTERMEASURES
+from inconsistency_scanner import RAW_METRICS, THRESHOLD_ANALYSES, are_canvas_pixels_consistent
+
+RAW_METRICS_HEADER = ["countermeasure", "ground_truth", "other_analyses_failed"] + RAW_METRICS
+
+SWEEP_HEADER = ["number_wrong_fonts", "number_wrong_features", "number_transparent_pixels",
+                "countermeasure", "nb_fingerprints", "accuracy", "tp", "fp", "tn", "fn"]
+
+
+def record_raw_metrics(scanner, fingerprints, raw_metrics_file):
+    """
+        Scans the fingerprints once and writes, for each of them, the
+        counts compared to the thresholds of the scanner and whether an
+        analysis that doesn't depend on a threshold failed
+    """
+    with open(raw_metrics_file, 'w+') as f_raw:
+        writer = csv.writer(f_raw)
+        writer.writerow(RAW_METRICS_HEADER)
+        for counter, fingerprint in enumerate(fingerprints):
+            scan_outcome = scanner.scan_fingerprint(fingerprint, run_all=True, record_raw_metrics=True)
+            raw_metrics = scan_outcome.raw_metrics
+            row = [fingerprint.countermeasure,
+                   int(scanner.should_be_consistent(fingerprint)),
+                   int(scan_outcome.failed & ~THRESHOLD_ANALYSES != 0)]
+            # the pixel counts are missing when the canvas is blocked
+            row += [int(raw_metrics.get(name, 0)) for name in RAW_METRICS]
+            writer.writerow(row)
+            if counter % 1000 == 0:
+                print('Fingerprint', counter)
+
+
+def read_raw_metrics(raw_metrics_file):
+    """
+        Returns a dict column -> numpy array
+    """
+    with open(raw_metrics_file) as f_raw:
+        rows = list(csv.reader(f_raw))
+    header, rows = rows[0], rows[1:]
+    columns = dict()
+    for index, name in enumerate(header):
+        if name == "countermeasure":
+            columns[name] = np.array([row[index] for row in rows])
+        else:
+            columns[name] = np.array([int(row[index]) for row in rows], dtype=np.int64)
+    return columns
+
+
+def parse_grid(grid_str):
+    """
+        "1,2,4" -> [1, 2, 4], "start:stop:step" -> range from start to stop included
+    """
+    if ":" in grid_str:
+        start, stop, step = [int(x) for x in grid_str.split(":")]
+        return list(range(start, stop + 1, step))
+    return [int(x) for x in grid_str.split(",")]
+
+
+def sweep(raw_metrics, fonts_values, features_values, transparent_values):
+    """
+        Decision of the scanner for every combination of thresholds, computed
+        from the raw metrics with broadcasting instead of rescanning.
+        Returns a list of rows following SWEEP_HEADER, one per combination
+        and countermeasure, plus the countermeasure "all"
+    """
+    fonts_values = np.asarray(fonts_values)
+    features_values = np.asarray(features_values)
+    transparent_values = np.asarray(transparent_values)
+
+    # (threshold, fingerprint) arrays
+    fonts_consistent = raw_metrics["nb_wrong_fonts"][None, :] < fonts_values[:, None]
+    features_consistent = raw_metrics["nb_wrong_features"][None, :] <= features_values[:, None]
+    pixels_consistent = are_canvas_pixels_consistent(
+        raw_metrics["canvas_blocked"] != 0, raw_metrics["nb_color_equals"], raw_metrics["nb_color_close"],
+        raw_metrics["nb_transparent_pixels"][None, :], raw_metrics["nb_isolated_pixels"],
+        transparent_values[:, None])
+
+    # (fonts, features, transparent, fingerprint)
+    predicted_consistent = (raw_metrics["other_analyses_failed"] == 0)[None, None, None, :] & \
+        fonts_consistent[:, None, None, :] & \
+        features_consistent[None, :, None, :] & \
+        pixels_consistent[None, None, :, :]
+    ground_truth = raw_metrics["ground_truth"] != 0
+
+    subsets = [("all", np.ones(len(ground_truth), dtype=bool))]
+    for countermeasure in COUNTERMEASURES:
+        subset = raw_metrics["countermeasure"] == countermeasure
+        if subset.any():
+            subsets.append((countermeasure, subset))
+
+    rows = []
+    for countermeasure, subset in subsets:
+        predicted = predicted_consistent[..., subset]
+        truth = ground_truth[subset]
+        # an inconsistent fingerprint is a positive
+        true_positives = np.count_nonzero(~predicted & ~truth, axis=-1)
+        false_positives = np.count_nonzero(~predicted & truth, axis=-1)
+        true_negatives = np.count_nonzero(predicted & truth, axis=-1)
+        false_negatives = np.count_nonzero(predicted & ~truth, axis=-1)
+        nb_fingerprints = len(truth)
+        accuracy = (true_positives + true_negatives) / nb_fingerprints
+
+        for i, number_wrong_fonts in enumerate(fonts_values):
+            for j, number_wrong_features in enumerate(features_values):
+                for k, number_transparent_pixels in enumerate(transparent_values):
+                    rows.append([int(number_wrong_fonts), int(number_wrong_features), int(number_transparent_pixels),
+                                 countermeasure, nb_fingerprints, float(accuracy[i, j, k]),
+                                 int(true_positives[i, j, k]), int(false_positives[i, j, k]),
+                                 int(true_negatives[i, j, k]), int(false_negatives[i, j, k])])
+    return rows
+
+
+def write_sweep(rows, sweep_file):
+    with open(sweep_file, 'w+') as f_sweep:
+        writer = csv.writer(f_sweep)
+        writer.writerow(SWEEP_HEADER)
+        writer.writerows(rows)
+
+
+def run_sweep(raw_metrics_file, sweep_file, fonts_grid, features_grid, transparent_grid):
+    raw_metrics = read_raw_metrics(raw_metrics_file)
+    rows = sweep(raw_metrics, parse_grid(fonts_grid), parse_grid(features_grid), parse_grid(transparent_grid))
+    write_sweep(rows, sweep_file)
+
+    # rows: fonts, features, transparent, countermeasure, nb_fingerprints, accuracy...
+    best_rows = sorted([row for row in rows if row[3] == "all"], key=lambda row: row[5], reverse=True)
+    print("Best thresholds (number_wrong_fonts, number_wrong_features, number_transparent_pixels):")
+    for row in best_rows[:5]:
+        print("{}, {}, {}: accuracy {:f} on {:d} fingerprints".format(row[0], row[1], row[2], row[5], row[4]))
+    print("Accuracy per countermeasure written to {}".format(sweep_file))
@@ -0,0 +1,37 @@
+import time
+
+from profiler import profile_stage
+
+
+def run_benchmark(scanner, fingerprints, profiler=None):
+    # first we run all tests no matter if an  inconsistency is detected
+    with open('results/bench_situation1.csv', 'w+') as f_bench1, \
+            open('results/bench_situation2.csv', 'w+') as f_bench2, \
+            open('results/bench_situation3.csv', 'w+') as f_bench3:
+        header_str = 'elapsed_time'
+        f_bench1.write('{}\n'.format(header_str))
+        f_bench2.write('{}\n'.format(header_str))
+        f_bench3.write('{}\n'.format(header_str))
+
+        for counter, fingerprint in enumerate(fingerprints):
+            print('Fingerprint', counter)
+            # all tests
+            start = time.time()
+            with profile_stage(profiler, "bench_situation1"):
+                scanner.check_fingerprint(fingerprint, run_all=True)
+            end = time.time()
+            f_bench1.write('{:f}\n'.format(end-start))
+
+            # stop when inconsistency found
+            start = time.time()
+            with profile_stage(profiler, "bench_situation2"):
+                scanner.check_fingerprint(fingerprint, run_all=False)
+            end = time.time()
+            f_bench2.write('{:f}\n'.format(end - start))
+
+            # run only pixels test
+            start = time.time()
+            with profile_stage(profiler, "bench_situation3"):
+                scanner.check_fingerprint(fingerprint, run_all=False, only_pixels=True)
+            end = time.time()
+            f_bench3.write('{:f}\n'.format(end - start))
@@ -0,0 +1,96 @@
+import itertools
+import queue
+import threading
+from metrics import QUEUE_DEPTH
+
+# priorities of the pixels analyses, lowest first
+# the pixels analysis decides the verdict of a fingerprint that passed the other analyses
+PRIORITY_PROVISIONALLY_CONSISTENT = 0
+# the fingerprint is already inconsistent, the pixels analysis only adds details
+PRIORITY_ALREADY_INCONSISTENT = 1
+
+_STOP = object()
+
+
+class TwoTierScanner:
+    """
+        Scans fingerprints in two tiers. scan() runs every analysis but the
+        pixels one inline and returns this provisional ScanOutcome right away.
+        The pixels analysis is queued and run by a pool of threads, fingerprints
+        that passed the first tier first, then the final ScanOutcome is given to
+        on_final(fingerprint, scan_outcome), called from a pool thread.
+        With run_all=False, a fingerprint already inconsistent is final at once
+    """
+
+    def __init__(self, scanner, on_final, threads=2, run_all=True):
+        self.scanner = scanner
+        self.on_final = on_final
+        self.run_all = run_all
+        self.pixels_queue = queue.PriorityQueue()
+        # ties are broken by submission order, fingerprints are never compared
+        self.sequence = itertools.count()
+        # exceptions raised by the pixels analyses or on_final, raised again by join()
+        self.errors = []
+        self.threads = [threading.Thread(target=self.__run_pixels_analyses, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def scan(self, fingerprint):
+        """
+            Returns the provisional ScanOutcome of fingerprint, without the pixels analysis
+        """
+        provisional_outcome = self.scanner.scan_fingerprint(fingerprint, run_all=self.run_all, without_pixels=True)
+        if provisional_outcome.is_consistent:
+            priority = PRIORITY_PROVISIONALLY_CONSISTENT
+        elif self.run_all:
+            priority = PRIORITY_ALREADY_INCONSISTENT
+        else:
+            self.on_final(fingerprint, provisional_outcome)
+            return provisional_outcome
+
+        self.pixels_queue.put((priority, next(self.sequence), fingerprint, provisional_outcome))
+        self.__update_queue_depth()
+        return provisional_outcome
+
+    def __run_pixels_analyses(self):
+        while True:
+            item = self.pixels_queue.get()
+            try:
+                if item[2] is _STOP:
+                    return
+                _, _, fingerprint, provisional_outcome = item
+                pixels_outcome = self.scanner.scan_fingerprint(fingerprint, run_all=self.run_all, only_pixels=True)
+                self.on_final(fingerprint, provisional_outcome.merge(pixels_outcome))
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.pixels_queue.task_done()
+                self.__update_queue_depth()
+
+    def __update_queue_depth(self):
+        if self.scanner.metrics is not None:
+            self.scanner.metrics.set_gauge(QUEUE_DEPTH, self.pixels_queue.qsize(), (("queue", "pixels"),))
+
+    def join(self):
+        """
+            Waits until the pixels analysis of every fingerprint scanned is over
+        """
+        self.pixels_queue.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self):
+        self.pixels_queue.join()
+        for _ in self.threads:
+            # after every pixels analysis
+            self.pixels_queue.put((float("inf"), next(self.sequence), _STOP, None))
+        for thread in self.threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()